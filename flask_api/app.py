@@ -4,7 +4,7 @@ Smart India Hackathon 2025
 Main API Application with all endpoints
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from flask_limiter import Limiter
@@ -12,6 +12,9 @@ from flask_limiter.util import get_remote_address
 from flask_socketio import SocketIO, emit
 from datetime import datetime, timedelta
 import os
+import sys
+import time
+import resource
 import json
 import numpy as np
 from dotenv import load_dotenv
@@ -19,10 +22,18 @@ import logging
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import uuid
+import tempfile
+import threading
+
+STARTED_AT = time.perf_counter()
 
 # Import custom modules
 from ml_service import MLService
 from services import GPSService, DatabaseService, KeralaService, AnalyticsService
+from export_jobs import ExportJobManager, ExportJobLimit
+from geofence import GeofenceService, validate_fences, validate_cell_size
+from companions import CompanionService
+from response_cache import ResponseCache
 
 # Load environment variables
 load_dotenv()
@@ -34,6 +45,20 @@ app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['GPS_BATCH_MAX_POINTS'] = int(os.getenv('GPS_BATCH_MAX_POINTS', 1000))
+app.config['ML_BATCH_MAX_SEGMENTS'] = int(os.getenv('ML_BATCH_MAX_SEGMENTS', 50000))
+app.config['ML_BATCH_MAX_TRIPS'] = int(os.getenv('ML_BATCH_MAX_TRIPS', 50000))
+app.config['ML_BATCH_MAX_POINTS'] = int(os.getenv('ML_BATCH_MAX_POINTS', 100000))
+app.config['KERALA_CACHE_TTL'] = int(os.getenv('KERALA_CACHE_TTL', 3600))
+app.config['TRIPS_PAGE_MAX'] = int(os.getenv('TRIPS_PAGE_MAX', 100))
+app.config['TOURISM_MAX_RESULTS'] = int(os.getenv('TOURISM_MAX_RESULTS', 100))
+app.config['MONGO_ENSURE_INDEXES'] = os.getenv('MONGO_ENSURE_INDEXES', 'true').lower() == 'true'
+app.config['TRANSLATE_BATCH_MAX_TEXTS'] = int(os.getenv('TRANSLATE_BATCH_MAX_TEXTS', 200))
+app.config['TRANSLATE_MAX_TEXT_LENGTH'] = int(os.getenv('TRANSLATE_MAX_TEXT_LENGTH', 1000))
+app.config['EXPORT_WORKERS'] = int(os.getenv('EXPORT_WORKERS', 2))
+app.config['EXPORT_JOB_TTL'] = int(os.getenv('EXPORT_JOB_TTL', 3600))
+app.config['EXPORT_JOBS_PER_USER'] = int(os.getenv('EXPORT_JOBS_PER_USER', 3))
+app.config['EXPORT_JOB_SWEEP_INTERVAL'] = int(os.getenv('EXPORT_JOB_SWEEP_INTERVAL', 60))
 
 # Initialize extensions
 CORS(app, resources={r"/api/*": {"origins": "*"}})
@@ -51,6 +76,53 @@ gps_service = GPSService()
 db_service = DatabaseService()
 kerala_service = KeralaService()
 analytics_service = AnalyticsService()
+geofence_service = GeofenceService(db_service)
+companion_service = CompanionService(db_service)
+kerala_cache = ResponseCache(ttl=app.config['KERALA_CACHE_TTL'])
+
+def parquet_params(values) -> dict:
+    """Validated start/end ISO dates and districts of a Parquet export request"""
+    params = {}
+    for name in ('start', 'end'):
+        if values.get(name):
+            params[name] = datetime.fromisoformat(str(values[name])).isoformat()
+    districts = values.get('districts')
+    if districts:
+        districts = districts.split(',') if isinstance(districts, str) else districts
+        if not isinstance(districts, list) or not all(isinstance(d, str) for d in districts):
+            raise ValueError('districts must be a list of names')
+        params['districts'] = districts
+    return params
+
+def build_parquet_archive(path, user_id, params, progress=None):
+    """Zip of a user's Parquet datasets for parquet_params"""
+    return analytics_service.export_parquet_archive(
+        user_id, path,
+        datetime.fromisoformat(params['start']) if params.get('start') else None,
+        datetime.fromisoformat(params['end']) if params.get('end') else None,
+        params.get('districts'), progress
+    )
+
+# File exports too slow for a request are built by a background worker pool;
+# job state is kept in MongoDB so every worker can answer polls
+export_jobs = ExportJobManager(
+    {
+        'excel': (lambda path, user_id, params, progress:
+                  analytics_service.export_to_excel(user_id, path, progress), 'xlsx'),
+        'parquet': (build_parquet_archive, 'zip')
+    },
+    db_service,
+    directory=os.getenv('EXPORT_JOB_DIR'),
+    workers=app.config['EXPORT_WORKERS'],
+    ttl=app.config['EXPORT_JOB_TTL'],
+    max_active=app.config['EXPORT_JOBS_PER_USER'],
+    sweep_interval=app.config['EXPORT_JOB_SWEEP_INTERVAL']
+)
+
+# Index creation is idempotent but waits on the server, so it runs off the
+# startup path
+if app.config['MONGO_ENSURE_INDEXES']:
+    threading.Thread(target=db_service.ensure_indexes, daemon=True).start()
 
 # Configure logging
 logging.basicConfig(
@@ -62,6 +134,20 @@ logger = logging.getLogger(__name__)
 # Create upload folder
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+STARTUP_SECONDS = round(time.perf_counter() - STARTED_AT, 3)
+logger.info(f"API initialized in {STARTUP_SECONDS}s")
+
+def worker_rss_mb() -> float:
+    """Resident set size of this worker process in MB"""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024, 1)
+    except (OSError, ValueError):
+        # Peak RSS where /proc is unavailable (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
 # =====================
 # Health Check Endpoints
 # =====================
@@ -77,7 +163,17 @@ def health_check():
             'gps': gps_service.is_ready(),
             'database': db_service.is_connected(),
             'kerala': kerala_service.is_ready()
-        }
+        },
+        'worker': {
+            'pid': os.getpid(),
+            'startup_seconds': STARTUP_SECONDS,
+            'rss_mb': worker_rss_mb()
+        },
+        'models': ml_service.models.stats(),
+        'response_cache': kerala_cache.stats(),
+        'weather_cache': kerala_service.weather.stats(),
+        'translation': kerala_service.translator.stats(),
+        'export_jobs': export_jobs.stats()
     }), 200
 
 @app.route('/api/version', methods=['GET'])
@@ -198,11 +294,11 @@ def detect_trip():
             'accuracy': gps_data.get('accuracy', 10),
             'accelerometer': accelerometer,
             'timestamp': datetime.now().isoformat()
-        })
+        }, user_id)
         
-        # Log trip event if detected
-        if result['trip_detected']:
-            db_service.log_trip_event(user_id, result)
+        # Log trip start/end transitions
+        if result['event_type'] in ('trip_start', 'trip_end'):
+            db_service.log_trip_event(user_id, dict(result))
         
         return jsonify(result), 200
         
@@ -225,12 +321,18 @@ def classify_mode():
             'gps_points': data.get('gps_points', []),
             'stop_frequency': data.get('stop_frequency', 0)
         }
+        max_points = app.config['ML_BATCH_MAX_POINTS']
+        if isinstance(features['gps_points'], list) and len(features['gps_points']) > max_points:
+            return jsonify({'error': f'At most {max_points} gps_points per request'}), 400
         
         # Run classification
-        result = ml_service.classify_transport_mode(features)
+        try:
+            result = ml_service.classify_transport_mode(features)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Store classification
-        db_service.store_mode_classification(user_id, result)
+        db_service.store_mode_classification(user_id, dict(result))
         
         return jsonify(result), 200
         
@@ -238,6 +340,99 @@ def classify_mode():
         logger.error(f"Mode classification error: {str(e)}")
         return jsonify({'error': 'Mode classification failed'}), 500
 
+@app.route('/api/ml/classify-mode/batch', methods=['POST'])
+@jwt_required()
+def classify_mode_batch():
+    """Classify transportation mode for many segments"""
+    try:
+        data = request.get_json()
+        user_id = get_jwt_identity()
+        max_segments = app.config['ML_BATCH_MAX_SEGMENTS']
+        
+        # Raw GPS points are segmented and featurized server-side
+        if data.get('gps_points'):
+            max_points = app.config['ML_BATCH_MAX_POINTS']
+            if isinstance(data['gps_points'], list) and len(data['gps_points']) > max_points:
+                return jsonify({'error': f'At most {max_points} gps_points per batch'}), 400
+            try:
+                result = ml_service.classify_segments(
+                    data['gps_points'], float(data.get('segment_seconds', 300))
+                )
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': str(e)}), 400
+            speed = result['segment_features']['speed_mean']
+            segment_ids = data.get('segment_ids') or list(range(len(speed)))
+            if len(segment_ids) != len(speed):
+                return jsonify({'error': f'segment_ids must have {len(speed)} entries'}), 400
+            return _mode_batch_response(user_id, data, segment_ids, result)
+        
+        # Columnar input: one array per feature
+        speed = data.get('speed')
+        if not isinstance(speed, list) or not speed:
+            return jsonify({'error': 'speed must be a non-empty list'}), 400
+        if len(speed) > max_segments:
+            return jsonify({'error': f'At most {max_segments} segments per batch'}), 400
+        
+        columns = {}
+        for name in ('speed', 'acceleration', 'stop_frequency'):
+            values = data.get(name, [0] * len(speed))
+            if not isinstance(values, list) or len(values) != len(speed):
+                return jsonify({'error': f'{name} must be a list of {len(speed)} numbers'}), 400
+            try:
+                columns[name] = np.asarray(values, dtype=float)
+            except (TypeError, ValueError):
+                return jsonify({'error': f'{name} must be a list of {len(speed)} numbers'}), 400
+            if not np.isfinite(columns[name]).all():
+                return jsonify({'error': f'{name} must be a list of {len(speed)} numbers'}), 400
+        
+        segment_ids = data.get('segment_ids') or list(range(len(speed)))
+        if len(segment_ids) != len(speed):
+            return jsonify({'error': f'segment_ids must have {len(speed)} entries'}), 400
+        
+        # Run classification
+        result = ml_service.classify_transport_mode_batch(
+            columns['speed'], columns['acceleration'], columns['stop_frequency']
+        )
+        
+        return _mode_batch_response(user_id, data, segment_ids, result)
+        
+    except Exception as e:
+        logger.error(f"Batch mode classification error: {str(e)}")
+        return jsonify({'error': 'Batch mode classification failed'}), 500
+
+def _mode_batch_response(user_id: str, data: dict, segment_ids: list, result: dict):
+    """Store a batch classification and build its response"""
+    classes = result['classes']
+    modes = [classes[i] for i in result['modes']]
+    confidence = result['confidence'].tolist()
+    probabilities = result['probabilities'].tolist()
+    
+    # Store classifications in one bulk write
+    if data.get('store', True):
+        classified_at = datetime.now().isoformat()
+        db_service.store_mode_classifications(user_id, [
+            {
+                'segment_id': segment_id,
+                'mode': mode,
+                'confidence': conf,
+                'probabilities': {c: p for c, p in zip(classes, probs) if p > 0},
+                'timestamp': classified_at
+            }
+            for segment_id, mode, conf, probs in zip(segment_ids, modes, confidence, probabilities)
+        ])
+    
+    response = {
+        'classes': classes,
+        'segment_ids': segment_ids,
+        'modes': modes,
+        'confidence': confidence,
+        'probabilities': probabilities
+    }
+    if 'segment_features' in result:
+        response['segment_features'] = result['segment_features']
+    
+    return jsonify(response), 200
+
 @app.route('/api/ml/predict-purpose', methods=['POST'])
 @jwt_required()
 def predict_purpose():
@@ -252,12 +447,20 @@ def predict_purpose():
             'destination': data.get('destination'),
             'time': data.get('time'),
             'day_of_week': data.get('day_of_week'),
+            'date': data.get('date'),
             'duration': data.get('duration'),
-            'mode': data.get('mode')
+            'mode': data.get('mode'),
+            'gps_points': data.get('gps_points')
         }
+        max_points = app.config['ML_BATCH_MAX_POINTS']
+        if isinstance(context['gps_points'], list) and len(context['gps_points']) > max_points:
+            return jsonify({'error': f'At most {max_points} gps_points per request'}), 400
         
         # Run prediction
-        result = ml_service.predict_trip_purpose(context)
+        try:
+            result = ml_service.predict_trip_purpose(context)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify(result), 200
         
@@ -265,6 +468,74 @@ def predict_purpose():
         logger.error(f"Purpose prediction error: {str(e)}")
         return jsonify({'error': 'Purpose prediction failed'}), 500
 
+@app.route('/api/ml/predict-purpose/batch', methods=['POST'])
+@jwt_required()
+def predict_purpose_batch():
+    """Predict trip purpose for many completed trips"""
+    try:
+        data = request.get_json()
+        max_trips = app.config['ML_BATCH_MAX_TRIPS']
+        
+        # Columnar input: one array per context field
+        times = data.get('time')
+        if not isinstance(times, list) or not times:
+            return jsonify({'error': 'time must be a non-empty list'}), 400
+        if len(times) > max_trips:
+            return jsonify({'error': f'At most {max_trips} trips per batch'}), 400
+        
+        # Trip dates add festival effects and can stand in for day_of_week
+        dates = data.get('date')
+        if dates is not None and (not isinstance(dates, list) or len(dates) != len(times)):
+            return jsonify({'error': f'date must be a list of {len(times)} ISO dates'}), 400
+        
+        columns = {'day_of_week': None}
+        for name in ('time', 'day_of_week'):
+            values = data.get(name)
+            if values is None and name == 'day_of_week' and dates is not None:
+                continue
+            if not isinstance(values, list) or len(values) != len(times):
+                return jsonify({'error': f'{name} must be a list of {len(times)} numbers'}), 400
+            try:
+                columns[name] = np.asarray(values, dtype=float)
+            except (TypeError, ValueError):
+                return jsonify({'error': f'{name} must be a list of {len(times)} numbers'}), 400
+            if not np.isfinite(columns[name]).all():
+                return jsonify({'error': f'{name} must be a list of {len(times)} numbers'}), 400
+        
+        modes = data.get('mode')
+        if modes is not None and (not isinstance(modes, list) or len(modes) != len(times)):
+            return jsonify({'error': f'mode must be a list of {len(times)} entries'}), 400
+        
+        trip_ids = data.get('trip_ids') or list(range(len(times)))
+        if len(trip_ids) != len(times):
+            return jsonify({'error': f'trip_ids must have {len(times)} entries'}), 400
+        
+        # Run prediction
+        try:
+            result = ml_service.predict_trip_purpose_batch(
+                columns['time'], columns['day_of_week'], modes, dates
+            )
+        except ValueError:
+            return jsonify({'error': f'date must be a list of {len(times)} ISO dates'}), 400
+        purposes = result['purposes']
+        
+        response = {
+            'purposes': purposes,
+            'trip_ids': trip_ids,
+            'purpose': [purposes[i] for i in result['best']],
+            'confidence': result['confidence'].tolist(),
+            'probabilities': result['probabilities'].tolist()
+        }
+        if 'festival' in result:
+            names = ml_service.festivals.names
+            response['festival'] = [names[i] if i >= 0 else None for i in result['festival'].tolist()]
+        
+        return jsonify(response), 200
+        
+    except Exception as e:
+        logger.error(f"Batch purpose prediction error: {str(e)}")
+        return jsonify({'error': 'Batch purpose prediction failed'}), 500
+
 @app.route('/api/ml/detect-companions', methods=['POST'])
 @jwt_required()
 def detect_companions():
@@ -276,6 +547,10 @@ def detect_companions():
         # Extract data
         bluetooth_devices = data.get('bluetooth_devices', [])
         trip_id = data.get('trip_id')
+        if trip_id:
+            trip = db_service.get_trip(trip_id)
+            if not trip or trip['user_id'] != user_id:
+                return jsonify({'error': 'Trip not found'}), 404
         
         # Run companion detection
         result = ml_service.detect_companions({
@@ -284,6 +559,13 @@ def detect_companions():
             'user_id': user_id
         })
         
+        # Join the trip against other users' stored fixes
+        if trip_id:
+            colocated = companion_service.detect_for_trip(trip_id, user_id)
+            result['colocated_companions'] = colocated
+            result['companions_detected'] = result['companions_detected'] or bool(colocated)
+            result['analysis_method'] = 'bluetooth_proximity+colocation'
+        
         return jsonify(result), 200
         
     except Exception as e:
@@ -303,13 +585,17 @@ def predict_route():
         preferences = data.get('preferences', {})
         
         # Run route prediction
-        result = ml_service.predict_optimal_route({
-            'origin': origin,
-            'destination': destination,
-            'avoid_traffic': preferences.get('avoid_traffic', True),
-            'scenic_route': preferences.get('scenic_route', False),
-            'avoid_tolls': preferences.get('avoid_tolls', False)
-        })
+        try:
+            result = ml_service.predict_optimal_route({
+                'origin': origin,
+                'destination': destination,
+                'avoid_traffic': preferences.get('avoid_traffic', True),
+                'scenic_route': preferences.get('scenic_route', False),
+                'avoid_tolls': preferences.get('avoid_tolls', False),
+                'departure_time': data.get('departure_time')
+            })
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify(result), 200
         
@@ -321,6 +607,25 @@ def predict_route():
 # GPS & Location Endpoints
 # =====================
 
+def update_trip_aggregates(user_id: str, locations: list):
+    """Fold stored fixes into their trip's running analytics"""
+    trip_id = locations[0].get('trip_id') if locations else None
+    if not trip_id:
+        return
+    try:
+        # A trip without totals yet (first fixes, or tracked before running
+        # totals existed) is seeded from its full trace, which includes these
+        if db_service.get_trip_aggregates(trip_id, user_id) is None:
+            gps_data = db_service.get_trip_gps_data(trip_id, user_id)
+            if gps_data:
+                db_service.set_trip_aggregates(trip_id, user_id, gps_service.aggregate_trace(gps_data))
+            return
+        increment = gps_service.aggregate_increment(locations)
+        db_service.update_trip_aggregates(trip_id, user_id, increment)
+    except Exception as e:
+        # Locations are already stored; a full recompute repairs the totals
+        logger.warning(f"Trip aggregate update error: {str(e)}")
+
 @app.route('/api/gps/track', methods=['POST'])
 @jwt_required()
 def track_gps():
@@ -338,10 +643,12 @@ def track_gps():
             'accuracy': data.get('accuracy'),
             'heading': data.get('heading'),
             'timestamp': data.get('timestamp', datetime.now().isoformat())
-        })
+        }, user_id, data.get('trip_id'),
+            lambda: db_service.get_last_trip_fix(data.get('trip_id'), user_id))
         
         # Store location
         db_service.store_location(user_id, location)
+        update_trip_aggregates(user_id, [location])
         
         # Emit real-time update
         socketio.emit('location_update', {
@@ -358,6 +665,77 @@ def track_gps():
         logger.error(f"GPS tracking error: {str(e)}")
         return jsonify({'error': 'GPS tracking failed'}), 500
 
+@app.route('/api/gps/track/batch', methods=['POST'])
+@jwt_required()
+def track_gps_batch():
+    """Track a batch of GPS locations in one request"""
+    try:
+        data = request.get_json()
+        user_id = get_jwt_identity()
+        
+        points = data.get('points')
+        trip_id = data.get('trip_id')
+        max_points = app.config['GPS_BATCH_MAX_POINTS']
+        
+        if not isinstance(points, list) or not points:
+            return jsonify({'error': 'points must be a non-empty list'}), 400
+        if len(points) > max_points:
+            return jsonify({'error': f'At most {max_points} points per batch'}), 400
+        
+        # Fixes may only be attached to the caller's own trip
+        if trip_id:
+            trip = db_service.get_trip(trip_id)
+            if not trip or trip['user_id'] != user_id:
+                return jsonify({'error': 'Trip not found'}), 404
+        
+        # Validate each fix; invalid ones are acknowledged as rejected
+        results = []
+        valid_points = []
+        valid_indexes = []
+        for index, point in enumerate(points):
+            error = gps_service.validate_fix(point)
+            if error:
+                results.append({'index': index, 'status': 'rejected', 'error': error})
+            else:
+                results.append({'index': index, 'status': 'stored'})
+                valid_points.append(point)
+                valid_indexes.append(index)
+        
+        # Process and store valid fixes in one pass
+        locations = gps_service.process_locations(
+            valid_points, user_id, trip_id, lambda: db_service.get_last_trip_fix(trip_id, user_id)
+        )
+        write_errors = db_service.store_locations(user_id, locations)
+        
+        for index, location, error in zip(valid_indexes, locations, write_errors):
+            results[index]['timestamp'] = location['timestamp']
+            if error:
+                results[index]['status'] = 'failed'
+                results[index]['error'] = error
+        
+        stored = [l for l, error in zip(locations, write_errors) if not error]
+        update_trip_aggregates(user_id, stored)
+        
+        # Emit real-time update with the most recent fix
+        if stored:
+            socketio.emit('location_update', {
+                'user_id': user_id,
+                'location': stored[-1]
+            })
+        
+        return jsonify({
+            'status': 'tracked' if len(stored) == len(points) else 'partial',
+            'received': len(points),
+            'stored': len(stored),
+            'rejected': sum(1 for r in results if r['status'] == 'rejected'),
+            'failed': sum(1 for r in results if r['status'] == 'failed'),
+            'results': results
+        }), 200 if len(stored) == len(points) else 207
+        
+    except Exception as e:
+        logger.error(f"GPS batch tracking error: {str(e)}")
+        return jsonify({'error': 'GPS batch tracking failed'}), 500
+
 @app.route('/api/gps/analytics', methods=['GET'])
 @jwt_required()
 def gps_analytics():
@@ -369,12 +747,24 @@ def gps_analytics():
         if not trip_id:
             # Get latest trip
             trip_id = db_service.get_latest_trip_id(user_id)
+        else:
+            trip = db_service.get_trip(trip_id)
+            if not trip or trip['user_id'] != user_id:
+                return jsonify({'error': 'Trip not found'}), 404
+        
+        # Use running aggregates; recompute from the full trace for backfills
+        aggregates = None
+        if request.args.get('recompute', 'false').lower() != 'true':
+            aggregates = db_service.get_trip_aggregates(trip_id, user_id)
         
-        # Get GPS data
-        gps_data = db_service.get_trip_gps_data(trip_id)
+        if not aggregates:
+            gps_data = db_service.get_trip_gps_data(trip_id, user_id)
+            if not gps_data:
+                return jsonify({'error': 'No GPS data'}), 200
+            aggregates = gps_service.aggregate_trace(gps_data)
+            db_service.set_trip_aggregates(trip_id, user_id, aggregates)
         
-        # Calculate analytics
-        analytics = gps_service.calculate_analytics(gps_data)
+        analytics = gps_service.analytics_from_aggregates(aggregates)
         
         return jsonify(analytics), 200
         
@@ -388,22 +778,35 @@ def check_geofence():
     """Check if location is within geofence"""
     try:
         data = request.get_json()
+        user_id = get_jwt_identity()
         
         location = {
             'lat': data.get('latitude'),
             'lng': data.get('longitude')
         }
         
+        # Registered fence sets are answered from the spatial index
+        fence_set_id = data.get('fence_set_id')
+        if fence_set_id:
+            error = gps_service.validate_fix(data)
+            if error:
+                return jsonify({'error': error}), 400
+            hits = geofence_service.check_fence_set(fence_set_id, user_id, location)
+            if hits is None:
+                return jsonify({'error': 'Fence set not found'}), 404
+            return jsonify({'fence_set_id': fence_set_id, 'results': hits}), 200
+        
         geofences = data.get('geofences', [])
         
-        results = []
-        for fence in geofences:
-            is_inside = gps_service.check_geofence(location, fence)
-            results.append({
+        inside = gps_service.check_geofences(location, geofences)
+        results = [
+            {
                 'fence_id': fence.get('id'),
                 'name': fence.get('name'),
                 'is_inside': is_inside
-            })
+            }
+            for fence, is_inside in zip(geofences, inside)
+        ]
         
         return jsonify({'results': results}), 200
         
@@ -411,6 +814,78 @@ def check_geofence():
         logger.error(f"Geofence check error: {str(e)}")
         return jsonify({'error': 'Geofence check failed'}), 500
 
+@app.route('/api/gps/geofence/classify', methods=['POST'])
+@jwt_required()
+def classify_geofence_points():
+    """Classify many points, or a whole trip, against a registered fence set"""
+    try:
+        data = request.get_json()
+        user_id = get_jwt_identity()
+        
+        fence_set_id = data.get('fence_set_id')
+        if not fence_set_id:
+            return jsonify({'error': 'fence_set_id is required'}), 400
+        
+        trip_id = data.get('trip_id')
+        if trip_id:
+            trip = db_service.get_trip(trip_id)
+            if not trip or trip['user_id'] != user_id:
+                return jsonify({'error': 'Trip not found'}), 404
+            gps_data = db_service.get_trip_gps_data(trip_id, user_id)
+            lats = [p['lat'] for p in gps_data]
+            lngs = [p['lng'] for p in gps_data]
+        else:
+            points = data.get('points')
+            if not isinstance(points, list) or not points:
+                return jsonify({'error': 'points or trip_id is required'}), 400
+            for index, point in enumerate(points):
+                error = gps_service.validate_fix(point)
+                if error:
+                    return jsonify({'error': f'point {index}: {error}'}), 400
+            lats = [p['latitude'] for p in points]
+            lngs = [p['longitude'] for p in points]
+        
+        result = geofence_service.classify_points(fence_set_id, user_id, lats, lngs)
+        if result is None:
+            return jsonify({'error': 'Fence set not found'}), 404
+        
+        return jsonify({
+            'fence_set_id': fence_set_id,
+            'points': len(lats),
+            **result
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Geofence classification error: {str(e)}")
+        return jsonify({'error': 'Geofence classification failed'}), 500
+
+@app.route('/api/gps/geofence-sets', methods=['POST'])
+@jwt_required()
+def create_geofence_set():
+    """Register a server-side geofence set"""
+    try:
+        data = request.get_json()
+        user_id = get_jwt_identity()
+        
+        fences = data.get('fences')
+        error = validate_fences(fences) or validate_cell_size(data.get('cell_size'))
+        if error:
+            return jsonify({'error': error}), 400
+        
+        fence_set = geofence_service.register_fence_set(
+            fences, user_id, name=data.get('name'), cell_size=data.get('cell_size')
+        )
+        
+        return jsonify({
+            'message': 'Fence set created',
+            'fence_set_id': fence_set.id,
+            'fence_count': len(fence_set)
+        }), 201
+        
+    except Exception as e:
+        logger.error(f"Create geofence set error: {str(e)}")
+        return jsonify({'error': 'Failed to create fence set'}), 500
+
 # =====================
 # Trip Management Endpoints
 # =====================
@@ -418,18 +893,30 @@ def check_geofence():
 @app.route('/api/trips', methods=['GET'])
 @jwt_required()
 def get_trips():
-    """Get user trips"""
+    """Get user trips, newest first, one page per cursor"""
     try:
         user_id = get_jwt_identity()
-        page = request.args.get('page', 1, type=int)
         limit = request.args.get('limit', 10, type=int)
-        
-        trips = db_service.get_user_trips(user_id, page, limit)
+        if not 1 <= limit <= app.config['TRIPS_PAGE_MAX']:
+            return jsonify({'error': f"limit must be between 1 and {app.config['TRIPS_PAGE_MAX']}"}), 400
+        
+        # Legacy page numbers still work, but cost grows with the page
+        page = request.args.get('page', type=int)
+        if page is not None:
+            trips = db_service.get_user_trips(user_id, max(page, 1), limit)
+            return jsonify({'trips': trips, 'page': page, 'limit': limit}), 200
+        
+        try:
+            trips, next_cursor = db_service.get_user_trips_page(
+                user_id, limit, request.args.get('cursor')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
             'trips': trips,
-            'page': page,
-            'limit': limit
+            'limit': limit,
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -506,11 +993,15 @@ def update_trip(trip_id):
 # =====================
 
 @app.route('/api/kerala/districts', methods=['GET'])
+@limiter.exempt
 def get_districts():
     """Get Kerala districts"""
     try:
-        districts = kerala_service.get_districts()
-        return jsonify({'districts': districts}), 200
+        return kerala_cache.respond(
+            'districts',
+            lambda: {'districts': kerala_service.get_districts()},
+            max_age=app.config['KERALA_CACHE_TTL']
+        )
     except Exception as e:
         logger.error(f"Get districts error: {str(e)}")
         return jsonify({'error': 'Failed to fetch districts'}), 500
@@ -521,12 +1012,23 @@ def get_tourism_spots():
     try:
         lat = request.args.get('lat', type=float)
         lng = request.args.get('lng', type=float)
-        radius = request.args.get('radius', 10, type=int)
+        radius = request.args.get('radius', type=float)
+        k = request.args.get('k', type=int)
+        spot_type = request.args.get('type')
+        max_results = app.config['TOURISM_MAX_RESULTS']
+        limit = request.args.get('limit', max_results, type=int)
         
-        if not lat or not lng:
+        if lat is None or lng is None:
             return jsonify({'error': 'Latitude and longitude required'}), 400
+        for name, value in (('k', k), ('limit', limit)):
+            if value is not None and not 1 <= value <= max_results:
+                return jsonify({'error': f'{name} must be between 1 and {max_results}'}), 400
         
-        spots = kerala_service.get_tourism_spots(lat, lng, radius)
+        # k selects the k nearest spots; otherwise all spots within radius km
+        if k:
+            spots = kerala_service.get_nearest_tourism_spots(lat, lng, k, radius, spot_type)
+        else:
+            spots = kerala_service.get_tourism_spots(lat, lng, radius or 10, spot_type, limit)
         
         return jsonify({'spots': spots}), 200
         
@@ -553,11 +1055,20 @@ def get_weather():
         return jsonify({'error': 'Failed to fetch weather'}), 500
 
 @app.route('/api/kerala/festivals', methods=['GET'])
+@limiter.exempt
 def get_festivals():
     """Get upcoming Kerala festivals"""
     try:
-        festivals = kerala_service.get_upcoming_festivals()
-        return jsonify({'festivals': festivals}), 200
+        days = request.args.get('days', default=365, type=int)
+        if days < 0:
+            return jsonify({'error': 'days must be non-negative'}), 400
+        
+        # Days until each festival change daily, so each day has its own entry
+        return kerala_cache.respond(
+            f"festivals:{datetime.now().date().isoformat()}:{days}",
+            lambda: {'festivals': kerala_service.get_upcoming_festivals(days)},
+            max_age=app.config['KERALA_CACHE_TTL']
+        )
     except Exception as e:
         logger.error(f"Get festivals error: {str(e)}")
         return jsonify({'error': 'Failed to fetch festivals'}), 500
@@ -569,15 +1080,18 @@ def translate_text():
         data = request.get_json()
         text = data.get('text')
         target_lang = data.get('target', 'ml')  # ml for Malayalam
+        max_length = app.config['TRANSLATE_MAX_TEXT_LENGTH']
         
-        if not text:
+        if not text or not isinstance(text, str):
             return jsonify({'error': 'Text required'}), 400
+        if len(text) > max_length:
+            return jsonify({'error': f'Text longer than {max_length} characters'}), 400
         
-        translated = kerala_service.translate(text, target_lang)
-        
+        # Free-form client text stays out of the shared response cache; the
+        # translator memoizes glossary hits itself
         return jsonify({
             'original': text,
-            'translated': translated,
+            'translated': kerala_service.translate(text, target_lang),
             'target_language': target_lang
         }), 200
         
@@ -585,6 +1099,39 @@ def translate_text():
         logger.error(f"Translation error: {str(e)}")
         return jsonify({'error': 'Translation failed'}), 500
 
+@app.route('/api/kerala/translate/batch', methods=['POST'])
+def translate_batch():
+    """Translate many UI strings, e.g. a whole screen, in one request"""
+    try:
+        data = request.get_json()
+        texts = data.get('texts')
+        target_lang = data.get('target', 'ml')
+        max_texts = app.config['TRANSLATE_BATCH_MAX_TEXTS']
+        max_length = app.config['TRANSLATE_MAX_TEXT_LENGTH']
+        
+        # A list of strings, or an object of string id -> string
+        keys = list(texts) if isinstance(texts, dict) else None
+        values = list(texts.values()) if keys is not None else texts
+        if not isinstance(values, list) or not values:
+            return jsonify({'error': 'texts must be a non-empty list or object of strings'}), 400
+        if len(values) > max_texts:
+            return jsonify({'error': f'At most {max_texts} texts per batch'}), 400
+        if not all(isinstance(text, str) for text in values):
+            return jsonify({'error': 'texts must be a non-empty list or object of strings'}), 400
+        if any(len(text) > max_length for text in values):
+            return jsonify({'error': f'Texts longer than {max_length} characters'}), 400
+        
+        translated = kerala_service.translate_many(values, target_lang)
+        
+        return jsonify({
+            'translations': dict(zip(keys, translated)) if keys is not None else translated,
+            'target_language': target_lang
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Batch translation error: {str(e)}")
+        return jsonify({'error': 'Translation failed'}), 500
+
 # =====================
 # Analytics Endpoints
 # =====================
@@ -595,9 +1142,12 @@ def get_dashboard():
     """Get user dashboard analytics"""
     try:
         user_id = get_jwt_identity()
-        period = request.args.get('period', 'week')  # week, month, year
+        period = request.args.get('period', 'week')  # week, month, year, all
         
-        analytics = analytics_service.get_user_analytics(user_id, period)
+        try:
+            analytics = analytics_service.get_user_analytics(user_id, period)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify(analytics), 200
         
@@ -611,17 +1161,48 @@ def export_data():
     """Export user data"""
     try:
         user_id = get_jwt_identity()
-        format_type = request.args.get('format', 'json')  # json, csv, excel
-        
-        if format_type == 'json':
-            data = analytics_service.export_user_data(user_id)
-            return jsonify(data), 200
-        elif format_type == 'csv':
-            file_path = analytics_service.export_to_csv(user_id)
-            return send_file(file_path, as_attachment=True)
+        format_type = request.args.get('format', 'json')  # json, csv, ndjson, excel, parquet
+        filename = f"user_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        
+        # Text formats stream straight from the trips cursor
+        streams = {
+            'json': (analytics_service.export_user_data, 'application/json', None),
+            'csv': (analytics_service.export_to_csv, 'text/csv', 'csv'),
+            'ndjson': (analytics_service.export_to_ndjson, 'application/x-ndjson', 'ndjson')
+        }
+        if format_type in streams:
+            export, mimetype, extension = streams[format_type]
+            headers = {'Content-Disposition': f'attachment; filename={filename}.{extension}'} if extension else None
+            return Response(export(user_id), mimetype=mimetype, headers=headers)
+        
         elif format_type == 'excel':
-            file_path = analytics_service.export_to_excel(user_id)
-            return send_file(file_path, as_attachment=True)
+            # xlsx is a zip archive, so it is built in a temp file. The file is
+            # unlinked once opened; the open handle keeps it readable until the
+            # response is sent, and nothing is left behind if the worker dies
+            fd, file_path = tempfile.mkstemp(suffix='.xlsx')
+            os.close(fd)
+            try:
+                analytics_service.export_to_excel(user_id, file_path)
+                export_file = open(file_path, 'rb')
+            finally:
+                os.remove(file_path)
+            return send_file(export_file, as_attachment=True, download_name=f'{filename}.xlsx')
+        
+        elif format_type == 'parquet':
+            # Trips and fixes as Parquet datasets partitioned by district and
+            # date, zipped; same unlink-after-open handling as Excel
+            fd, file_path = tempfile.mkstemp(suffix='.zip')
+            os.close(fd)
+            try:
+                try:
+                    build_parquet_archive(file_path, user_id, parquet_params(request.args))
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                export_file = open(file_path, 'rb')
+            finally:
+                os.remove(file_path)
+            return send_file(export_file, mimetype='application/zip', as_attachment=True,
+                             download_name=f'{filename}_parquet.zip')
         else:
             return jsonify({'error': 'Invalid format'}), 400
             
@@ -629,6 +1210,67 @@ def export_data():
         logger.error(f"Export error: {str(e)}")
         return jsonify({'error': 'Export failed'}), 500
 
+def export_job_response(job) -> dict:
+    result = job.to_dict()
+    result['status_url'] = f'/api/analytics/export/jobs/{job.id}'
+    if job.status == 'done':
+        result['download_url'] = f'/api/analytics/export/jobs/{job.id}/download'
+    return result
+
+@app.route('/api/analytics/export/jobs', methods=['POST'])
+@jwt_required()
+def create_export_job():
+    """Start a background export; an identical export in progress is returned instead"""
+    try:
+        data = request.get_json(silent=True) or {}
+        user_id = get_jwt_identity()
+        format_type = data.get('format', 'excel')
+        
+        try:
+            params = parquet_params(data) if format_type == 'parquet' else {}
+            job, created = export_jobs.submit(user_id, format_type, params)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except ExportJobLimit as e:
+            return jsonify({'error': str(e)}), 429
+        
+        result = export_job_response(job)
+        result['deduplicated'] = not created
+        return jsonify(result), 202 if created else 200
+        
+    except Exception as e:
+        logger.error(f"Export job error: {str(e)}")
+        return jsonify({'error': 'Failed to start export'}), 500
+
+@app.route('/api/analytics/export/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+@limiter.exempt
+def get_export_job(job_id):
+    """Export job status and progress"""
+    job = export_jobs.get(job_id, get_jwt_identity())
+    if not job:
+        return jsonify({'error': 'Export job not found'}), 404
+    return jsonify(export_job_response(job)), 200
+
+@app.route('/api/analytics/export/jobs/<job_id>/download', methods=['GET'])
+@jwt_required()
+def download_export_job(job_id):
+    """Download a finished export"""
+    user_id = get_jwt_identity()
+    job = export_jobs.get(job_id, user_id)
+    if not job:
+        return jsonify({'error': 'Export job not found'}), 404
+    if job.status != 'done':
+        return jsonify({'error': 'Export not ready', 'status': job.status}), 409
+    
+    try:
+        export_file = open(job.path, 'rb')
+    except FileNotFoundError:
+        return jsonify({'error': 'Export job not found'}), 404  # expired meanwhile
+    extension = os.path.splitext(job.path)[1]
+    created = datetime.fromtimestamp(job.created_at).strftime('%Y%m%d_%H%M%S')
+    return send_file(export_file, as_attachment=True, download_name=f'user_{user_id}_{created}{extension}')
+
 @app.route('/api/analytics/insights', methods=['GET'])
 @jwt_required()
 def get_insights():
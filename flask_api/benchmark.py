@@ -0,0 +1,137 @@
+"""
+Benchmark Script
+Measures throughput of the GPS analytics hot paths
+
+Usage:
+    python benchmark.py [points]
+"""
+
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+from haversine import haversine, Unit
+
+from ml_service import MLService
+from services import GPSService
+
+
+def make_trace(points: int, seed: int = 42) -> List[Dict]:
+    """Build a synthetic random-walk trace around Kochi"""
+    rng = np.random.default_rng(seed)
+    lats = 9.9312 + np.cumsum(rng.normal(0, 0.0002, points))
+    lngs = 76.2673 + np.cumsum(rng.normal(0, 0.0002, points))
+    speeds = np.abs(rng.normal(20, 15, points))
+    return [
+        {'lat': float(lat), 'lng': float(lng), 'speed': float(speed)}
+        for lat, lng, speed in zip(lats, lngs, speeds)
+    ]
+
+
+def loop_analytics(gps_data: List[Dict]) -> Dict:
+    """Reference per-pair implementation (pre-vectorization)"""
+    speeds = [p.get('speed', 0) for p in gps_data]
+    distances = []
+    for i in range(1, len(gps_data)):
+        distances.append(haversine(
+            (gps_data[i-1]['lat'], gps_data[i-1]['lng']),
+            (gps_data[i]['lat'], gps_data[i]['lng']),
+            unit=Unit.METERS
+        ))
+    return {
+        'total_distance': sum(distances) / 1000,
+        'avg_speed': np.mean(speeds),
+        'max_speed': max(speeds),
+        'min_speed': min(speeds),
+        'points_analyzed': len(gps_data),
+        'stop_count': sum(1 for s in speeds if s < 2),
+        'moving_time': sum(1 for s in speeds if s >= 2) / 60
+    }
+
+
+def measure(func: Callable, *args, repeat: int = 5) -> float:
+    """Best wall-clock time over several runs, in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_analytics(points: int):
+    """Compare loop and vectorized calculate_analytics"""
+    trace = make_trace(points)
+    gps_service = GPSService()
+
+    expected = loop_analytics(trace)
+    actual = gps_service.calculate_analytics(trace)
+    for key, value in expected.items():
+        assert np.isclose(actual[key], value, rtol=1e-9), key
+
+    before = measure(loop_analytics, trace)
+    after = measure(gps_service.calculate_analytics, trace)
+
+    print(f"calculate_analytics ({points} points)")
+    print(f"  loop:       {points / before:>14,.0f} points/s")
+    print(f"  vectorized: {points / after:>14,.0f} points/s  ({before / after:.1f}x)")
+
+
+def bench_mode_classification(segments: int, seed: int = 42):
+    """Compare per-segment and batch transport mode classification"""
+    rng = np.random.default_rng(seed)
+    speed = rng.uniform(0, 120, segments)
+    acceleration = rng.normal(0, 1, segments)
+    stop_frequency = rng.integers(0, 10, segments).astype(float)
+    ml_service = MLService()
+
+    sample = min(segments, 10000)
+
+    def per_segment():
+        for i in range(sample):
+            ml_service.classify_transport_mode({
+                'speed': speed[i],
+                'acceleration': acceleration[i],
+                'stop_frequency': stop_frequency[i]
+            })
+
+    before = measure(per_segment, repeat=1)
+    after = measure(ml_service.classify_transport_mode_batch, speed, acceleration, stop_frequency)
+
+    print(f"classify_transport_mode ({segments} segments)")
+    print(f"  per segment: {sample / before:>13,.0f} segments/s")
+    print(f"  batch:       {segments / after:>13,.0f} segments/s")
+
+
+def bench_purpose_prediction(trips: int, seed: int = 42):
+    """Compare per-trip and batch trip purpose prediction"""
+    rng = np.random.default_rng(seed)
+    times = rng.integers(0, 24, trips)
+    days = rng.integers(0, 7, trips)
+    modes = rng.choice(['walk', 'car', 'bus', 'unknown'], trips).tolist()
+    ml_service = MLService()
+
+    sample = min(trips, 10000)
+
+    def per_trip():
+        for i in range(sample):
+            ml_service.predict_trip_purpose({
+                'time': int(times[i]),
+                'day_of_week': int(days[i]),
+                'mode': modes[i]
+            })
+
+    before = measure(per_trip, repeat=1)
+    after = measure(ml_service.predict_trip_purpose_batch, times, days, modes)
+
+    print(f"predict_trip_purpose ({trips} trips)")
+    print(f"  per trip: {sample / before:>16,.0f} trips/s")
+    print(f"  batch:    {trips / after:>16,.0f} trips/s")
+
+
+if __name__ == '__main__':
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    bench_analytics(points)
+    bench_mode_classification(points)
+    bench_purpose_prediction(points)
@@ -0,0 +1,177 @@
+"""
+Cache Module
+Bounded key/value caches shared by the API services
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# =====================
+# In-Memory Cache
+# =====================
+
+class TTLCache:
+    """Thread-safe LRU cache with a per-entry time-to-live (process memory)"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get a value, refreshing its LRU position"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        """Set a value, evicting least recently used entries over max_size"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        """Remove a value if present"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every value"""
+        with self._lock:
+            self._data.clear()
+
+    def evict_expired(self) -> List[str]:
+        """Drop expired entries and return their keys"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (expires_at, _) in self._data.items() if expires_at <= now]
+            for key in expired:
+                del self._data[key]
+        return expired
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+# =====================
+# SQLite Shared Cache
+# =====================
+
+class SQLiteCache:
+    """LRU cache with time-to-live in a local SQLite file
+
+    Shared by every worker process on the host. Values must be JSON
+    serializable.
+    """
+
+    TRIM_INTERVAL = 1000  # writes between LRU/TTL trims
+
+    def __init__(self, path: str, max_size: int = 10000, ttl: float = 3600):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+
+        conn = sqlite3.connect(self.path, timeout=5)
+        with conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)')
+        conn.close()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection, reopened after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get a value, refreshing its LRU position"""
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT value, expires_at FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return default
+        if row[1] <= now:
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+            return default
+        conn.execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        """Set a value, periodically trimming expired and excess entries"""
+        now = time.time()
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), now + self.ttl, now)
+        )
+        self._writes += 1
+        if self._writes % self.TRIM_INTERVAL == 0:
+            self._trim(now)
+
+    def delete(self, key: str):
+        """Remove a value if present"""
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        """Remove every value"""
+        self._connection().execute('DELETE FROM cache')
+
+    def evict_expired(self) -> List[str]:
+        """Drop expired entries and return their keys"""
+        conn = self._connection()
+        now = time.time()
+        expired = [row[0] for row in conn.execute(
+            'SELECT key FROM cache WHERE expires_at <= ?', (now,)
+        )]
+        conn.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+        return expired
+
+    def _trim(self, now: float):
+        """Enforce TTL and max_size"""
+        conn = self._connection()
+        conn.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+        conn.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_size,)
+        )
+
+    def __len__(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+def create_cache(store: Optional[str] = None, max_size: int = 10000, ttl: float = 3600):
+    """Create a cache from a store setting: 'memory' or 'sqlite:///path/to/file.db'"""
+    if store and store.startswith('sqlite:///'):
+        path = store[len('sqlite:///'):]
+        logger.info(f"Using SQLite cache at {path}")
+        return SQLiteCache(path, max_size=max_size, ttl=ttl)
+    return TTLCache(max_size=max_size, ttl=ttl)
@@ -0,0 +1,266 @@
+"""
+Companion Module
+Server-side companion detection by co-location of users' GPS fixes
+"""
+
+import os
+import math
+import logging
+from typing import Dict, List, Any, Optional, Iterable
+import numpy as np
+
+from features import _timestamp_seconds
+from services import DatabaseService, haversine_array
+
+logger = logging.getLogger(__name__)
+
+METERS_PER_DEGREE = 111320.0
+MAX_GEOHASH_BITS = 24  # per axis; about 1.2 m cells
+KEY_BITS = 63
+
+# =====================
+# Geohash Cells
+# =====================
+
+def _spread_bits(values: np.ndarray) -> np.ndarray:
+    """Interleave a zero bit above each of the low 32 bits"""
+    x = values.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                        (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333),
+                        (1, 0x5555555555555555)):
+        x = (x | (x << np.uint64(shift))) & np.uint64(mask)
+    return x
+
+def geohash(rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Integer geohash of grid cells, longitude bit first"""
+    return ((_spread_bits(cols) << np.uint64(1)) | _spread_bits(rows)).astype(np.int64)
+
+def geohash_bits(distance: float, max_abs_lat: float) -> int:
+    """Finest geohash precision whose cells are at least distance meters on each side"""
+    height = 180 * METERS_PER_DEGREE / distance
+    width = 360 * METERS_PER_DEGREE * math.cos(math.radians(min(max_abs_lat, 89.0))) / distance
+    return int(np.clip(math.floor(math.log2(min(height, width))), 1, MAX_GEOHASH_BITS))
+
+def geohash_cells(lats: np.ndarray, lngs: np.ndarray, bits: int):
+    """Grid row/column of each point at a geohash precision"""
+    rows = np.floor((lats + 90) / 180 * (1 << bits)).astype(np.int64)
+    cols = np.floor((lngs + 180) / 360 * (1 << bits)).astype(np.int64)
+    return rows, cols
+
+# =====================
+# Companion Engine
+# =====================
+
+class CompanionEngine:
+    """Co-location join over many users' fixes
+
+    Fixes are reduced to one mean position per user and time bucket, keyed by
+    (bucket, geohash cell) and sorted. Cells are at least distance_threshold
+    wide, so every neighbour within the threshold lies in the same bucket and
+    the surrounding 3x3 cells: each lookup is a binary search, and the join
+    costs O(n log n) plus the number of nearby candidates instead of a
+    pairwise scan over all users.
+    """
+
+    def __init__(self, distance_threshold: float = 50.0, bucket_seconds: float = 60.0,
+                 min_share: float = 0.6, min_buckets: int = 3):
+        self.distance_threshold = distance_threshold  # meters
+        self.bucket_seconds = bucket_seconds
+        self.min_share = min_share      # share of a user's buckets spent co-located
+        self.min_buckets = min_buckets
+
+    def _bucket_positions(self, users: np.ndarray, t: np.ndarray,
+                          lats: np.ndarray, lngs: np.ndarray):
+        """Mean position per (user, time bucket)"""
+        buckets = np.floor(t / self.bucket_seconds).astype(np.int64)
+        buckets -= buckets.min()
+        span = int(buckets.max()) + 1
+        keys, inverse = np.unique(users * span + buckets, return_inverse=True)
+        inverse = inverse.ravel()
+        sizes = np.bincount(inverse)
+        return (
+            keys // span,
+            keys % span,
+            np.bincount(inverse, weights=lats) / sizes,
+            np.bincount(inverse, weights=lngs) / sizes
+        )
+
+    def colocated_pairs(self, user_ids: List[str], t, lats, lngs,
+                        targets: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Count the time buckets each pair of users spent within the threshold
+
+        Args:
+            user_ids, t, lats, lngs: One entry per fix; t in epoch seconds
+            targets: Only pair these users with everyone else; None pairs
+                all users with each other
+
+        Returns:
+            users, pair arrays user_a/user_b (indexes into users; user_a is
+            the target when targets are given), shared_buckets and
+            mean_distance per pair, and buckets per user
+        """
+        users, codes = np.unique(np.asarray(user_ids, dtype=str), return_inverse=True)
+        u, b, lat, lng = self._bucket_positions(
+            codes.astype(np.int64), np.asarray(t, dtype=float),
+            np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float)
+        )
+        user_buckets = np.bincount(u, minlength=users.size)
+
+        bits = geohash_bits(self.distance_threshold, float(np.abs(lat).max()))
+        if int(b.max()).bit_length() + 2 * bits > KEY_BITS:
+            raise ValueError('time window too long for the bucket size')
+        rows, cols = geohash_cells(lat, lng, bits)
+        shift = 2 * bits
+        keys = (b << shift) | geohash(rows, cols)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+
+        if targets is None:
+            sources = np.arange(u.size)
+        else:
+            target_codes = np.flatnonzero(np.isin(users, np.asarray(targets, dtype=str)))
+            sources = np.flatnonzero(np.isin(u, target_codes))
+
+        pair_a, pair_b, pair_bucket, pair_distance = [], [], [], []
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                probe = (b[sources] << shift) | geohash(rows[sources] + dr, cols[sources] + dc)
+                lo = np.searchsorted(sorted_keys, probe, side='left')
+                counts = np.searchsorted(sorted_keys, probe, side='right') - lo
+                total = int(counts.sum())
+                if not total:
+                    continue
+                left = np.repeat(sources, counts)
+                starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+                right = order[starts + np.arange(total)]
+
+                keep = u[left] != u[right]
+                left, right = left[keep], right[keep]
+                distance = haversine_array(lat[left], lng[left], lat[right], lng[right])
+                near = distance <= self.distance_threshold
+                left, right = left[near], right[near]
+
+                if targets is None:
+                    # Each unordered pair is seen from both sides
+                    first = u[left] < u[right]
+                    left, right = left[first], right[first]
+                    distance = distance[near][first]
+                else:
+                    distance = distance[near]
+                pair_a.append(u[left])
+                pair_b.append(u[right])
+                pair_bucket.append(b[left])
+                pair_distance.append(distance)
+
+        if not pair_a:
+            empty = np.empty(0, dtype=np.int64)
+            return {
+                'users': users.tolist(), 'user_a': empty, 'user_b': empty,
+                'shared_buckets': empty, 'mean_distance': np.empty(0),
+                'user_buckets': user_buckets
+            }
+
+        # A pair counts once per bucket however many cells matched
+        matches = np.column_stack([np.concatenate(pair_a), np.concatenate(pair_b),
+                                   np.concatenate(pair_bucket)])
+        unique_rows, first = np.unique(matches, axis=0, return_index=True)
+        distances = np.concatenate(pair_distance)[first]
+        pairs, inverse, shared = np.unique(unique_rows[:, :2], axis=0,
+                                           return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+
+        return {
+            'users': users.tolist(),
+            'user_a': pairs[:, 0],
+            'user_b': pairs[:, 1],
+            'shared_buckets': shared,
+            'mean_distance': np.bincount(inverse, weights=distances) / shared,
+            'user_buckets': user_buckets
+        }
+
+    def find_companions(self, user_id: str, user_ids: List[str], t, lats, lngs) -> List[Dict[str, Any]]:
+        """Users who stayed within the threshold of user_id for most of its buckets"""
+        pairs = self.colocated_pairs(user_ids, t, lats, lngs, targets=[user_id])
+        users = pairs['users']
+        companions = []
+        for a, other, shared, distance in zip(pairs['user_a'].tolist(), pairs['user_b'].tolist(),
+                                              pairs['shared_buckets'].tolist(),
+                                              pairs['mean_distance'].tolist()):
+            share = shared / int(pairs['user_buckets'][a])
+            if share >= self.min_share and shared >= self.min_buckets:
+                companions.append({
+                    'user_id': users[other],
+                    'confidence': round(share, 3),
+                    'colocated_minutes': round(shared * self.bucket_seconds / 60, 1),
+                    'mean_distance': round(distance, 1)
+                })
+        return sorted(companions, key=lambda x: x['confidence'], reverse=True)
+
+# =====================
+# Companion Service
+# =====================
+
+class CompanionService:
+    """Companion detection over stored locations"""
+
+    def __init__(self, db_service: Optional[DatabaseService] = None):
+        self.db_service = db_service or DatabaseService()
+        self.engine = CompanionEngine(
+            distance_threshold=float(os.getenv('COMPANION_DISTANCE', 50)),
+            bucket_seconds=float(os.getenv('COMPANION_BUCKET_SECONDS', 60)),
+            min_share=float(os.getenv('COMPANION_MIN_SHARE', 0.6)),
+            min_buckets=int(os.getenv('COMPANION_MIN_BUCKETS', 3))
+        )
+        self.max_fixes = int(os.getenv('COMPANION_MAX_FIXES', 200000))  # other users' fixes per trip
+        logger.info("Companion Service initialized")
+
+    def is_ready(self) -> bool:
+        return True
+
+    @staticmethod
+    def _columns(user_id: Optional[str], fixes: Iterable[Dict], columns: Dict[str, list]):
+        """Append usable fixes to columnar lists"""
+        for fix in fixes:
+            try:
+                t = _timestamp_seconds(fix['timestamp'])
+                lat, lng = float(fix['lat']), float(fix['lng'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            columns['user_id'].append(user_id or fix['user_id'])
+            columns['t'].append(t)
+            columns['lat'].append(lat)
+            columns['lng'].append(lng)
+
+    def detect_for_trip(self, trip_id: str, user_id: str) -> List[Dict[str, Any]]:
+        """Other users whose stored fixes stayed near a trip for most of it"""
+        # Only the fixes the trip's owner sent belong to its trace
+        trip_fixes = self.db_service.get_trip_gps_data(trip_id, user_id)
+        if len(trip_fixes) < 2:
+            return []
+
+        columns = {'user_id': [], 't': [], 'lat': [], 'lng': []}
+        self._columns(user_id, trip_fixes, columns)
+        if not columns['t']:
+            return []
+
+        # Fixes are stored with their timestamp as sent; the trip's first and
+        # last fixes bound the concurrent window, and its extent widened by
+        # the distance threshold bounds where a companion can be
+        lats, lngs = np.array(columns['lat']), np.array(columns['lng'])
+        pad_lat = self.engine.distance_threshold / METERS_PER_DEGREE
+        pad_lng = pad_lat / max(math.cos(math.radians(min(float(np.abs(lats).max()) + pad_lat, 89.0))), 1e-6)
+        bounds = (float(lats.min()) - pad_lat, float(lngs.min()) - pad_lng,
+                  float(lats.max()) + pad_lat, float(lngs.max()) + pad_lng)
+        others = self.db_service.get_locations_between(
+            trip_fixes[0]['timestamp'], trip_fixes[-1]['timestamp'], exclude_user_id=user_id,
+            bounds=bounds, limit=self.max_fixes
+        )
+        before = len(columns['t'])
+        self._columns(None, others, columns)
+        if len(columns['t']) - before >= self.max_fixes:
+            logger.warning(f"Companion search for trip {trip_id} stopped at {self.max_fixes} fixes")
+
+        return self.engine.find_companions(
+            user_id, columns['user_id'], columns['t'], columns['lat'], columns['lng']
+        )
@@ -0,0 +1,261 @@
+"""
+Export Job Module
+Background export jobs: a worker pool builds export files while clients poll
+for progress, and finished artifacts expire after a TTL
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Callable, Optional, Tuple
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# build(path, user_id, params, progress) writes the artifact at path and
+# calls progress(done, total) as it goes
+Builder = Callable[[str, str, Dict[str, Any], Callable[[int, int], None]], Any]
+
+# Seconds between progress writes of a running job
+PROGRESS_WRITE_INTERVAL = 1.0
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+class ExportJobLimit(Exception):
+    """A user already has the maximum number of queued and running exports"""
+
+class ExportJob:
+    """State of one export, as stored in the export_jobs collection"""
+
+    FIELDS = ('id', 'user_id', 'format', 'params', 'key', 'path', 'status', 'done', 'total',
+              'error', 'size', 'created_at', 'started_at', 'finished_at', 'expires_at', 'updated_at')
+
+    def __init__(self, user_id: str, export_format: str, params: Dict[str, Any], path: str):
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.format = export_format
+        self.params = params
+        self.key = None
+        self.path = path
+        self.status = 'queued'  # queued, running, done, failed
+        self.done = 0
+        self.total = None
+        self.error = None
+        self.size = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.expires_at = None
+        self.updated_at = self.created_at
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> 'ExportJob':
+        job = cls.__new__(cls)
+        for field in cls.FIELDS:
+            setattr(job, field, doc.get(field))
+        return job
+
+    def to_doc(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.status == 'done':
+            percent = 100.0
+        elif self.total:
+            percent = round(min(100.0, 100 * self.done / self.total), 1)
+        else:
+            percent = 0.0
+        return {
+            'job_id': self.id,
+            'format': self.format,
+            'params': self.params,
+            'status': self.status,
+            'progress': {'rows': self.done, 'total': self.total, 'percent': percent},
+            'error': self.error,
+            'size': self.size,
+            'created_at': _iso(self.created_at),
+            'started_at': _iso(self.started_at),
+            'finished_at': _iso(self.finished_at),
+            'expires_at': _iso(self.expires_at)
+        }
+
+class ExportJobManager:
+    """Queue of export jobs run on a thread pool
+
+    Builders mostly wait on MongoDB cursors and file writes, so threads keep
+    request workers free without the cost of a process pool. Job state lives
+    in MongoDB, so any gunicorn worker can report a job's progress or serve
+    its artifact, as long as the artifact directory is shared by the workers.
+
+    A request matching a queued or running job of the same user, format and
+    parameters gets that job back instead of starting another (a unique
+    partial index on the job key settles races between workers); beyond that a
+    user may hold max_active queued or running jobs. Every sweep_interval
+    seconds each worker marks its own jobs as alive, fails jobs no worker has
+    touched for three intervals (their worker died) and deletes jobs, with
+    their artifacts, ttl seconds after they finish.
+    """
+
+    def __init__(self, builders: Dict[str, Tuple[Builder, str]], db_service,
+                 directory: Optional[str] = None, workers: int = 2, ttl: float = 3600,
+                 max_active: int = 3, sweep_interval: float = 60):
+        self.builders = builders  # format -> (build, file extension)
+        self.db_service = db_service
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'natpac-exports')
+        os.makedirs(self.directory, exist_ok=True)
+        self.ttl = ttl
+        self.max_active = max_active
+        self.sweep_interval = sweep_interval
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export')
+        self._lock = threading.Lock()
+        self._local: Dict[str, ExportJob] = {}  # jobs queued or running in this worker
+        if sweep_interval > 0:
+            threading.Thread(target=self._sweep_loop, name='export-sweep', daemon=True).start()
+
+    def formats(self):
+        return list(self.builders)
+
+    def submit(self, user_id: str, export_format: str,
+               params: Optional[Dict[str, Any]] = None) -> Tuple[ExportJob, bool]:
+        """
+        Queue an export, or join the identical one already in progress
+
+        Returns:
+            The job and whether it was newly created
+
+        Raises:
+            ValueError: Unknown format
+            ExportJobLimit: The user already has max_active exports in progress
+        """
+        if export_format not in self.builders:
+            raise ValueError(f'format must be one of: {", ".join(self.builders)}')
+        params = params or {}
+        key = json.dumps([user_id, export_format, params], sort_keys=True, default=str)
+
+        with self._lock:
+            existing = self.db_service.find_active_export_job(key)
+            if existing:
+                return ExportJob.from_doc(existing), False
+            if self.db_service.count_active_export_jobs(user_id) >= self.max_active:
+                raise ExportJobLimit(f'At most {self.max_active} exports in progress per user')
+            extension = self.builders[export_format][1]
+            job = ExportJob(user_id, export_format, params, '')
+            job.key = key
+            job.path = os.path.join(self.directory, f'{job.id}.{extension}')
+            try:
+                self.db_service.create_export_job(job.to_doc())
+            except DuplicateKeyError:
+                # Another worker queued the same export since the lookup
+                existing = self.db_service.find_active_export_job(key)
+                if not existing:
+                    raise
+                return ExportJob.from_doc(existing), False
+            self._local[job.id] = job
+
+        self._executor.submit(self._run, job)
+        return job, True
+
+    def get(self, job_id: str, user_id: str) -> Optional[ExportJob]:
+        """A job of the user, None if unknown, expired or someone else's"""
+        doc = self.db_service.get_export_job(job_id)
+        if not doc or doc.get('user_id') != user_id:
+            return None
+        if doc.get('expires_at') and doc['expires_at'] <= time.time():
+            return None  # the next sweep deletes it
+        return ExportJob.from_doc(doc)
+
+    def _run(self, job: ExportJob):
+        build = self.builders[job.format][0]
+        written = [0.0]
+
+        def progress(done: int, total: Optional[int] = None):
+            job.done = done
+            if total is not None:
+                job.total = total
+            now = time.time()
+            if now - written[0] >= PROGRESS_WRITE_INTERVAL:
+                written[0] = now
+                self.db_service.update_export_job(job.id, {'done': job.done, 'total': job.total})
+
+        try:
+            job.status = 'running'
+            job.started_at = job.updated_at = time.time()
+            self.db_service.update_export_job(job.id, {
+                'status': job.status, 'started_at': job.started_at, 'updated_at': job.updated_at
+            })
+            build(job.path, job.user_id, job.params, progress)
+            job.size = os.path.getsize(job.path)
+            job.status = 'done'
+        except Exception as e:
+            logger.error(f"Export job {job.id} ({job.format}) error: {str(e)}")
+            job.error = str(e) if isinstance(e, ValueError) else 'Export failed'
+            job.status = 'failed'
+            self._remove(job.path)
+        finally:
+            job.finished_at = job.updated_at = time.time()
+            job.expires_at = job.finished_at + self.ttl
+            try:
+                self.db_service.update_export_job(job.id, {
+                    field: getattr(job, field)
+                    for field in ('status', 'done', 'total', 'error', 'size',
+                                  'finished_at', 'expires_at', 'updated_at')
+                })
+            finally:
+                with self._lock:
+                    self._local.pop(job.id, None)
+
+    @staticmethod
+    def _remove(path: Optional[str]):
+        if not path:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def sweep(self) -> Dict[str, int]:
+        """Keep this worker's jobs alive, fail orphaned jobs and delete expired ones"""
+        now = time.time()
+        with self._lock:
+            local = list(self._local)
+        self.db_service.touch_export_jobs(local, now)
+
+        failed = 0
+        if self.sweep_interval > 0:
+            failed = self.db_service.fail_stale_export_jobs(now - 3 * self.sweep_interval, {
+                'status': 'failed', 'error': 'Export worker stopped',
+                'finished_at': now, 'expires_at': now + self.ttl, 'updated_at': now
+            })
+
+        expired = 0
+        for doc in self.db_service.expired_export_jobs(now):
+            # Only the worker that deletes the job removes its artifact
+            if self.db_service.delete_export_job(doc['id']):
+                self._remove(doc.get('path'))
+                expired += 1
+        return {'failed': failed, 'expired': expired}
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Export job sweep error: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {'local': len(self._local)}  # queued or running in this worker
+        try:
+            for status in ('queued', 'running', 'done', 'failed'):
+                result[status] = self.db_service.count_export_jobs(status)
+        except Exception as e:
+            logger.error(f"Export job stats error: {str(e)}")
+        return result
@@ -0,0 +1,345 @@
+"""
+Export Module
+Trip export writers that consume a trip iterator chunk by chunk, so memory
+stays constant however many trips a user has
+
+Bulk Parquet datasets of trips and location fixes for whole districts:
+    python exports.py parquet OUT_DIR [START] [END] [DISTRICT,...]
+"""
+
+import os
+import io
+import sys
+import csv
+import json
+import logging
+import zipfile
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+
+from poi_index import POIIndex
+
+logger = logging.getLogger(__name__)
+
+TRIP_EXPORT_COLUMNS = ('id', 'user_id', 'start_time', 'end_time', 'status', 'mode', 'purpose',
+                       'distance', 'duration', 'start_location', 'end_location', 'companions')
+EXCEL_MAX_ROWS = 1048575  # worksheet rows below the header
+
+# Parquet columns and their kinds; category columns are dictionary encoded
+TRIP_PARQUET_COLUMNS = (
+    ('id', 'string'), ('user_id', 'string'), ('start_time', 'timestamp'), ('end_time', 'timestamp'),
+    ('status', 'category'), ('mode', 'category'), ('purpose', 'category'),
+    ('distance', 'float'), ('duration', 'float'), ('start_lat', 'float'), ('start_lng', 'float'),
+    ('end_lat', 'float'), ('end_lng', 'float'), ('companions', 'list')
+)
+LOCATION_PARQUET_COLUMNS = (
+    ('user_id', 'string'), ('trip_id', 'string'), ('timestamp', 'timestamp'),
+    ('lat', 'float'), ('lng', 'float'), ('altitude', 'float'), ('speed', 'float'),
+    ('accuracy', 'float'), ('heading', 'float')
+)
+PARTITION_COLUMNS = ('district', 'date')
+PARQUET_ROW_GROUP_SIZE = 65536
+PARQUET_MAX_OPEN_FILES = 32
+DISTRICT_MAX_DISTANCE_M = 80000  # beyond this from every district HQ a point is 'other'
+EPOCH_MS_THRESHOLD = 1e11  # larger epoch values are milliseconds
+PROGRESS_EVERY = 1000  # rows between progress reports of row-by-row writers
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    """Lists of up to size consecutive items"""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _json(value: Any) -> str:
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+def _cell(value: Any) -> Any:
+    """Flat cell value; nested values are written as JSON"""
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list, tuple)):
+        return _json(value)
+    return value
+
+# =====================
+# Streaming Formats
+# =====================
+
+def iter_csv(trips: Iterable[Dict], columns: Sequence[str] = TRIP_EXPORT_COLUMNS,
+             chunk_size: int = 1000) -> Iterator[str]:
+    """CSV text, one chunk of rows at a time, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in chunked(trips, chunk_size):
+        writer.writerows([_cell(trip.get(column)) for column in columns] for trip in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # header only
+
+def iter_ndjson(trips: Iterable[Dict], chunk_size: int = 1000) -> Iterator[str]:
+    """One JSON object per line, one chunk of lines at a time"""
+    for chunk in chunked(trips, chunk_size):
+        yield ''.join(_json(trip) + '\n' for trip in chunk)
+
+def iter_json(fields: Dict[str, Any], trips: Iterable[Dict],
+              chunk_size: int = 1000) -> Iterator[str]:
+    """A JSON object of fields plus a trips array and total_trips, streamed"""
+    head = _json(fields)
+    yield (head[:-1] + ', ' if len(head) > 2 else '{') + '"trips": ['
+    total = 0
+    for chunk in chunked(trips, chunk_size):
+        yield (', ' if total else '') + ', '.join(_json(trip) for trip in chunk)
+        total += len(chunk)
+    yield f'], "total_trips": {total}}}'
+
+# =====================
+# File Formats
+# =====================
+
+def write_excel(path: str, trips: Iterable[Dict], analytics: Dict[str, Any],
+                columns: Sequence[str] = TRIP_EXPORT_COLUMNS,
+                progress: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """
+    Write trips and analytics sheets row by row in constant memory, calling
+    progress with the rows written so far
+
+    Returns:
+        rows written and whether trips beyond the sheet limit were dropped
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    try:
+        sheet = workbook.add_worksheet('Trips')
+        sheet.write_row(0, 0, columns)
+        rows, truncated = 0, False
+        for trip in trips:
+            if rows == EXCEL_MAX_ROWS:
+                truncated = True
+                break
+            rows += 1
+            sheet.write_row(rows, 0, [_cell(trip.get(column)) for column in columns])
+            if progress and rows % PROGRESS_EVERY == 0:
+                progress(rows)
+        if progress:
+            progress(rows)
+        if truncated:
+            logger.warning(f"Excel export truncated at {EXCEL_MAX_ROWS} trips; use CSV or NDJSON")
+
+        sheet = workbook.add_worksheet('Analytics')
+        sheet.write_row(0, 0, list(analytics))
+        sheet.write_row(1, 0, [_cell(value) for value in analytics.values()])
+    finally:
+        workbook.close()
+    return {'rows': rows, 'truncated': truncated}
+
+# =====================
+# Parquet Datasets
+# =====================
+
+def _arrow_type(pa, kind: str):
+    return {
+        'string': pa.string(),
+        'category': pa.dictionary(pa.int32(), pa.string()),
+        'float': pa.float64(),
+        'timestamp': pa.timestamp('ms'),
+        'list': pa.list_(pa.string())
+    }[kind]
+
+def _schema(pa, columns: Sequence[Tuple[str, str]]):
+    fields = [pa.field(name, _arrow_type(pa, kind)) for name, kind in columns]
+    return pa.schema(fields + [pa.field(name, pa.string()) for name in PARTITION_COLUMNS])
+
+def _floats(values: List[Any]) -> np.ndarray:
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=float)
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _timestamps(values: List[Any]) -> pd.Series:
+    """
+    Timestamps from ISO strings or epoch seconds/milliseconds, NaT when
+    unusable. Values with an offset are converted to UTC; naive ones are
+    kept as written.
+    """
+    series = pd.Series(values, dtype=object)
+    numbers = pd.to_numeric(series.where(series.map(_is_number)), errors='coerce')
+    strings = series.where(series.map(lambda v: isinstance(v, str)))
+    parsed = pd.to_datetime(strings, utc=True, format='ISO8601', errors='coerce').dt.tz_localize(None)
+    epoch_ms = numbers.where(numbers > EPOCH_MS_THRESHOLD, numbers * 1000)
+    return parsed.fillna(pd.to_datetime(epoch_ms, unit='ms', errors='coerce')).astype('datetime64[ms]')
+
+def _point(value: Any) -> Tuple[Any, Any]:
+    """lat and lng of a {lat, lng} or {latitude, longitude} object"""
+    if not isinstance(value, dict):
+        return None, None
+    return value.get('lat', value.get('latitude')), value.get('lng', value.get('longitude'))
+
+def _strings(values: List[Any]) -> List[Optional[str]]:
+    return [None if v is None else v if isinstance(v, str) else _json(v) for v in values]
+
+def assign_districts(index: POIIndex, lats: np.ndarray, lngs: np.ndarray,
+                     given: Optional[List[Any]] = None) -> np.ndarray:
+    """
+    District of each point by its nearest district headquarters
+
+    Points farther than DISTRICT_MAX_DISTANCE_M from every headquarters are
+    'other', points without coordinates 'unknown'. A recognised district
+    name in given takes precedence over the coordinates.
+    """
+    names = np.array([r['name'] for r in index.records] + ['other'], dtype=object)
+    districts = names[index.nearest_indexes(lats, lngs, DISTRICT_MAX_DISTANCE_M)]
+    districts[~(np.isfinite(lats) & np.isfinite(lngs))] = 'unknown'
+    if given is not None:
+        known = {name.casefold(): name for name in names[:-1]}
+        for i, name in enumerate(given):
+            if isinstance(name, str) and name.casefold() in known:
+                districts[i] = known[name.casefold()]
+    return districts
+
+def _record_batch(pa, schema, columns: Sequence[Tuple[str, str]], values: Dict[str, Any],
+                  districts: np.ndarray, times: pd.Series, keep: Optional[set]):
+    """One record batch of typed columns plus partition keys, limited to the kept districts"""
+    arrays = []
+    for name, kind in columns:
+        column = values[name]
+        if kind == 'timestamp':
+            arrays.append(pa.Array.from_pandas(column, type=pa.timestamp('ms')))
+        elif kind == 'float':
+            arrays.append(pa.array(column, type=pa.float64(), from_pandas=True))
+        elif kind == 'category':
+            arrays.append(pa.array(_strings(column), type=pa.string()).dictionary_encode())
+        elif kind == 'list':
+            arrays.append(pa.array(
+                [_strings(v) if isinstance(v, list) else None for v in column], type=pa.list_(pa.string())
+            ))
+        else:
+            arrays.append(pa.array(_strings(column), type=pa.string()))
+    dates = times.dt.strftime('%Y-%m-%d').fillna('unknown')
+    arrays.append(pa.array(districts.tolist(), type=pa.string()))
+    arrays.append(pa.array(dates.tolist(), type=pa.string()))
+    batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+    if keep is not None:
+        batch = batch.filter(pa.array(np.isin(districts, list(keep))))
+    return batch
+
+def _trip_batches(pa, schema, trips: Iterable[Dict], index: POIIndex, keep: Optional[set],
+                  chunk_size: int) -> Iterator:
+    for chunk in chunked(trips, chunk_size):
+        values = {name: [trip.get(name) for trip in chunk] for name, _ in TRIP_PARQUET_COLUMNS}
+        for end in ('start', 'end'):
+            lat, lng = zip(*(_point(trip.get(f'{end}_location')) for trip in chunk))
+            values[f'{end}_lat'], values[f'{end}_lng'] = _floats(lat), _floats(lng)
+        for name in ('distance', 'duration'):
+            values[name] = _floats(values[name])
+        values['start_time'] = _timestamps(values['start_time'])
+        values['end_time'] = _timestamps(values['end_time'])
+        districts = assign_districts(index, values['start_lat'], values['start_lng'],
+                                     [trip.get('district') for trip in chunk])
+        yield _record_batch(pa, schema, TRIP_PARQUET_COLUMNS, values, districts, values['start_time'], keep)
+
+def _location_batches(pa, schema, locations: Iterable[Dict], index: POIIndex, keep: Optional[set],
+                      chunk_size: int) -> Iterator:
+    for chunk in chunked(locations, chunk_size):
+        values = {name: [fix.get(name) for fix in chunk] for name, _ in LOCATION_PARQUET_COLUMNS}
+        for name, kind in LOCATION_PARQUET_COLUMNS:
+            if kind == 'float':
+                values[name] = _floats(values[name])
+        values['timestamp'] = _timestamps(values['timestamp'])
+        districts = assign_districts(index, values['lat'], values['lng'])
+        yield _record_batch(pa, schema, LOCATION_PARQUET_COLUMNS, values, districts, values['timestamp'], keep)
+
+def _counted(batches: Iterator, name: str, counts: Dict[str, int],
+             progress: Optional[Callable[[int], None]]) -> Iterator:
+    for batch in batches:
+        counts[name] += batch.num_rows
+        if progress:
+            progress(counts['trips'] + counts['locations'])
+        yield batch
+
+def write_parquet(base_dir: str, trips: Iterable[Dict], locations: Iterable[Dict],
+                  district_index: POIIndex, districts: Optional[Sequence[str]] = None,
+                  chunk_size: int = 10000, row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+                  progress: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """
+    Write trips and location fixes as Parquet datasets under base_dir/trips
+    and base_dir/locations, partitioned district=<name>/date=<YYYY-MM-DD>
+
+    Rows are converted chunk by chunk and written in row groups as they
+    arrive, so memory is bounded by the chunk size and the rows buffered per
+    open file, not by the number of rows exported. Inputs sorted by time keep
+    few partitions open at once. progress is called with the trips plus
+    fixes written so far.
+
+    Returns:
+        rows written per dataset and the files written
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    keep = None
+    if districts:
+        known = {r['name'] for r in district_index.records} | {'other', 'unknown'}
+        unknown = sorted(set(districts) - known)
+        if unknown:
+            raise ValueError(f"unknown districts: {', '.join(unknown)}")
+        keep = set(districts)
+
+    counts = {'trips': 0, 'locations': 0}
+    files = []
+    partitioning = ds.partitioning(
+        pa.schema([pa.field(name, pa.string()) for name in PARTITION_COLUMNS]), flavor='hive'
+    )
+    datasets = (
+        ('trips', TRIP_PARQUET_COLUMNS, _trip_batches, trips),
+        ('locations', LOCATION_PARQUET_COLUMNS, _location_batches, locations)
+    )
+    for name, columns, batches, rows in datasets:
+        schema = _schema(pa, columns)
+        ds.write_dataset(
+            _counted(batches(pa, schema, rows, district_index, keep, chunk_size), name, counts, progress),
+            os.path.join(base_dir, name),
+            schema=schema,
+            format='parquet',
+            partitioning=partitioning,
+            basename_template='part-{i}.parquet',
+            max_rows_per_group=row_group_size,
+            min_rows_per_group=row_group_size // 4,
+            max_open_files=PARQUET_MAX_OPEN_FILES,
+            existing_data_behavior='delete_matching',
+            file_visitor=lambda written: files.append(written.path)
+        )
+    logger.info(f"Parquet export: {counts['trips']} trips, {counts['locations']} fixes, {len(files)} files")
+    return {'rows': counts, 'files': len(files)}
+
+def zip_directory(path: str, zip_path: str):
+    """Store a directory tree in a zip archive; Parquet pages are already compressed"""
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as archive:
+        for root, _, names in os.walk(path):
+            for name in sorted(names):
+                file_path = os.path.join(root, name)
+                archive.write(file_path, os.path.relpath(file_path, path))
+
+
+if __name__ == '__main__':
+    from services import AnalyticsService
+
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 3 or sys.argv[1] != 'parquet':
+        print('usage: python exports.py parquet OUT_DIR [START] [END] [DISTRICT,...]')
+        sys.exit(2)
+    start = datetime.fromisoformat(sys.argv[3]) if len(sys.argv) > 3 and sys.argv[3] else None
+    end = datetime.fromisoformat(sys.argv[4]) if len(sys.argv) > 4 and sys.argv[4] else None
+    districts = sys.argv[5].split(',') if len(sys.argv) > 5 else None
+
+    result = AnalyticsService().export_to_parquet(sys.argv[2], start, end, districts)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,170 @@
+"""
+Feature Extraction Module
+Segment-level mobility features from raw GPS points
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+
+from services import haversine_array
+
+logger = logging.getLogger(__name__)
+
+STOP_SPEED = 2.0           # km/h
+SPEED_PERCENTILES = (50, 85, 95)
+MIN_SEGMENT_SECONDS = 10.0
+
+def _timestamp_seconds(value: Any) -> float:
+    """Epoch seconds from an ISO string or epoch seconds/milliseconds"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value / 1000 if value > 1e11 else float(value)
+    raise ValueError('timestamp must be an ISO string or epoch number')
+
+def parse_points(points: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Time-ordered (t, lat, lng) arrays from raw points
+
+    Points may use lat/lng or latitude/longitude keys. Raises ValueError for
+    unusable input.
+    """
+    if not isinstance(points, list) or len(points) < 2:
+        raise ValueError('gps_points must be a list of at least 2 points')
+
+    t = np.empty(len(points))
+    lat = np.empty(len(points))
+    lng = np.empty(len(points))
+    for i, point in enumerate(points):
+        try:
+            t[i] = _timestamp_seconds(point['timestamp'])
+            lat[i] = point['lat'] if 'lat' in point else point['latitude']
+            lng[i] = point['lng'] if 'lng' in point else point['longitude']
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'gps_points[{i}] needs a timestamp and lat/lng')
+
+    order = np.argsort(t, kind='stable')
+    return t[order], lat[order], lng[order]
+
+def _group_mean(values: np.ndarray, groups: np.ndarray, count: int) -> np.ndarray:
+    sums = np.bincount(groups, weights=values, minlength=count)
+    sizes = np.bincount(groups, minlength=count)
+    return np.divide(sums, sizes, out=np.zeros(count), where=sizes > 0)
+
+def _group_percentiles(values: np.ndarray, groups: np.ndarray, count: int,
+                       percentiles) -> Dict[int, np.ndarray]:
+    """Linear-interpolated percentiles of values within each group"""
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    sizes = np.bincount(groups, minlength=count)
+    starts = np.cumsum(sizes) - sizes
+    last = np.maximum(sizes - 1, 0)
+
+    result = {}
+    for q in percentiles:
+        position = last * (q / 100)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        fraction = position - low
+        valid = sizes > 0
+        lo_values = np.zeros(count)
+        hi_values = np.zeros(count)
+        lo_values[valid] = ordered[(starts + low)[valid]]
+        hi_values[valid] = ordered[(starts + high)[valid]]
+        result[q] = lo_values + (hi_values - lo_values) * fraction
+    return result
+
+def extract_segment_features(points: List[Dict],
+                             segment_seconds: Optional[float] = None) -> Dict[str, List]:
+    """
+    Per-segment features from raw GPS points in one vectorized pass
+
+    Args:
+        points: Raw points with timestamp and lat/lng
+        segment_seconds: Segment length, at least MIN_SEGMENT_SECONDS; None
+            treats the trace as one segment
+
+    Returns:
+        Columnar features, one entry per non-empty segment. Speeds are km/h,
+        acceleration m/s^2, jerk m/s^3, heading change deg/s, stop frequency
+        stops per 10 minutes and dwell ratio the share of time stopped.
+    """
+    if segment_seconds is not None and not (
+            np.isfinite(segment_seconds) and segment_seconds >= MIN_SEGMENT_SECONDS):
+        raise ValueError(f'segment_seconds must be at least {MIN_SEGMENT_SECONDS}')
+    t, lat, lng = parse_points(points)
+
+    # Intervals between consecutive fixes; repeated timestamps are dropped
+    dt = np.diff(t)
+    keep = dt > 0
+    distance = haversine_array(lat[:-1], lng[:-1], lat[1:], lng[1:])[keep]  # meters
+    start = t[:-1][keep]
+    dt = dt[keep]
+    if not dt.size:
+        raise ValueError('gps_points must span more than one timestamp')
+
+    speed_ms = distance / dt
+    speed = speed_ms * 3.6
+    moving = speed >= STOP_SPEED
+
+    if segment_seconds is not None:
+        # Number occupied segments densely, so gaps in the trace cost nothing
+        _, segment = np.unique(((start - start[0]) // segment_seconds).astype(np.int64),
+                               return_inverse=True)
+        segment = segment.ravel()
+    else:
+        segment = np.zeros(dt.size, dtype=np.int64)
+    count = int(segment[-1]) + 1
+
+    # Acceleration and jerk between consecutive intervals
+    mid_dt = (dt[:-1] + dt[1:]) / 2
+    acceleration = np.diff(speed_ms) / mid_dt
+    jerk = np.diff(acceleration) / ((mid_dt[:-1] + mid_dt[1:]) / 2)
+
+    # Heading change between consecutive moving intervals
+    lat_r, lng_r = np.radians(lat[:-1][keep]), np.radians(lng[:-1][keep])
+    lat2_r, lng2_r = np.radians(lat[1:][keep]), np.radians(lng[1:][keep])
+    bearing = np.degrees(np.arctan2(
+        np.sin(lng2_r - lng_r) * np.cos(lat2_r),
+        np.cos(lat_r) * np.sin(lat2_r) - np.sin(lat_r) * np.cos(lat2_r) * np.cos(lng2_r - lng_r)
+    ))
+    turn = np.abs((np.diff(bearing) + 180) % 360 - 180)
+    turn_rate = np.where(moving[:-1] & moving[1:], turn / mid_dt, 0)
+
+    # Stop episodes begin where a stopped interval follows a moving one or
+    # opens a segment
+    stopped = ~moving
+    episode = stopped & np.concatenate(([True], moving[:-1] | (np.diff(segment) > 0)))
+
+    duration = np.bincount(segment, weights=dt, minlength=count)
+    total_distance = np.bincount(segment, weights=distance, minlength=count)
+    stopped_time = np.bincount(segment, weights=dt * stopped, minlength=count)
+    stops = np.bincount(segment, weights=episode, minlength=count)
+    intervals = np.bincount(segment, minlength=count)
+    percentiles = _group_percentiles(speed, segment, count, SPEED_PERCENTILES)
+    speed_max = np.zeros(count)
+    np.maximum.at(speed_max, segment, speed)
+
+    present = intervals > 0
+    first = np.flatnonzero(np.diff(segment, prepend=-1) != 0)  # segment is non-decreasing
+    features = {
+        'segment_start': start[first],
+        'points': intervals + 1,
+        'distance': total_distance,
+        'duration': duration,
+        'speed_mean': np.divide(total_distance * 3.6, duration, out=np.zeros(count), where=duration > 0),
+        'speed_max': speed_max,
+        'acceleration_mean': _group_mean(np.abs(acceleration), segment[1:], count),
+        'jerk_mean': _group_mean(np.abs(jerk), segment[2:], count),
+        'heading_change_rate': _group_mean(turn_rate, segment[1:], count),
+        'stop_frequency': np.divide(stops * 600, duration, out=np.zeros(count), where=duration > 0),
+        'dwell_ratio': np.divide(stopped_time, duration, out=np.zeros(count), where=duration > 0)
+    }
+    for q, values in percentiles.items():
+        features[f'speed_p{q}'] = values
+
+    return {
+        name: (values if name == 'segment_start' else values[present]).tolist()
+        for name, values in features.items()
+    }
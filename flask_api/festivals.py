@@ -0,0 +1,145 @@
+"""
+Festival Calendar Module
+Dated Kerala festivals with a precomputed per-day index for predictors
+"""
+
+import os
+import json
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Dict, List, Any, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def to_ordinals(dates) -> np.ndarray:
+    """Proleptic Gregorian ordinals of ISO strings, dates or datetimes; ValueError on a missing date"""
+    days = np.array(dates, dtype='datetime64[D]')
+    if np.isnat(days).any():
+        raise ValueError('missing date')
+    return days.astype(np.int64) + EPOCH_ORDINAL
+
+class FestivalCalendar:
+    """Festivals as arrays sorted by start date
+
+    Each festival spans start..end (inclusive) and has a surge weight in
+    [0, 1] for how strongly it shifts travel. A day index over the covered
+    range holds, per day, the strongest active festival, its surge and the
+    days until the next festival starts, so predictors score festival
+    effects with array lookups.
+    """
+
+    def __init__(self, festivals: List[Dict[str, Any]]):
+        records = sorted(festivals, key=lambda f: (f['start'], f['name']))
+        self.names = [f['name'] for f in records]
+        self.types = [f.get('type', 'other') for f in records]
+        self.type_names = sorted(set(self.types))
+        self.type_ids = np.array([self.type_names.index(t) for t in self.types], dtype=np.int64)
+        self.starts = to_ordinals([f['start'] for f in records])
+        self.ends = to_ordinals([f.get('end', f['start']) for f in records])
+        self.surge = np.array([float(f.get('surge', 1.0)) for f in records])
+        if (self.ends < self.starts).any():
+            raise ValueError('festival ends before it starts')
+        self._starts = self.starts.tolist()  # for bisect
+        self.max_span = int((self.ends - self.starts).max()) if records else 0
+        self._build_day_index()
+
+    @classmethod
+    def from_file(cls, path: str) -> 'FestivalCalendar':
+        """Load a JSON list of {name, type, start, end?, surge?} with ISO dates"""
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _build_day_index(self):
+        if not len(self):
+            self.first = 0
+            self.day_festival = np.full(0, -1, dtype=np.int64)
+            self.day_surge = np.zeros(0)
+            self.day_next = np.zeros(0, dtype=np.int64)
+            return
+        self.first = int(self.starts.min())
+        days = int(self.ends.max()) - self.first + 1
+        self.day_festival = np.full(days, -1, dtype=np.int64)
+        self.day_surge = np.zeros(days)
+        for i in range(len(self)):
+            span = slice(self.starts[i] - self.first, self.ends[i] - self.first + 1)
+            stronger = self.surge[i] > self.day_surge[span]
+            self.day_festival[span][stronger] = i
+            self.day_surge[span][stronger] = self.surge[i]
+        self.day_next = self._days_to_next(np.arange(self.first, self.first + days))
+
+    def _days_to_next(self, ordinals: np.ndarray) -> np.ndarray:
+        """Days until the next festival starts on or after each day, -1 if none"""
+        following = np.searchsorted(self.starts, ordinals, side='left')
+        known = following < len(self)
+        result = np.full(ordinals.size, -1, dtype=np.int64)
+        result[known] = self.starts[following[known]] - ordinals[known]
+        return result
+
+    def features(self, dates) -> Dict[str, np.ndarray]:
+        """
+        Festival features per date
+
+        Returns:
+            festival (index of the strongest active festival, -1 for none),
+            festival_type (index into type_names, -1 for none), surge and
+            days_to_festival (-1 when the calendar has no later festival)
+        """
+        ordinals = to_ordinals(dates).ravel()
+        offsets = ordinals - self.first
+        inside = (offsets >= 0) & (offsets < self.day_surge.size)
+
+        festival = np.full(ordinals.size, -1, dtype=np.int64)
+        surge = np.zeros(ordinals.size)
+        festival[inside] = self.day_festival[offsets[inside]]
+        surge[inside] = self.day_surge[offsets[inside]]
+        days_to = np.where(offsets < 0, self.first - ordinals, -1) if len(self) else festival.copy()
+        days_to[inside] = self.day_next[offsets[inside]]
+
+        return {
+            'festival': festival,
+            'festival_type': np.where(festival >= 0, self.type_ids[festival], -1) if len(self) else festival,
+            'surge': surge,
+            'days_to_festival': days_to
+        }
+
+    def upcoming(self, today: Optional[date] = None, days: int = 365) -> List[Dict[str, Any]]:
+        """Festivals ongoing today or starting within the next days, soonest first"""
+        today = today or datetime.now().date()
+        t = today.toordinal()
+        # Festivals that started up to max_span days ago may still be ongoing
+        lo = bisect_left(self._starts, t - self.max_span)
+        hi = bisect_right(self._starts, t + days)
+        return [self._record(i, t) for i in range(lo, hi) if self.ends[i] >= t]
+
+    def _record(self, i: int, today: int) -> Dict[str, Any]:
+        start = date.fromordinal(int(self.starts[i]))
+        return {
+            'name': self.names[i],
+            'type': self.types[i],
+            'month': start.month,
+            'date': start.isoformat(),
+            'end_date': date.fromordinal(int(self.ends[i])).isoformat(),
+            'days_until': max(0, int(self.starts[i]) - today),
+            'ongoing': int(self.starts[i]) <= today
+        }
+
+def load_festival_calendar(path: Optional[str] = None) -> FestivalCalendar:
+    """Load the festival calendar, empty when the file is missing or invalid"""
+    path = path or os.getenv(
+        'FESTIVALS_FILE',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'festivals.json')
+    )
+    try:
+        calendar = FestivalCalendar.from_file(path)
+        logger.info(f"Loaded {len(calendar)} festivals")
+        return calendar
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Festival calendar load error: {str(e)}")
+        return FestivalCalendar([])
@@ -0,0 +1,444 @@
+"""
+Geofence Module
+Server-side geofence sets with a grid spatial index
+"""
+
+import os
+import uuid
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+
+from cache import TTLCache
+from services import DatabaseService, haversine_array
+
+logger = logging.getLogger(__name__)
+
+METERS_PER_DEGREE = 111320.0
+EMPTY = np.empty(0, dtype=np.int64)
+
+# Limits on client-defined fence sets, so one request cannot build an
+# arbitrarily large index
+MAX_FENCES = 10000
+MAX_POLYGON_VERTICES = 10000
+MAX_RADIUS_M = 100000
+MIN_CELL_SIZE = 0.001  # degrees
+MAX_CELL_SIZE = 1.0
+
+# =====================
+# Grid Index
+# =====================
+
+class GridIndex:
+    """Multi-level lat/lng grid mapping each cell to the items whose bounding box overlaps it
+
+    Level k has cells of cell_size * LEVEL_FACTOR**k degrees. Each item is
+    bucketed at the finest level where its bounding box spans at most
+    MAX_ITEM_CELLS cells, so a district-sized polygon among small depot
+    circles lands in a coarse level instead of expanding into thousands of
+    fine cells, and the index never holds more than items * MAX_ITEM_CELLS
+    entries.
+    """
+
+    LEVEL_FACTOR = 8
+    MAX_ITEM_CELLS = 16
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size  # degrees, finest level
+        self.levels: List[Tuple[float, Dict[Tuple[int, int], np.ndarray]]] = []
+
+    @property
+    def cell_count(self) -> int:
+        return sum(len(cells) for _, cells in self.levels)
+
+    def build(self, min_lats: np.ndarray, min_lngs: np.ndarray,
+              max_lats: np.ndarray, max_lngs: np.ndarray):
+        """Bucket item bounding boxes into grid cells"""
+        self.levels = []
+        pending = np.arange(len(min_lats))
+        size = self.cell_size
+        while pending.size:
+            rows_lo = np.floor(min_lats[pending] / size).astype(np.int64)
+            rows_hi = np.floor(max_lats[pending] / size).astype(np.int64)
+            cols_lo = np.floor(min_lngs[pending] / size).astype(np.int64)
+            cols_hi = np.floor(max_lngs[pending] / size).astype(np.int64)
+            n_rows, n_cols = rows_hi - rows_lo + 1, cols_hi - cols_lo + 1
+            # Once a cell covers the globe every item fits
+            fits = (n_rows * n_cols <= self.MAX_ITEM_CELLS) | (size >= 360)
+
+            counts = (n_rows * n_cols)[fits]
+            items = np.repeat(pending[fits], counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            width = np.repeat(n_cols[fits], counts)
+            rows = np.repeat(rows_lo[fits], counts) + offsets // width
+            cols = np.repeat(cols_lo[fits], counts) + offsets % width
+
+            cells = {}
+            if items.size:
+                order = np.lexsort((cols, rows))
+                rows, cols, items = rows[order], cols[order], items[order]
+                bounds = np.flatnonzero((np.diff(rows) != 0) | (np.diff(cols) != 0)) + 1
+                for part in np.split(np.arange(items.size), bounds):
+                    cells[(int(rows[part[0]]), int(cols[part[0]]))] = items[part]
+            self.levels.append((size, cells))
+
+            pending = pending[~fits]
+            size *= self.LEVEL_FACTOR
+
+    def _level_pairs(self, size: float, cells: Dict[Tuple[int, int], np.ndarray],
+                     lats: np.ndarray, lngs: np.ndarray) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        rows = np.floor(lats / size).astype(np.int64)
+        cols = np.floor(lngs / size).astype(np.int64)
+
+        if rows.size == 1:
+            items = cells.get((int(rows[0]), int(cols[0])), EMPTY)
+            return [np.zeros(items.size, dtype=np.int64)], [items]
+
+        # Look up each distinct cell once; trips revisit the same cells
+        keys, inverse = np.unique(np.column_stack([rows, cols]), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.cumsum(np.bincount(inverse, minlength=len(keys)))
+
+        point_parts, item_parts = [], []
+        start = 0
+        for (row, col), end in zip(keys.tolist(), bounds.tolist()):
+            items = cells.get((row, col))
+            if items is not None:
+                points = order[start:end]
+                point_parts.append(np.repeat(points, items.size))
+                item_parts.append(np.tile(items, points.size))
+            start = end
+        return point_parts, item_parts
+
+    def candidate_pairs(self, lats: np.ndarray, lngs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(point index, item index) pairs for items whose bounding box may contain each point"""
+        point_parts, item_parts = [], []
+        for size, cells in self.levels:
+            if cells:
+                points, items = self._level_pairs(size, cells, lats, lngs)
+                point_parts.extend(points)
+                item_parts.extend(items)
+
+        if not point_parts:
+            return EMPTY, EMPTY
+        return np.concatenate(point_parts), np.concatenate(item_parts)
+
+# =====================
+# Fence Set
+# =====================
+
+class FenceSet:
+    """Immutable, indexed collection of circular and polygon geofences"""
+
+    MAX_BANDS = 4096     # latitude bands per polygon edge table
+    BAND_ENTRIES = 32    # band/edge entries allowed per polygon edge
+    PAIR_CHUNK = 65536   # (point, polygon) pairs per ray-casting pass
+
+    def __init__(self, set_id: str, fences: List[Dict], cell_size: Optional[float] = None,
+                 user_id: Optional[str] = None):
+        self.id = set_id
+        self.user_id = user_id  # owner; only they can query the set
+        self.fences = [self._normalize(fence, i) for i, fence in enumerate(fences)]
+        count = len(self.fences)
+
+        self.is_polygon = np.array([f['type'] == 'polygon' for f in self.fences], dtype=bool)
+        self.center_lats = np.array([f.get('center_lat', np.nan) for f in self.fences], dtype=float)
+        self.center_lngs = np.array([f.get('center_lng', np.nan) for f in self.fences], dtype=float)
+        self.radii = np.array([f.get('radius', 0) for f in self.fences], dtype=float)  # meters
+
+        # Bounding boxes for prefiltering; polygons fill theirs in below
+        lat_pad = self.radii / METERS_PER_DEGREE
+        lng_pad = self.radii / (METERS_PER_DEGREE * np.maximum(np.cos(np.radians(self.center_lats)), 0.01))
+        self.min_lats = self.center_lats - lat_pad
+        self.max_lats = self.center_lats + lat_pad
+        self.min_lngs = self.center_lngs - lng_pad
+        self.max_lngs = self.center_lngs + lng_pad
+
+        self.band_lat0 = np.zeros(count)
+        self.band_height = np.ones(count)
+        self.band_count = np.ones(count, dtype=np.int64)
+        self.band_base = np.zeros(count, dtype=np.int64)
+        self._build_edge_tables()
+
+        # Sets stored before cell sizes were validated may carry any value
+        cell_size = float(np.clip(cell_size, MIN_CELL_SIZE, MAX_CELL_SIZE)) if cell_size else None
+        self.index = GridIndex(cell_size or self._default_cell_size())
+        self.index.build(self.min_lats, self.min_lngs, self.max_lats, self.max_lngs)
+
+    @staticmethod
+    def _normalize(fence: Dict, position: int) -> Dict[str, Any]:
+        """Canonical stored form of a fence"""
+        normalized = {
+            'id': fence.get('id', str(position)),
+            'name': fence.get('name'),
+            'type': fence.get('type', 'circle')
+        }
+        if normalized['type'] == 'polygon':
+            normalized['polygon'] = [[float(lat), float(lng)] for lat, lng in fence['polygon']]
+        else:
+            normalized['center_lat'] = fence['center_lat']
+            normalized['center_lng'] = fence['center_lng']
+            normalized['radius'] = fence.get('radius', 100)
+        return normalized
+
+    def _build_edge_tables(self):
+        """Precompute polygon bounding boxes and latitude-banded edge tables
+
+        Edges of each polygon are bucketed into horizontal bands, so a ray cast
+        from a point only tests the edges of the band containing its latitude.
+        Bands of all polygons share one CSR layout: band_offsets/band_edges.
+        """
+        x0_parts, y0_parts, x1_parts, y1_parts = [], [], [], []
+        band_offsets = [0]
+        band_edges = []
+        edge_count = 0
+
+        for i in np.flatnonzero(self.is_polygon):
+            ring = np.array(self.fences[i]['polygon'], dtype=float)
+            y0, x0 = ring[:, 0], ring[:, 1]
+            y1, x1 = np.roll(y0, -1), np.roll(x0, -1)  # closes the ring
+
+            self.min_lats[i], self.max_lats[i] = y0.min(), y0.max()
+            self.min_lngs[i], self.max_lngs[i] = x0.min(), x0.max()
+
+            # Edges spanning many bands (spiky shapes) would make the table
+            # quadratic; halve the bands until it fits the entry budget
+            bands = int(min(max(1, len(ring) // 4), self.MAX_BANDS))
+            while True:
+                height = (self.max_lats[i] - self.min_lats[i]) / bands or 1.0
+                low = np.clip(((np.minimum(y0, y1) - self.min_lats[i]) // height).astype(np.int64), 0, bands - 1)
+                high = np.clip(((np.maximum(y0, y1) - self.min_lats[i]) // height).astype(np.int64), 0, bands - 1)
+                spans = high - low + 1
+                if bands == 1 or spans.sum() <= self.BAND_ENTRIES * len(ring):
+                    break
+                bands //= 2
+
+            # Edges of each band, in edge order, as one CSR slice per band
+            edges = np.repeat(np.arange(len(ring)), spans)
+            band_of = np.repeat(low, spans) + np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+            order = np.argsort(band_of, kind='stable')
+            ends = np.cumsum(np.bincount(band_of, minlength=bands))
+
+            self.band_lat0[i] = self.min_lats[i]
+            self.band_height[i] = height
+            self.band_count[i] = bands
+            self.band_base[i] = len(band_offsets) - 1
+            band_offsets.extend((len(band_edges) + ends).tolist())
+            band_edges.extend((edge_count + edges[order]).tolist())
+
+            x0_parts.append(x0)
+            y0_parts.append(y0)
+            x1_parts.append(x1)
+            y1_parts.append(y1)
+            edge_count += len(ring)
+
+        self.edge_x0 = np.concatenate(x0_parts) if x0_parts else np.empty(0)
+        self.edge_y0 = np.concatenate(y0_parts) if y0_parts else np.empty(0)
+        self.edge_y1 = np.concatenate(y1_parts) if y1_parts else np.empty(0)
+        edge_x1 = np.concatenate(x1_parts) if x1_parts else np.empty(0)
+        dy = self.edge_y1 - self.edge_y0
+        # Horizontal edges never cross a horizontal ray, so their slope is unused
+        self.edge_dxdy = np.divide(edge_x1 - self.edge_x0, dy, out=np.zeros_like(dy), where=dy != 0)
+        self.band_offsets = np.array(band_offsets, dtype=np.int64)
+        self.band_edges = np.array(band_edges, dtype=np.int64)
+
+    def _default_cell_size(self) -> float:
+        """Size cells to the typical fence so most fences span a few cells"""
+        if not self.fences:
+            return 0.01
+        extent = np.median(np.maximum(self.max_lats - self.min_lats, self.max_lngs - self.min_lngs))
+        return float(np.clip(extent, MIN_CELL_SIZE, 0.5))
+
+    def _in_polygons(self, lats: np.ndarray, lngs: np.ndarray, fences: np.ndarray) -> np.ndarray:
+        """Even-odd ray casting for (point, polygon) pairs"""
+        inside = np.empty(fences.size, dtype=bool)
+
+        for start in range(0, fences.size, self.PAIR_CHUNK):
+            chunk = slice(start, start + self.PAIR_CHUNK)
+            lat, lng, fence = lats[chunk], lngs[chunk], fences[chunk]
+
+            # Edges of the band holding each point's latitude
+            bands = np.clip(
+                ((lat - self.band_lat0[fence]) // self.band_height[fence]).astype(np.int64),
+                0, self.band_count[fence] - 1
+            )
+            slots = self.band_base[fence] + bands
+            firsts = self.band_offsets[slots]
+            counts = self.band_offsets[slots + 1] - firsts
+            pair = np.repeat(np.arange(fence.size), counts)
+            positions = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                         + np.repeat(firsts, counts))
+            edges = self.band_edges[positions]
+
+            y, x = lat[pair], lng[pair]
+            y0, y1 = self.edge_y0[edges], self.edge_y1[edges]
+            crosses = ((y0 > y) != (y1 > y)) & (x < self.edge_x0[edges] + (y - y0) * self.edge_dxdy[edges])
+            inside[chunk] = np.bincount(pair, weights=crosses, minlength=fence.size) % 2 == 1
+
+        return inside
+
+    def query_many(self, lats, lngs) -> Tuple[np.ndarray, np.ndarray]:
+        """(point index, fence index) pairs for every fence containing each point"""
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+
+        points, fences = self.index.candidate_pairs(lats, lngs)
+        if not points.size:
+            return points, fences
+
+        lat, lng = lats[points], lngs[points]
+        in_bbox = (
+            (self.min_lats[fences] <= lat) & (lat <= self.max_lats[fences]) &
+            (self.min_lngs[fences] <= lng) & (lng <= self.max_lngs[fences])
+        )
+        points, fences, lat, lng = points[in_bbox], fences[in_bbox], lat[in_bbox], lng[in_bbox]
+
+        # Exact tests only for candidates
+        inside = np.zeros(points.size, dtype=bool)
+        polygon = self.is_polygon[fences]
+        circle = np.flatnonzero(~polygon)
+        if circle.size:
+            distances = haversine_array(lat[circle], lng[circle],
+                                        self.center_lats[fences[circle]], self.center_lngs[fences[circle]])
+            inside[circle] = distances <= self.radii[fences[circle]]
+        polygon = np.flatnonzero(polygon)
+        if polygon.size:
+            inside[polygon] = self._in_polygons(lat[polygon], lng[polygon], fences[polygon])
+
+        return points[inside], fences[inside]
+
+    def query(self, lat: float, lng: float) -> List[int]:
+        """Indexes of the fences containing the point"""
+        _, fences = self.query_many([lat], [lng])
+        return sorted(fences.tolist())
+
+    def __len__(self) -> int:
+        return len(self.fences)
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _valid_lat_lng(lat: Any, lng: Any) -> bool:
+    return _is_number(lat) and _is_number(lng) and -90 <= lat <= 90 and -180 <= lng <= 180
+
+def validate_fences(fences: Any) -> Optional[str]:
+    """Return an error message for an unusable fence list, None if valid"""
+    if not isinstance(fences, list) or not fences:
+        return 'fences must be a non-empty list'
+    if len(fences) > MAX_FENCES:
+        return f'at most {MAX_FENCES} fences per set'
+    for i, fence in enumerate(fences):
+        if not isinstance(fence, dict):
+            return f'fence {i} must be an object'
+        fence_type = fence.get('type', 'circle')
+        if fence_type == 'polygon':
+            polygon = fence.get('polygon')
+            if not isinstance(polygon, list) or not 3 <= len(polygon) <= MAX_POLYGON_VERTICES:
+                return f'fence {i}: polygon must be a list of 3 to {MAX_POLYGON_VERTICES} [lat, lng] vertices'
+            for vertex in polygon:
+                if not isinstance(vertex, list) or len(vertex) != 2 or not _valid_lat_lng(*vertex):
+                    return f'fence {i}: polygon vertices must be [lat, lng] pairs within range'
+        elif fence_type == 'circle':
+            if not _valid_lat_lng(fence.get('center_lat'), fence.get('center_lng')):
+                return f'fence {i}: center_lat and center_lng must be numbers within range'
+            radius = fence.get('radius', 100)
+            if not _is_number(radius) or not 0 < radius <= MAX_RADIUS_M:
+                return f'fence {i}: radius must be a positive number up to {MAX_RADIUS_M} m'
+        else:
+            return f'fence {i}: type must be circle or polygon'
+    return None
+
+def validate_cell_size(cell_size: Any) -> Optional[str]:
+    """Return an error message for an unusable grid cell size, None if valid or unset"""
+    if cell_size is None:
+        return None
+    if not _is_number(cell_size) or not MIN_CELL_SIZE <= cell_size <= MAX_CELL_SIZE:
+        return f'cell_size must be a number of degrees between {MIN_CELL_SIZE} and {MAX_CELL_SIZE}'
+    return None
+
+# =====================
+# Geofence Service
+# =====================
+
+class GeofenceService:
+    """Registry of server-side geofence sets"""
+
+    def __init__(self, db_service: Optional[DatabaseService] = None):
+        self.db_service = db_service or DatabaseService()
+        # Built sets are immutable, so caching them per worker is safe
+        self.fence_sets = TTLCache(
+            max_size=int(os.getenv('GEOFENCE_CACHE_SETS', 100)),
+            ttl=float(os.getenv('GEOFENCE_CACHE_TTL', 3600))
+        )
+        logger.info("Geofence Service initialized")
+
+    def is_ready(self) -> bool:
+        return True
+
+    def register_fence_set(self, fences: List[Dict], user_id: str,
+                           name: Optional[str] = None,
+                           cell_size: Optional[float] = None) -> FenceSet:
+        """Index and store a new fence set"""
+        fence_set = FenceSet(str(uuid.uuid4()), fences, cell_size, user_id)
+
+        self.db_service.store_fence_set({
+            'id': fence_set.id,
+            'name': name,
+            'user_id': user_id,
+            'cell_size': fence_set.index.cell_size,
+            'fences': fence_set.fences,
+            'created_at': datetime.now().isoformat()
+        })
+        self.fence_sets.set(fence_set.id, fence_set)
+
+        logger.info(f"Registered fence set {fence_set.id} with {len(fence_set)} fences")
+        return fence_set
+
+    def get_fence_set(self, set_id: str, user_id: str) -> Optional[FenceSet]:
+        """Get a user's fence set, building its index on first use in this worker"""
+        fence_set = self.fence_sets.get(set_id)
+        if fence_set is None:
+            doc = self.db_service.get_fence_set(set_id, user_id)
+            if not doc:
+                return None
+            fence_set = FenceSet(doc['id'], doc['fences'], doc.get('cell_size'), doc.get('user_id'))
+            self.fence_sets.set(set_id, fence_set)
+        return fence_set if fence_set.user_id == user_id else None
+
+    def classify_points(self, set_id: str, user_id: str, lats: List[float],
+                        lngs: List[float]) -> Optional[Dict[str, Any]]:
+        """Fence memberships for many points in one pass, None if the user has no such set"""
+        fence_set = self.get_fence_set(set_id, user_id)
+        if fence_set is None:
+            return None
+
+        points, fences = fence_set.query_many(lats, lngs)
+        memberships = [[] for _ in range(len(lats))]
+        for point, fence in zip(points.tolist(), fences.tolist()):
+            memberships[point].append(fence_set.fences[fence]['id'])
+
+        counts = np.bincount(fences, minlength=len(fence_set))
+        return {
+            'memberships': memberships,
+            'summary': {
+                fence_set.fences[i]['id']: int(counts[i]) for i in np.flatnonzero(counts)
+            }
+        }
+
+    def check_fence_set(self, set_id: str, user_id: str, location: Dict) -> Optional[List[Dict]]:
+        """Fences of a set that contain the location, None if the user has no such set"""
+        fence_set = self.get_fence_set(set_id, user_id)
+        if fence_set is None:
+            return None
+
+        return [
+            {
+                'fence_id': fence_set.fences[i]['id'],
+                'name': fence_set.fences[i]['name'],
+                'is_inside': True
+            }
+            for i in fence_set.query(location['lat'], location['lng'])
+        ]
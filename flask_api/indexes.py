@@ -0,0 +1,204 @@
+"""
+Index Module
+Declared MongoDB indexes for DatabaseService queries and query plan checks
+
+Create the indexes, or check them and the plans of the queries that rely on
+them, from the command line:
+    python indexes.py ensure
+    python indexes.py verify
+"""
+
+import sys
+import json
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True)
+    ],
+    'trips': [
+        IndexModel([('id', ASCENDING)], name='id_unique', unique=True),
+        IndexModel([('user_id', ASCENDING), ('start_time', DESCENDING), ('id', DESCENDING)],
+                   name='user_id_start_time_id'),
+        IndexModel([('start_time', ASCENDING)], name='start_time')
+    ],
+    'locations': [
+        IndexModel([('trip_id', ASCENDING), ('timestamp', ASCENDING)], name='trip_id_timestamp'),
+        IndexModel([('timestamp', ASCENDING)], name='timestamp'),
+        IndexModel([('user_id', ASCENDING), ('timestamp', ASCENDING)], name='user_id_timestamp')
+    ],
+    'gamification': [
+        IndexModel([('user_id', ASCENDING)], name='user_id'),
+        IndexModel([('points', DESCENDING)], name='points')
+    ],
+    'geofence_sets': [
+        IndexModel([('id', ASCENDING)], name='id_unique', unique=True)
+    ],
+    'export_jobs': [
+        IndexModel([('id', ASCENDING)], name='id_unique', unique=True),
+        # One queued or running job per export key, however many workers race
+        # to submit it; $in in a partial filter needs MongoDB 6.0
+        IndexModel([('key', ASCENDING)], name='key_active_unique', unique=True,
+                   partialFilterExpression={'status': {'$in': ['queued', 'running']}}),
+        IndexModel([('user_id', ASCENDING), ('status', ASCENDING)], name='user_id_status'),
+        IndexModel([('status', ASCENDING), ('updated_at', ASCENDING)], name='status_updated_at'),
+        IndexModel([('expires_at', ASCENDING)], name='expires_at')
+    ]
+}
+
+def ensure_indexes(db) -> Dict[str, Any]:
+    """Create every declared index; indexes that already exist are left as they are
+
+    A collection whose indexes cannot be built (duplicate values under a
+    unique index, a conflicting index of the same name, no server) is
+    reported under errors without stopping the others.
+    """
+    created, errors = {}, {}
+    for collection, models in INDEXES.items():
+        try:
+            created[collection] = db[collection].create_indexes(models)
+        except PyMongoError as e:
+            logger.error(f"Index creation error on {collection}: {str(e)}")
+            errors[collection] = str(e)
+    if not errors:
+        logger.info(f"Indexes ensured on {len(created)} collections")
+    return {'created': created, 'errors': errors}
+
+def index_keys(collection: str, name: str) -> List[Tuple[str, int]]:
+    """Keys of a declared index"""
+    for model in INDEXES.get(collection, []):
+        if model.document['name'] == name:
+            return list(model.document['key'].items())
+    raise KeyError(f'{collection}.{name} is not declared')
+
+def _conjuncts(query: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The filter as one condition set per $or branch"""
+    common = {field: value for field, value in query.items() if field != '$or'}
+    return [dict(common, **branch) for branch in query.get('$or') or [{}]]
+
+def _is_equality(value: Any) -> bool:
+    return not (isinstance(value, dict) and any(key.startswith('$') for key in value))
+
+def check_shape(shape: Dict[str, Any]) -> List[str]:
+    """
+    Problems that keep a query shape's declared index from serving it
+
+    For every $or branch: equality fields must form the leading index keys,
+    the sort (past those fields) must follow the next keys all in index order
+    or all reversed, and the first index key must be bounded by the filter
+    or the sort. An empty list means the index fits without a collection
+    scan or an in-memory sort.
+    """
+    keys = index_keys(shape['collection'], shape['index'])
+    fields = [field for field, _ in keys]
+    problems = []
+    for conditions in _conjuncts(shape['filter']):
+        equality = {field for field, value in conditions.items() if _is_equality(value)}
+        prefix = fields[:len(equality)]
+        if set(prefix) != equality:
+            problems.append(f"equality fields {sorted(equality)} are not the leading keys of {shape['index']}")
+            continue
+
+        sort = [(field, direction) for field, direction in shape.get('sort') or [] if field not in equality]
+        following = keys[len(equality):len(equality) + len(sort)]
+        if [field for field, _ in following] != [field for field, _ in sort] or \
+                len({direction == key for (_, direction), (_, key) in zip(sort, following)}) > 1:
+            problems.append(f"sort {sort} does not follow {shape['index']} after its equality keys")
+
+        first = fields[0]
+        if first not in conditions and not (shape.get('sort') and shape['sort'][0][0] == first):
+            problems.append(f"{shape['index']} leading key {first} is not bounded by the filter or sort")
+    return problems
+
+def _plan_stages(plan: Any, stages: List[Dict[str, Any]]):
+    """Collect every stage of an explain() plan tree"""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append({'stage': plan['stage'], 'index': plan.get('indexName')})
+        for value in plan.values():
+            _plan_stages(value, stages)
+    elif isinstance(plan, list):
+        for value in plan:
+            _plan_stages(value, stages)
+
+def _explain(db, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """explain() output of a query shape, None where the backend cannot explain"""
+    cursor = db[query['collection']].find(query['filter'])
+    if query.get('sort'):
+        cursor = cursor.sort(query['sort'])
+    try:
+        return cursor.explain()
+    except (AttributeError, NotImplementedError):
+        return None  # mongomock has no query planner
+
+def verify_indexes(db, shapes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Check declared indexes exist with the declared keys, that each query
+    shape fits its index, and that the server plans it as an index scan on
+    that index without an in-memory sort
+
+    Args:
+        shapes: {collection, filter, sort?, index} of the queries the
+            services send, as built by DatabaseService.query_shapes
+
+    Returns:
+        ok, missing (collection.index names) and one result per query shape.
+        planned is None when the backend cannot explain; such a shape is not
+        verified, so ok is False.
+    """
+    missing = []
+    for collection, models in INDEXES.items():
+        existing = db[collection].index_information()
+        for model in models:
+            name = model.document['name']
+            keys = list(model.document['key'].items())
+            if name not in existing or list(existing[name]['key']) != keys:
+                missing.append(f'{collection}.{name}')
+
+    plans = []
+    for query in shapes:
+        explain = _explain(db, query)
+        result = {'collection': query['collection'], 'filter': query['filter'],
+                  'index': query['index'], 'problems': check_shape(query), 'planned': None}
+        if explain is not None:
+            stages = []
+            _plan_stages(explain.get('queryPlanner', {}).get('winningPlan', {}), stages)
+            names = [s['stage'] for s in stages]
+            result['stages'] = names
+            result['planned'] = (
+                any(s['index'] == query['index'] for s in stages)
+                and 'COLLSCAN' not in names
+                and not (query.get('sort') and 'SORT' in names)
+            )
+        plans.append(result)
+
+    return {
+        'ok': not missing and all(p['planned'] is True and not p['problems'] for p in plans),
+        'verified': all(p['planned'] is not None for p in plans),
+        'missing': missing,
+        'plans': plans
+    }
+
+if __name__ == '__main__':
+    from services import DatabaseService
+
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'ensure'
+    db_service = DatabaseService()
+
+    if command == 'ensure':
+        result = ensure_indexes(db_service.db)
+        print(json.dumps(result, indent=2))
+        sys.exit(1 if result['errors'] else 0)
+    elif command == 'verify':
+        result = verify_indexes(db_service.db, db_service.query_shapes())
+        print(json.dumps(result, indent=2, default=str))
+        sys.exit(0 if result['ok'] else 1)
+    else:
+        print('usage: python indexes.py [ensure|verify]')
+        sys.exit(2)
@@ -9,30 +9,68 @@ from datetime import datetime
 import json
 import pickle
 import os
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Optional, Tuple
 import logging
 
+from features import extract_segment_features
+from festivals import load_festival_calendar, to_ordinals
+from model_registry import ModelRegistry
+from routing import load_road_graph
+from speed_profiles import hour_of_week, load_speed_profiles
+from trip_detection import TripDetectionEngine
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Purpose mix of trips on festival days, by festival type
+FESTIVAL_PURPOSES = {
+    'religious': {'religious': 0.6, 'social': 0.2, 'tourism': 0.2},
+    'temple': {'religious': 0.5, 'tourism': 0.3, 'social': 0.2},
+    'ritual': {'religious': 0.5, 'tourism': 0.3, 'social': 0.2},
+    'harvest': {'social': 0.4, 'shopping': 0.3, 'leisure': 0.2, 'religious': 0.1},
+    'new_year': {'social': 0.3, 'religious': 0.3, 'shopping': 0.2, 'leisure': 0.2},
+    'sport': {'tourism': 0.5, 'leisure': 0.5},
+    'cultural': {'leisure': 0.4, 'social': 0.3, 'tourism': 0.3}
+}
+
+# Purpose rule time buckets: from 6:00 up to each bound (inclusive), then
+# everything after the last bound or before 6:00
+PURPOSE_HOUR_START = 6
+PURPOSE_HOUR_BOUNDS = np.array([10, 12, 14, 17, 20], dtype=float)
+# An hour and weekday inside each bucket and day class (weekday, Friday, weekend)
+PURPOSE_BUCKET_HOURS = [8, 11, 13, 15, 18, 22]
+PURPOSE_CLASS_DAYS = [0, 4, 5]
+
 class MLService:
     def __init__(self):
         """Initialize ML Service"""
-        self.models = {}
+        self.models = ModelRegistry(os.getenv('MODEL_DIR', 'models'))
         self.load_models()
+        self.trip_detector = TripDetectionEngine(
+            window_size=int(os.getenv('TRIP_WINDOW_SIZE', 30)),
+            start_dwell=float(os.getenv('TRIP_START_DWELL', 30)),
+            stop_dwell=float(os.getenv('TRIP_STOP_DWELL', 120)),
+            idle_timeout=float(os.getenv('TRIP_IDLE_TIMEOUT', 1800)),
+            max_users=int(os.getenv('TRIP_MAX_USERS', 100000))
+        )
+        # Memory-mapped, so loading is cheap and pages are shared by workers
+        self.road_graph = load_road_graph(os.getenv('ROAD_GRAPH_DIR', 'road_graph'))
+        self.speed_profiles = load_speed_profiles(os.getenv('SPEED_PROFILES_DIR', 'speed_profiles'))
+        if self.road_graph is not None and self.speed_profiles is not None:
+            self.road_graph.attach_profiles(self.speed_profiles)
+        self.festivals = load_festival_calendar()
+        self._festival_mixes: Dict[Tuple[str, ...], np.ndarray] = {}
         logger.info("ML Service initialized")
     
     def load_models(self):
-        """Load pre-trained models"""
-        # In production, these would load actual trained models
-        # For now, we'll use simulated models
-        self.models = {
-            'trip_detector': self._create_trip_detector(),
-            'mode_classifier': self._create_mode_classifier(),
-            'purpose_predictor': self._create_purpose_predictor(),
-            'companion_detector': self._create_companion_detector(),
-            'route_predictor': self._create_route_predictor()
-        }
+        """Register models; each is loaded on first use"""
+        # Trained artifacts in MODEL_DIR (<name>.joblib) take precedence over
+        # the built-in simulated models
+        self.models.register('trip_detector', self._create_trip_detector)
+        self.models.register('mode_classifier', self._create_mode_classifier)
+        self.models.register('purpose_predictor', self._create_purpose_predictor)
+        self.models.register('companion_detector', self._create_companion_detector)
+        self.models.register('route_predictor', self._create_route_predictor)
     
     def _create_trip_detector(self):
         """Create trip detection model"""
@@ -45,21 +83,125 @@ class MLService:
     
     def _create_mode_classifier(self):
         """Create transportation mode classifier"""
+        classes = ['walk', 'bicycle', 'car', 'bus', 'train', 'auto', 'boat', 'airplane']
+        
+        # Mode priors per speed band (<5, <15, <40, <80, >=80 km/h), listed in
+        # tie-break order
+        band_priors = [
+            {'walk': 0.8, 'bicycle': 0.1, 'car': 0.1},
+            {'bicycle': 0.6, 'walk': 0.2, 'auto': 0.2},
+            {'auto': 0.4, 'car': 0.3, 'bus': 0.3},
+            {'car': 0.5, 'bus': 0.3, 'train': 0.2},
+            {'train': 0.6, 'car': 0.3, 'airplane': 0.1}
+        ]
+        stop_boost = {'bus': 0.2, 'auto': 0.1}  # frequent stops
+        
+        index = {mode: i for i, mode in enumerate(classes)}
+        priors = np.zeros((len(band_priors), len(classes)))
+        order = []
+        for band, prior in enumerate(band_priors):
+            for mode, p in prior.items():
+                priors[band, index[mode]] = p
+            ranked = list(prior) + [m for m in stop_boost if m not in prior]
+            order.append([index[m] for m in ranked] + [index[m] for m in classes if m not in ranked])
+        
         return {
             'type': 'cnn_xgboost',
             'accuracy': 0.918,
-            'classes': ['walk', 'bicycle', 'car', 'bus', 'train', 'auto', 'boat', 'airplane']
+            'classes': classes,
+            'speed_bands': np.array([5, 15, 40, 80], dtype=float),
+            'band_priors': priors,
+            'band_order': np.array(order),
+            'stop_threshold': 5,
+            'stop_boost': np.array([stop_boost.get(m, 0) for m in classes])
         }
     
     def _create_purpose_predictor(self):
         """Create trip purpose predictor"""
+        purposes = ['work', 'education', 'shopping', 'leisure', 'healthcare', 
+                    'social', 'religious', 'tourism', 'business', 'home', 'other']
+        modes = self._create_mode_classifier()['classes'] + ['unknown']
+        
+        # Dense time bucket x day class table of normalized purpose
+        # probabilities, with the winning purpose per cell resolved in the
+        # rules' tie-break order. keys marks the purposes the rules name in a
+        # cell (some with zero weight) and order lists them first, in the
+        # order the rules add them.
+        index = {purpose: i for i, purpose in enumerate(purposes)}
+        shape = (len(PURPOSE_BUCKET_HOURS), len(PURPOSE_CLASS_DAYS))
+        table = np.zeros(shape + (len(purposes),))
+        best = np.zeros(shape, dtype=np.int64)
+        keys = np.zeros(shape + (len(purposes),), dtype=bool)
+        order = np.zeros(shape + (len(purposes),), dtype=np.int64)
+        for bucket, hour in enumerate(PURPOSE_BUCKET_HOURS):
+            for day_class, day in enumerate(PURPOSE_CLASS_DAYS):
+                prior = self._purpose_prior(hour, day)
+                total = sum(prior.values())
+                for purpose, p in prior.items():
+                    table[bucket, day_class, index[purpose]] = p / total
+                    keys[bucket, day_class, index[purpose]] = True
+                best[bucket, day_class] = index[max(prior, key=prior.get)]
+                named = [index[purpose] for purpose in prior]
+                order[bucket, day_class] = named + [i for i in range(len(purposes)) if i not in named]
+        
+        # The rule set has no mode term, so every mode shares the time prior;
+        # trained artifacts can supply a mode-specific table of the same shape
         return {
             'type': 'transformer',
             'accuracy': 0.885,
-            'purposes': ['work', 'education', 'shopping', 'leisure', 'healthcare', 
-                        'social', 'religious', 'tourism', 'business', 'home', 'other']
+            'purposes': purposes,
+            'modes': modes,
+            'table': np.broadcast_to(table[:, :, None, :], shape + (len(modes), len(purposes))),
+            'best': np.broadcast_to(best[:, :, None], shape + (len(modes),)),
+            'keys': keys,
+            'order': order,
+            'festival_purposes': FESTIVAL_PURPOSES
         }
     
+    @staticmethod
+    def _purpose_cells(times, days) -> Tuple[np.ndarray, np.ndarray]:
+        """Time bucket and day class of each trip, on the rules' own boundaries"""
+        times = np.asarray(times, dtype=float)
+        days = np.asarray(days, dtype=float)
+        buckets = np.where(
+            times < PURPOSE_HOUR_START,
+            len(PURPOSE_HOUR_BOUNDS),
+            np.searchsorted(PURPOSE_HOUR_BOUNDS, times, side='left')
+        )
+        day_classes = np.where(days >= 5, 2, np.where(days == 4, 1, 0))
+        return buckets.astype(np.int64), day_classes.astype(np.int64)
+    
+    @staticmethod
+    def _purpose_prior(hour: int, day_of_week: int) -> Dict[str, float]:
+        """Unnormalized purpose weights for an hour and weekday, in tie-break order"""
+        # Time-based predictions
+        if 6 <= hour <= 10:
+            probabilities = {'work': 0.4, 'education': 0.3, 'business': 0.2, 'other': 0.1}
+        elif 10 <= hour <= 12:
+            probabilities = {'shopping': 0.3, 'business': 0.3, 'healthcare': 0.2, 'other': 0.2}
+        elif 12 <= hour <= 14:
+            probabilities = {'home': 0.3, 'leisure': 0.3, 'social': 0.2, 'other': 0.2}
+        elif 14 <= hour <= 17:
+            probabilities = {'business': 0.3, 'shopping': 0.2, 'education': 0.2, 'other': 0.3}
+        elif 17 <= hour <= 20:
+            probabilities = {'home': 0.5, 'leisure': 0.2, 'shopping': 0.2, 'other': 0.1}
+        else:
+            probabilities = {'home': 0.4, 'leisure': 0.3, 'social': 0.2, 'other': 0.1}
+        
+        # Weekend adjustments
+        if day_of_week >= 5:  # Saturday or Sunday
+            probabilities['leisure'] = probabilities.get('leisure', 0) + 0.2
+            probabilities['tourism'] = probabilities.get('tourism', 0) + 0.15
+            probabilities['religious'] = probabilities.get('religious', 0) + 0.1
+            probabilities['work'] = probabilities.get('work', 0) * 0.3
+            probabilities['education'] = probabilities.get('education', 0) * 0.1
+        
+        # Kerala-specific: Religious activities on specific days
+        if day_of_week == 4:  # Friday
+            probabilities['religious'] = probabilities.get('religious', 0) + 0.1
+        
+        return probabilities
+    
     def _create_companion_detector(self):
         """Create companion detection model"""
         return {
@@ -79,58 +221,46 @@ class MLService:
         """Check if ML service is ready"""
         return len(self.models) > 0
     
-    def detect_trip(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    def detect_trip(self, data: Dict[str, Any], user_id: str) -> Dict[str, Any]:
         """
         Detect if a trip has started or ended
         
         Args:
             data: GPS and sensor data
+            user_id: User the fix belongs to
         
         Returns:
             Trip detection result
         """
         try:
             # Extract features
-            speed = data.get('speed', 0)
+            speed = data.get('speed') or 0
             lat = data.get('lat')
             lng = data.get('lng')
-            accuracy = data.get('accuracy', 10)
+            accuracy = data.get('accuracy') or 10
             accelerometer = data.get('accelerometer', {})
-            
-            # Simple trip detection logic
-            # In production, use actual ML model
-            is_moving = speed > 2  # km/h threshold
-            good_accuracy = accuracy < 20  # meters
+            timestamp = data.get('timestamp') or datetime.now().isoformat()
             
             # Check accelerometer if available
+            acc_magnitude = None
             if accelerometer:
-                acc_magnitude = np.sqrt(
+                acc_magnitude = float(np.sqrt(
                     accelerometer.get('x', 0)**2 + 
                     accelerometer.get('y', 0)**2 + 
                     accelerometer.get('z', 0)**2
-                )
-                is_accelerating = acc_magnitude > 0.5
-            else:
-                is_accelerating = False
-            
-            trip_detected = is_moving and good_accuracy
-            confidence = 0.95 if trip_detected else 0.1
-            
-            # Determine event type
-            if trip_detected:
-                event_type = 'trip_start' if not hasattr(self, 'last_trip_state') else 'trip_continue'
-            else:
-                event_type = 'trip_end' if hasattr(self, 'last_trip_state') and self.last_trip_state else 'idle'
+                ))
             
-            self.last_trip_state = trip_detected
+            result = self.trip_detector.update(
+                user_id,
+                datetime.fromisoformat(timestamp).timestamp(),
+                speed, accuracy, acc_magnitude
+            )
             
             return {
-                'trip_detected': trip_detected,
-                'event_type': event_type,
-                'confidence': confidence,
+                **result,
                 'speed': speed,
                 'location': {'lat': lat, 'lng': lng},
-                'timestamp': datetime.now().isoformat()
+                'timestamp': timestamp
             }
             
         except Exception as e:
@@ -148,55 +278,134 @@ class MLService:
             Mode classification result
         """
         try:
-            speed = features.get('speed', 0)
-            acceleration = features.get('acceleration', 0)
-            stop_frequency = features.get('stop_frequency', 0)
-            
-            # Simple rule-based classification
-            # In production, use actual ML model
-            modes = self.models['mode_classifier']['classes']
-            probabilities = {}
-            
-            if speed < 5:
-                probabilities = {'walk': 0.8, 'bicycle': 0.1, 'car': 0.1}
-            elif speed < 15:
-                probabilities = {'bicycle': 0.6, 'walk': 0.2, 'auto': 0.2}
-            elif speed < 40:
-                probabilities = {'auto': 0.4, 'car': 0.3, 'bus': 0.3}
-            elif speed < 80:
-                probabilities = {'car': 0.5, 'bus': 0.3, 'train': 0.2}
-            else:
-                probabilities = {'train': 0.6, 'car': 0.3, 'airplane': 0.1}
-            
-            # Adjust for stop frequency
-            if stop_frequency > 5:
-                probabilities['bus'] = probabilities.get('bus', 0) + 0.2
-                probabilities['auto'] = probabilities.get('auto', 0) + 0.1
-            
-            # Normalize probabilities
-            total = sum(probabilities.values())
-            probabilities = {k: v/total for k, v in probabilities.items()}
-            
-            # Get top mode
-            mode = max(probabilities, key=probabilities.get)
-            confidence = probabilities[mode]
+            # Raw GPS points take precedence over client-computed features
+            segment = None
+            if features.get('gps_points'):
+                segment = {k: v[0] for k, v in extract_segment_features(features['gps_points']).items()}
+                features = {
+                    'speed': segment['speed_mean'],
+                    'acceleration': segment['acceleration_mean'],
+                    'stop_frequency': segment['stop_frequency']
+                }
+            
+            batch = self.classify_transport_mode_batch(
+                [features.get('speed') or 0],
+                [features.get('acceleration') or 0],
+                [features.get('stop_frequency') or 0]
+            )
+            
+            # The modes the rules name, in the order they add them
+            classes = batch['classes']
+            row = batch['probabilities'][0]
+            probabilities = {
+                classes[i]: float(row[i]) for i in batch['order'][0].tolist() if batch['emitted'][0][i]
+            }
             
             # Add Kerala-specific modes
             if 'boat' not in probabilities:
                 probabilities['boat'] = 0.0
             
-            return {
-                'mode': mode,
-                'confidence': confidence,
+            result = {
+                'mode': classes[batch['modes'][0]],
+                'confidence': float(batch['confidence'][0]),
                 'probabilities': probabilities,
                 'features_used': ['speed', 'acceleration', 'stop_frequency'],
                 'timestamp': datetime.now().isoformat()
             }
+            if segment:
+                result['segment_features'] = segment
+            
+            return result
             
         except Exception as e:
             logger.error(f"Mode classification error: {str(e)}")
             raise
     
+    def classify_segments(self, gps_points: List[Dict],
+                          segment_seconds: float = 300) -> Dict[str, Any]:
+        """
+        Split raw GPS points into time segments and classify each one
+        
+        Args:
+            gps_points: Raw points with timestamp and lat/lng
+            segment_seconds: Segment length
+        
+        Returns:
+            Segment features plus the batch classification result
+        """
+        segments = extract_segment_features(gps_points, segment_seconds)
+        result = self.classify_transport_mode_batch(
+            segments['speed_mean'], segments['acceleration_mean'], segments['stop_frequency']
+        )
+        result['segment_features'] = segments
+        return result
+    
+    def classify_transport_mode_batch(self, speed, acceleration=None,
+                                      stop_frequency=None) -> Dict[str, np.ndarray]:
+        """
+        Classify transportation mode for many segments at once
+        
+        Args:
+            speed: Segment speeds (km/h)
+            acceleration: Segment accelerations (accepted for parity; the
+                current rule set does not weight them)
+            stop_frequency: Stops per segment
+        
+        Returns:
+            classes, probabilities (N x classes), modes (class indexes),
+            confidence, and per segment the class order and emitted mask of
+            the modes the rules name
+        """
+        model = self.models['mode_classifier']
+        if not isinstance(model, dict):
+            return self._classify_with_estimator(model, speed, acceleration, stop_frequency)
+        
+        speed = np.asarray(speed, dtype=float)
+        stops = np.zeros_like(speed) if stop_frequency is None else np.asarray(stop_frequency, dtype=float)
+        
+        bands = np.digitize(speed, model['speed_bands'])
+        stopping = (stops > model['stop_threshold'])[:, None]
+        probabilities = model['band_priors'][bands]
+        emitted = (probabilities > 0) | (stopping & (model['stop_boost'] > 0))
+        probabilities += stopping * model['stop_boost']
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        
+        # Break ties in each band's prior order
+        order = model['band_order'][bands]
+        ranked = np.take_along_axis(probabilities, order, axis=1)
+        best = ranked.argmax(axis=1)
+        rows = np.arange(speed.size)
+        
+        return {
+            'classes': model['classes'],
+            'probabilities': probabilities,
+            'modes': order[rows, best],
+            'confidence': ranked[rows, best],
+            'order': order,
+            'emitted': emitted
+        }
+    
+    def _classify_with_estimator(self, estimator, speed, acceleration,
+                                 stop_frequency) -> Dict[str, Any]:
+        """Classify segments with a trained estimator exposing predict_proba"""
+        speed = np.asarray(speed, dtype=float)
+        features = np.column_stack([
+            speed,
+            np.zeros_like(speed) if acceleration is None else np.asarray(acceleration, dtype=float),
+            np.zeros_like(speed) if stop_frequency is None else np.asarray(stop_frequency, dtype=float)
+        ])
+        probabilities = estimator.predict_proba(features)
+        modes = probabilities.argmax(axis=1)
+        
+        return {
+            'classes': [str(c) for c in estimator.classes_],
+            'probabilities': probabilities,
+            'modes': modes,
+            'confidence': probabilities[np.arange(speed.size), modes],
+            'order': np.broadcast_to(np.arange(probabilities.shape[1]), probabilities.shape),
+            'emitted': np.ones(probabilities.shape, dtype=bool)
+        }
+    
     def predict_trip_purpose(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Predict trip purpose
@@ -208,46 +417,46 @@ class MLService:
             Purpose prediction result
         """
         try:
-            time = context.get('time', datetime.now().hour)
-            day_of_week = context.get('day_of_week', datetime.now().weekday())
+            now = datetime.now()
+            time = context.get('time')
+            time = now.hour if time is None else time
+            day_of_week = context.get('day_of_week')
+            # A trip date drives festival effects; without one it is today
+            # unless only the weekday is known
+            trip_date = context.get('date')
+            if trip_date is None and day_of_week is None:
+                trip_date = now.date().isoformat()
+            ordinal = int(to_ordinals([trip_date])[0]) if trip_date is not None else None
+            if day_of_week is None:
+                day_of_week = (ordinal - 1) % 7
             mode = context.get('mode', 'unknown')
             duration = context.get('duration', 0)
             
-            purposes = self.models['purpose_predictor']['purposes']
-            probabilities = {}
-            
-            # Time-based predictions
-            if 6 <= time <= 10:
-                probabilities = {'work': 0.4, 'education': 0.3, 'business': 0.2, 'other': 0.1}
-            elif 10 <= time <= 12:
-                probabilities = {'shopping': 0.3, 'business': 0.3, 'healthcare': 0.2, 'other': 0.2}
-            elif 12 <= time <= 14:
-                probabilities = {'home': 0.3, 'leisure': 0.3, 'social': 0.2, 'other': 0.2}
-            elif 14 <= time <= 17:
-                probabilities = {'business': 0.3, 'shopping': 0.2, 'education': 0.2, 'other': 0.3}
-            elif 17 <= time <= 20:
-                probabilities = {'home': 0.5, 'leisure': 0.2, 'shopping': 0.2, 'other': 0.1}
-            else:
-                probabilities = {'home': 0.4, 'leisure': 0.3, 'social': 0.2, 'other': 0.1}
-            
-            # Weekend adjustments
-            if day_of_week >= 5:  # Saturday or Sunday
-                probabilities['leisure'] = probabilities.get('leisure', 0) + 0.2
-                probabilities['tourism'] = probabilities.get('tourism', 0) + 0.15
-                probabilities['religious'] = probabilities.get('religious', 0) + 0.1
-                probabilities['work'] = probabilities.get('work', 0) * 0.3
-                probabilities['education'] = probabilities.get('education', 0) * 0.1
-            
-            # Kerala-specific: Religious activities on specific days
-            if day_of_week == 4:  # Friday
-                probabilities['religious'] = probabilities.get('religious', 0) + 0.1
-            
-            # Normalize
-            total = sum(probabilities.values())
-            probabilities = {k: v/total for k, v in probabilities.items()}
-            
-            # Get top purpose
-            purpose = max(probabilities, key=probabilities.get)
+            # Derive missing trip context from raw GPS points
+            if context.get('gps_points') and (not duration or not mode or mode == 'unknown'):
+                segment = {k: v[0] for k, v in extract_segment_features(context['gps_points']).items()}
+                duration = duration or round(segment['duration'] / 60, 1)  # minutes
+                if not mode or mode == 'unknown':
+                    mode = self.classify_transport_mode({'gps_points': context['gps_points']})['mode']
+            
+            # Single table cell lookup
+            model = self.models['purpose_predictor']
+            bucket, day_class = self._purpose_cells([time], [day_of_week])
+            cell = (int(bucket[0]), int(day_class[0]), self._mode_id(model, mode))
+            purposes = model['purposes']
+            row, best = model['table'][cell][None, :], model['best'][cell][None]
+            festival = None
+            if ordinal is not None:
+                row, best, features = self._festival_adjust(model, row, best, [trip_date])
+                if features['festival'][0] >= 0:
+                    festival = self.festivals.names[features['festival'][0]]
+            # The purposes the rules name, plus any a festival adds
+            named = model['keys'][cell[:2]] if 'keys' in model else np.ones(len(purposes), dtype=bool)
+            order = model['order'][cell[:2]] if 'order' in model else np.arange(len(purposes))
+            probabilities = {
+                purposes[i]: float(row[0][i]) for i in order.tolist() if named[i] or row[0][i] > 0
+            }
+            purpose = purposes[best[0]]
             confidence = probabilities[purpose]
             
             return {
@@ -258,7 +467,9 @@ class MLService:
                     'time_of_day': time,
                     'day_of_week': day_of_week,
                     'mode': mode,
-                    'duration': duration
+                    'duration': duration,
+                    'date': trip_date,
+                    'festival': festival
                 },
                 'timestamp': datetime.now().isoformat()
             }
@@ -267,6 +478,90 @@ class MLService:
             logger.error(f"Purpose prediction error: {str(e)}")
             raise
     
+    @staticmethod
+    def _mode_id(model: Dict[str, Any], mode: Any) -> int:
+        """Mode axis index in a purpose table; unknown modes share one slot"""
+        modes = model['modes']
+        return modes.index(mode) if mode in modes else len(modes) - 1
+    
+    def predict_trip_purpose_batch(self, times, days=None, modes=None, dates=None) -> Dict[str, Any]:
+        """
+        Predict trip purpose for many trips with one table lookup
+        
+        Args:
+            times: Hour of day per trip (fractional hours allowed)
+            days: Day of week per trip (0 = Monday); derived from dates if omitted
+            modes: Transport mode per trip; unknown modes use the shared prior
+            dates: ISO date per trip, for festival effects
+        
+        Returns:
+            purposes, probabilities (N x purposes), best (purpose indexes),
+            confidence and festival (calendar indexes, -1 for none; only
+            with dates)
+        
+        Raises:
+            ValueError: A date is missing or not an ISO date
+        """
+        model = self.models['purpose_predictor']
+        if days is None:
+            days = (to_ordinals(dates) - 1) % 7
+        buckets, day_classes = self._purpose_cells(times, days)
+        
+        if modes is None:
+            mode_ids = np.full(buckets.size, self._mode_id(model, 'unknown'))
+        else:
+            mode_ids = np.array([self._mode_id(model, m) for m in modes], dtype=np.int64)
+        
+        probabilities = model['table'][buckets, day_classes, mode_ids]
+        best = model['best'][buckets, day_classes, mode_ids]
+        
+        result = {'purposes': model['purposes']}
+        if dates is not None:
+            probabilities, best, features = self._festival_adjust(model, probabilities, best, dates)
+            result['festival'] = features['festival']
+        
+        result.update({
+            'probabilities': probabilities,
+            'best': best,
+            'confidence': probabilities[np.arange(buckets.size), best]
+        })
+        return result
+    
+    def _festival_mix(self, model: Dict[str, Any]) -> np.ndarray:
+        """Purpose mix per calendar festival type, normalized; zero rows for unmapped types"""
+        purposes = tuple(model['purposes'])
+        mix = self._festival_mixes.get(purposes)
+        if mix is None:
+            mixes = model.get('festival_purposes', {})
+            mix = np.zeros((len(self.festivals.type_names), len(purposes)))
+            for row, festival_type in enumerate(self.festivals.type_names):
+                for purpose, weight in mixes.get(festival_type, {}).items():
+                    if purpose in purposes:
+                        mix[row, purposes.index(purpose)] = weight
+            totals = mix.sum(axis=1, keepdims=True)
+            mix = np.divide(mix, totals, out=np.zeros_like(mix), where=totals > 0)
+            self._festival_mixes[purposes] = mix
+        return mix
+    
+    def _festival_adjust(self, model: Dict[str, Any], probabilities: np.ndarray,
+                         best: np.ndarray, dates) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        """Blend each festival day's purpose mix into its probabilities by the festival's surge"""
+        features = self.festivals.features(dates)
+        mixes = self._festival_mix(model)
+        # Festivals whose type has no purpose mix leave the table untouched
+        active = np.flatnonzero(features['surge'] > 0)
+        active = active[mixes[features['festival_type'][active]].sum(axis=1) > 0]
+        if not active.size:
+            return probabilities, best, features
+        
+        mix = mixes[features['festival_type'][active]]
+        weight = features['surge'][active, None]
+        probabilities = np.array(probabilities, dtype=float)
+        best = np.array(best)
+        probabilities[active] = (probabilities[active] + weight * mix) / (1 + weight)
+        best[active] = probabilities[active].argmax(axis=1)
+        return probabilities, best, features
+    
     def detect_companions(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Detect travel companions
@@ -336,46 +631,17 @@ class MLService:
             avoid_traffic = params.get('avoid_traffic', True)
             scenic_route = params.get('scenic_route', False)
             avoid_tolls = params.get('avoid_tolls', False)
-            
-            # Simulated route prediction
-            # In production, integrate with mapping services and ML models
-            
-            routes = []
-            
-            # Generate multiple route options
-            route_types = ['fastest', 'shortest', 'scenic']
-            
-            for route_type in route_types:
-                if route_type == 'scenic' and not scenic_route:
-                    continue
-                
-                # Simulated route
-                base_distance = 25.0  # km
-                base_duration = 45  # minutes
-                
-                if route_type == 'fastest':
-                    distance = base_distance * 1.1
-                    duration = base_duration * 0.9
-                    via = ['Highway']
-                elif route_type == 'shortest':
-                    distance = base_distance * 0.95
-                    duration = base_duration * 1.1
-                    via = ['City roads']
-                else:  # scenic
-                    distance = base_distance * 1.3
-                    duration = base_duration * 1.5
-                    via = ['Coastal road', 'Hill station']
-                
-                routes.append({
-                    'type': route_type,
-                    'distance': round(distance, 1),
-                    'duration': round(duration),
-                    'via': via,
-                    'traffic_level': 'moderate' if avoid_traffic else 'heavy',
-                    'has_tolls': not avoid_tolls and route_type == 'fastest',
-                    'scenic_score': 8 if route_type == 'scenic' else 3,
-                    'eco_score': 85 if route_type == 'shortest' else 70
-                })
+            departure = hour_of_week(params.get('departure_time') or datetime.now())
+            
+            origin_point = self._coordinates(origin)
+            destination_point = self._coordinates(destination)
+            if self.road_graph is not None and origin_point and destination_point:
+                routes = self._graph_routes(origin_point, destination_point, departure,
+                                            avoid_traffic, scenic_route, avoid_tolls)
+                engine = 'road_graph'
+            else:
+                routes = self._simulated_routes(avoid_traffic, scenic_route, avoid_tolls)
+                engine = 'simulated'
             
             # Select optimal route based on preferences
             if scenic_route:
@@ -395,6 +661,7 @@ class MLService:
                     'scenic_route': scenic_route,
                     'avoid_tolls': avoid_tolls
                 },
+                'routing_engine': engine,
                 'kerala_highlights': [
                     'Athirappilly Waterfalls viewpoint',
                     'Spice plantation visit possible',
@@ -407,6 +674,108 @@ class MLService:
             logger.error(f"Route prediction error: {str(e)}")
             raise
     
+    @staticmethod
+    def _coordinates(point: Any) -> Optional[Tuple[float, float]]:
+        """(lat, lng) from a {lat, lng}/{latitude, longitude} object or [lat, lng] pair"""
+        try:
+            if isinstance(point, dict):
+                lat = point['lat'] if 'lat' in point else point['latitude']
+                lng = point['lng'] if 'lng' in point else point['longitude']
+            elif isinstance(point, (list, tuple)) and len(point) == 2:
+                lat, lng = point
+            else:
+                return None
+            lat, lng = float(lat), float(lng)
+        except (KeyError, TypeError, ValueError):
+            return None
+        return (lat, lng) if -90 <= lat <= 90 and -180 <= lng <= 180 else None
+    
+    def _graph_routes(self, origin: Tuple[float, float], destination: Tuple[float, float],
+                      departure: int, avoid_traffic: bool, scenic_route: bool,
+                      avoid_tolls: bool) -> List[Dict]:
+        """Fastest, shortest and optionally scenic routes over the road graph
+
+        Durations are estimated for the departure hour of week, from observed
+        speed profiles when they are loaded.
+        """
+        graph = self.road_graph
+        source = graph.nearest_node(*origin)
+        target = graph.nearest_node(*destination)
+        if source is None or target is None:
+            raise ValueError('Origin or destination is not near a mapped road')
+        
+        # (type, cost metric, traffic-aware, scenic-weighted)
+        profiles = [('fastest', 'time', avoid_traffic, False), ('shortest', 'length', False, False)]
+        if scenic_route:
+            profiles.append(('scenic', 'time', avoid_traffic, True))
+        
+        summaries = []
+        for route_type, metric, traffic, scenic in profiles:
+            weights = graph.weights(metric, avoid_tolls, traffic, scenic, departure)
+            edges = graph.shortest_path(source, target, weights, metric)
+            if edges is None:
+                raise ValueError('No route between origin and destination')
+            summaries.append((route_type, graph.path_summary(edges, departure)))
+        
+        shortest = min(summary['distance'] for _, summary in summaries)
+        routes = []
+        for route_type, summary in summaries:
+            delay = summary['delay_ratio']
+            routes.append({
+                'type': route_type,
+                'distance': round(summary['distance'], 1),
+                'duration': round(summary['duration']),
+                'via': summary['via'] or ['Local roads'],
+                'traffic_level': 'low' if delay < 1.1 else 'moderate' if delay < 1.3 else 'heavy',
+                'has_tolls': summary['has_tolls'],
+                'scenic_score': round(3 + 7 * summary['scenic_share']),
+                'eco_score': round(85 * shortest / summary['distance']) if summary['distance'] else 85,
+                'geometry': summary['geometry']
+            })
+        return routes
+    
+    def _simulated_routes(self, avoid_traffic: bool, scenic_route: bool,
+                          avoid_tolls: bool) -> List[Dict]:
+        """Fixed route options used when no road graph is loaded"""
+        routes = []
+        
+        # Generate multiple route options
+        route_types = ['fastest', 'shortest', 'scenic']
+        
+        for route_type in route_types:
+            if route_type == 'scenic' and not scenic_route:
+                continue
+            
+            # Simulated route
+            base_distance = 25.0  # km
+            base_duration = 45  # minutes
+            
+            if route_type == 'fastest':
+                distance = base_distance * 1.1
+                duration = base_duration * 0.9
+                via = ['Highway']
+            elif route_type == 'shortest':
+                distance = base_distance * 0.95
+                duration = base_duration * 1.1
+                via = ['City roads']
+            else:  # scenic
+                distance = base_distance * 1.3
+                duration = base_duration * 1.5
+                via = ['Coastal road', 'Hill station']
+            
+            routes.append({
+                'type': route_type,
+                'distance': round(distance, 1),
+                'duration': round(duration),
+                'via': via,
+                'traffic_level': 'moderate' if avoid_traffic else 'heavy',
+                'has_tolls': not avoid_tolls and route_type == 'fastest',
+                'scenic_score': 8 if route_type == 'scenic' else 3,
+                'eco_score': 85 if route_type == 'shortest' else 70
+            })
+        
+        return routes
+    
     def analyze_travel_pattern(self, user_id: str, trips: List[Dict]) -> Dict[str, Any]:
         """
         Analyze user travel patterns
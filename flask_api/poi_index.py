@@ -0,0 +1,121 @@
+"""
+POI Index Module
+KD-tree over points of interest for radius and nearest-neighbour search
+"""
+
+import json
+import logging
+from typing import Dict, List, Any, Optional
+import numpy as np
+from scipy.spatial import cKDTree
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371008.8  # same mean radius as services.haversine_array
+
+def _unit_vectors(lats, lngs) -> np.ndarray:
+    """Points on the unit sphere; chord length grows monotonically with arc length"""
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lng = np.radians(np.asarray(lngs, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+def _chord(meters: float) -> float:
+    return 2 * np.sin(min(meters / EARTH_RADIUS_M, np.pi) / 2)
+
+def _arc(chords: np.ndarray) -> np.ndarray:
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.clip(chords / 2, 0, 1))
+
+class POIIndex:
+    """Immutable KD-tree of points of interest
+
+    Points are indexed as 3D unit vectors, so search is exact great-circle
+    distance with no projection error. Queries return fresh dicts, never the
+    indexed records themselves.
+    """
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.records = [dict(record) for record in records]
+        self.types = np.array([r.get('type', '') for r in self.records], dtype=object)
+        self.tree = cKDTree(_unit_vectors(
+            [r['lat'] for r in self.records], [r['lng'] for r in self.records]
+        )) if self.records else None
+
+    @classmethod
+    def from_file(cls, path: str) -> 'POIIndex':
+        """Load records from a JSON list (or {"spots": [...]}) of objects with lat/lng"""
+        with open(path) as f:
+            data = json.load(f)
+        records = data['spots'] if isinstance(data, dict) else data
+        valid = [
+            r for r in records
+            if isinstance(r.get('lat'), (int, float)) and isinstance(r.get('lng'), (int, float))
+        ]
+        if len(valid) < len(records):
+            logger.warning(f"Skipped {len(records) - len(valid)} POIs without coordinates in {path}")
+        return cls(valid)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _results(self, indexes: np.ndarray, distances: np.ndarray,
+                 spot_type: Optional[str], limit: Optional[int]) -> List[Dict[str, Any]]:
+        if spot_type:
+            keep = self.types[indexes] == spot_type
+            indexes, distances = indexes[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')[:limit]
+        return [
+            dict(self.records[i], distance=round(float(d) / 1000, 2))  # km
+            for i, d in zip(indexes[order].tolist(), distances[order].tolist())
+        ]
+
+    def within(self, lat: float, lng: float, radius: float,
+               spot_type: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Records within radius meters, nearest first"""
+        if self.tree is None:
+            return []
+        point = _unit_vectors([lat], [lng])[0]
+        # Search slightly wide so rounding cannot drop points on the boundary,
+        # then trim by exact distance
+        indexes = np.asarray(self.tree.query_ball_point(point, _chord(radius) * (1 + 1e-9)), dtype=np.int64)
+        if not indexes.size:
+            return []
+        distances = _arc(np.linalg.norm(self.tree.data[indexes] - point, axis=1))
+        inside = distances <= radius
+        return self._results(indexes[inside], distances[inside], spot_type, limit)
+
+    def nearest(self, lat: float, lng: float, k: int,
+                max_distance: Optional[float] = None,
+                spot_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """The k nearest records, optionally within max_distance meters"""
+        if self.tree is None or k <= 0:
+            return []
+        point = _unit_vectors([lat], [lng])[0]
+        bound = _chord(max_distance) if max_distance is not None else np.inf
+
+        # With a type filter, widen the search until k matching records are found
+        fetch = min(len(self), k if not spot_type else k * 4)
+        while True:
+            chords, indexes = self.tree.query(point, k=fetch, distance_upper_bound=bound)
+            chords, indexes = np.atleast_1d(chords), np.atleast_1d(indexes)
+            found = np.isfinite(chords)
+            chords, indexes = chords[found], indexes[found]
+            if not spot_type or fetch >= len(self) or indexes.size < fetch or \
+                    int((self.types[indexes] == spot_type).sum()) >= k:
+                break
+            fetch = min(len(self), fetch * 4)
+
+        return self._results(indexes.astype(np.int64), _arc(chords), spot_type, k)
+
+    def nearest_indexes(self, lats, lngs, max_distance: Optional[float] = None) -> np.ndarray:
+        """Record index nearest to each point, -1 beyond max_distance meters or without coordinates"""
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        result = np.full(lats.size, -1, dtype=np.int64)
+        valid = np.isfinite(lats) & np.isfinite(lngs)
+        if self.tree is None or not valid.any():
+            return result
+        bound = _chord(max_distance) if max_distance is not None else np.inf
+        _, indexes = self.tree.query(_unit_vectors(lats[valid], lngs[valid]), distance_upper_bound=bound)
+        result[valid] = np.where(indexes < len(self), indexes, -1)
+        return result
@@ -0,0 +1,63 @@
+"""
+Response Cache Module
+Pre-serialized JSON responses with ETag validators for endpoints whose
+payloads rarely change
+"""
+
+import hashlib
+import logging
+from typing import Any, Callable, Optional, Tuple
+from flask import Response, jsonify, request
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """Serialized response bodies and their ETags, held for a TTL
+
+    A hit skips both the service call and JSON serialization. GET and HEAD
+    requests whose If-None-Match matches the ETag get an empty 304.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.ttl = ttl
+        self.entries = TTLCache(max_size=max_size, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def entry(self, key: str, build: Callable[[], Any]) -> Tuple[bytes, str]:
+        """Serialized body and ETag for key, building the payload on a miss"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        body = jsonify(build()).get_data()
+        entry = (body, hashlib.sha1(body).hexdigest())
+        self.entries.set(key, entry)
+        return entry
+
+    def respond(self, key: str, build: Callable[[], Any],
+                max_age: Optional[int] = None) -> Response:
+        """Cached 200 response for key, or 304 when the client's copy is current"""
+        body, etag = self.entry(key, build)
+        response = Response(body, status=200, mimetype='application/json')
+        response.set_etag(etag)
+        if max_age is not None:
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+        return response.make_conditional(request)
+
+    def clear(self):
+        """Drop every cached response"""
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,675 @@
+"""
+Routing Module
+Offline road graph routing with A* over landmark (ALT) bounds
+
+Build a graph from a GeoJSON road extract (e.g. an OSM export of Kerala):
+    python routing.py kerala_roads.geojson road_graph [landmarks]
+"""
+
+import os
+import sys
+import json
+import math
+import heapq
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+
+from cache import TTLCache
+from services import EARTH_RADIUS_M, haversine_array
+from speed_profiles import HOURS_PER_WEEK
+
+logger = logging.getLogger(__name__)
+
+# Free-flow speed (km/h) and peak congestion factor per OSM highway class
+HIGHWAY_SPEEDS = {
+    'motorway': 80, 'trunk': 65, 'primary': 55, 'secondary': 45, 'tertiary': 40,
+    'unclassified': 30, 'residential': 25, 'living_street': 10, 'service': 15
+}
+HIGHWAY_CONGESTION = {
+    'motorway': 1.3, 'trunk': 1.5, 'primary': 1.4, 'secondary': 1.25, 'tertiary': 1.1
+}
+DEFAULT_SPEED = 30
+
+TOLL = 1
+SCENIC = 2
+
+TOLL_PENALTY = 5.0     # cost multiplier on toll roads when avoiding tolls
+SCENIC_FACTOR = 0.6    # cost multiplier on scenic roads for scenic routes
+
+ACTIVE_LANDMARKS = 4   # landmarks consulted per query
+TRAFFIC_HOURS_CACHED = 3  # hour-of-week congestion arrays kept per worker
+
+SNAP_CELL = 0.01       # degrees
+MAX_SNAP_DISTANCE = 5000.0  # meters
+
+GRAPH_ARRAYS = (
+    'lat', 'lng', 'indptr', 'indices', 'sources', 'length', 'time', 'congestion',
+    'flags', 'names', 'shape_indptr', 'shape_lat', 'shape_lng', 'rev_indptr', 'rev_sources', 'rev_edges', 'cell_keys', 'cell_nodes',
+    'landmarks', 'landmark_from', 'landmark_to'
+)
+
+# =====================
+# Road Graph
+# =====================
+
+class RoadGraph:
+    """Directed road graph in CSR form
+
+    Edges are sorted by source node: the out-edges of node v are
+    indptr[v]:indptr[v+1], with heads in indices. A reverse CSR over heads
+    serves the backward search. Landmark distances (to and from a few
+    far-apart nodes) are precomputed on a lower bound of every preference's
+    edge costs, so they give admissible A* bounds for all of them.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.arrays = arrays
+        self.meta = meta
+        self.name_list = meta.get('names', [])
+        for name, values in arrays.items():
+            setattr(self, name, values)
+
+        # Memoryviews index to plain Python numbers, which keeps the search
+        # loops free of NumPy scalar overhead
+        self._lat = memoryview(self.lat)
+        self._lng = memoryview(self.lng)
+        self._indptr = memoryview(self.indptr)
+        self._indices = memoryview(self.indices)
+        self._sources = memoryview(self.sources)
+        self._rev_indptr = memoryview(self.rev_indptr)
+        self._rev_sources = memoryview(self.rev_sources)
+        self._rev_edges = memoryview(self.rev_edges)
+        self._landmark_from = [memoryview(row) for row in self.landmark_from]
+        self._landmark_to = [memoryview(row) for row in self.landmark_to]
+        # float32 per-edge arrays: static costs per preference combination
+        # (at most 16), and congestion factors for the few hours of week
+        # being asked about, keyed by the profiles' hourly resolution
+        self._weights = TTLCache(max_size=16, ttl=3600)
+        self._hour_factors = TTLCache(max_size=TRAFFIC_HOURS_CACHED, ttl=3600)
+        self.profiles = None
+        self.edge_profile_rows = None
+
+    @property
+    def node_count(self) -> int:
+        return self.lat.size
+
+    @property
+    def edge_count(self) -> int:
+        return self.indices.size
+
+    # -----------------
+    # Building
+    # -----------------
+
+    @classmethod
+    def from_edges(cls, lat, lng, src, dst, speed, flags=None, congestion=None,
+                   names=None, name_list: Optional[List[str]] = None,
+                   landmarks: int = 8, contract: bool = True) -> 'RoadGraph':
+        """Build a graph from node coordinates and directed edge arrays
+
+        With contract, runs of pass-through shape nodes are merged into
+        single edges that keep the shape points as geometry, so searches only
+        visit junctions.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        edges = src.size
+        flags = np.zeros(edges, dtype=np.uint8) if flags is None else np.asarray(flags, dtype=np.uint8)
+        congestion = np.ones(edges) if congestion is None else np.asarray(congestion, dtype=float)
+        names = np.full(edges, -1) if names is None else np.asarray(names, dtype=np.int64)
+
+        length = haversine_array(lat[src], lng[src], lat[dst], lng[dst])
+        time = length / (np.asarray(speed, dtype=float) / 3.6)  # seconds
+        shapes = [[] for _ in range(edges)]
+        shape_lat, shape_lng = lat, lng
+        if contract:
+            junctions, src, dst, length, time, congestion, flags, names, shapes = _contract_chains(
+                lat.size, src, dst, length, time, congestion, flags, names
+            )
+            lat, lng = lat[junctions], lng[junctions]
+
+        order = np.argsort(src, kind='stable')
+        src, dst = src[order], dst[order]
+        shapes = [shapes[e] for e in order.tolist()]
+        shape_points = np.array([point for shape in shapes for point in shape], dtype=np.int64)
+
+        arrays = {
+            'lat': lat,
+            'lng': lng,
+            'indptr': np.concatenate(([0], np.cumsum(np.bincount(src, minlength=lat.size)))).astype(np.int64),
+            'indices': dst.astype(np.int32),
+            'sources': src.astype(np.int32),
+            'length': length[order].astype(np.float32),
+            'time': time[order].astype(np.float32),
+            'congestion': congestion[order].astype(np.float32),
+            'flags': flags[order],
+            'names': names[order].astype(np.int32),
+            'shape_indptr': np.concatenate(([0], np.cumsum([len(shape) for shape in shapes]))).astype(np.int64),
+            'shape_lat': shape_lat[shape_points],
+            'shape_lng': shape_lng[shape_points]
+        }
+
+        rev_order = np.argsort(dst, kind='stable')
+        arrays['rev_indptr'] = np.concatenate(
+            ([0], np.cumsum(np.bincount(dst, minlength=lat.size)))
+        ).astype(np.int64)
+        arrays['rev_sources'] = src[rev_order].astype(np.int32)
+        arrays['rev_edges'] = rev_order.astype(np.int32)
+
+        keys = _snap_keys(lat, lng)
+        cell_order = np.argsort(keys, kind='stable')
+        arrays['cell_keys'] = keys[cell_order]
+        arrays['cell_nodes'] = cell_order.astype(np.int32)
+
+        arrays.update(_landmark_tables(arrays, landmarks))
+        meta = {
+            'names': name_list or [],
+            'toll_penalty': TOLL_PENALTY,
+            'scenic_factor': SCENIC_FACTOR
+        }
+        return cls(arrays, meta)
+
+    @classmethod
+    def from_geojson(cls, path: str, landmarks: int = 8) -> 'RoadGraph':
+        """Build a graph from GeoJSON LineStrings with OSM highway tags
+
+        Every coordinate becomes a node, shared where lines meet. Honors the
+        highway, oneway, maxspeed, toll, scenic, name and ref properties.
+        """
+        with open(path) as f:
+            features = json.load(f)['features']
+
+        node_ids: Dict[Tuple[float, float], int] = {}
+        lats, lngs = [], []
+        src, dst, speed, flags, congestion, names = [], [], [], [], [], []
+        name_ids: Dict[str, int] = {}
+
+        def node(coord) -> int:
+            key = (round(coord[1], 7), round(coord[0], 7))
+            if key not in node_ids:
+                node_ids[key] = len(lats)
+                lats.append(key[0])
+                lngs.append(key[1])
+            return node_ids[key]
+
+        for feature in features:
+            props = feature.get('properties') or {}
+            geometry = feature.get('geometry') or {}
+            highway = props.get('highway')
+            if not highway:
+                continue
+            if geometry.get('type') == 'LineString':
+                lines = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiLineString':
+                lines = geometry['coordinates']
+            else:
+                continue
+
+            road_speed = _maxspeed(props.get('maxspeed')) or HIGHWAY_SPEEDS.get(highway, DEFAULT_SPEED)
+            road_flags = (TOLL if props.get('toll') == 'yes' else 0) | \
+                         (SCENIC if props.get('scenic') == 'yes' else 0)
+            road_congestion = HIGHWAY_CONGESTION.get(highway, 1.0)
+            label = props.get('name') or props.get('ref')
+            if label and label not in name_ids:
+                name_ids[label] = len(name_ids)
+            name_id = name_ids[label] if label else -1
+            oneway = props.get('oneway')
+
+            for line in lines:
+                ids = [node(coord) for coord in line]
+                for a, b in zip(ids[:-1], ids[1:]):
+                    if a == b:
+                        continue
+                    pairs = [(b, a)] if oneway == '-1' else [(a, b)] if oneway == 'yes' else [(a, b), (b, a)]
+                    for u, v in pairs:
+                        src.append(u)
+                        dst.append(v)
+                        speed.append(road_speed)
+                        flags.append(road_flags)
+                        congestion.append(road_congestion)
+                        names.append(name_id)
+
+        logger.info(f"Parsed {len(lats)} nodes and {len(src)} edges from {path}")
+        return cls.from_edges(lats, lngs, src, dst, speed, flags, congestion, names,
+                              list(name_ids), landmarks)
+
+    def save(self, path: str):
+        """Write the graph as uncompressed .npy arrays plus meta.json"""
+        os.makedirs(path, exist_ok=True)
+        for name in GRAPH_ARRAYS:
+            np.save(os.path.join(path, f'{name}.npy'), self.arrays[name])
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, path: str) -> 'RoadGraph':
+        """Memory-map a saved graph, so forked workers share its pages"""
+        arrays = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+            for name in GRAPH_ARRAYS
+        }
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        return cls(arrays, meta)
+
+    # -----------------
+    # Queries
+    # -----------------
+
+    def nearest_node(self, lat: float, lng: float) -> Optional[int]:
+        """Closest node within MAX_SNAP_DISTANCE, searching outward cell rings"""
+        row = math.floor((lat + 90) / SNAP_CELL)
+        col = math.floor((lng + 180) / SNAP_CELL)
+        max_ring = math.ceil(MAX_SNAP_DISTANCE / (SNAP_CELL * 111320.0 * max(math.cos(math.radians(lat)), 0.1))) + 1
+
+        for ring in range(max_ring + 1):
+            candidates = []
+            for dr in range(-ring, ring + 1):
+                lo = np.searchsorted(self.cell_keys, _cell_key(row + dr, col - ring), side='left')
+                hi = np.searchsorted(self.cell_keys, _cell_key(row + dr, col + ring), side='right')
+                candidates.append(self.cell_nodes[lo:hi])
+            nodes = np.concatenate(candidates)
+            if nodes.size:
+                distance = haversine_array(lat, lng, self.lat[nodes], self.lng[nodes])
+                best = int(distance.argmin())
+                # A node one ring further out can still be closer than this one
+                if distance[best] <= ring * SNAP_CELL * 111320.0 * math.cos(math.radians(lat)) or ring == max_ring:
+                    return int(nodes[best]) if distance[best] <= MAX_SNAP_DISTANCE else None
+        return None
+
+    def attach_profiles(self, profiles):
+        """Use observed hour-of-week speeds for traffic-aware costs
+
+        Each edge takes the profile cell of its middle shape point, or of
+        the midpoint between its junctions when it has none.
+        """
+        counts = np.diff(self.shape_indptr)
+        middle = self.shape_indptr[:-1] + counts // 2
+        has_shape = counts > 0
+        lat = (self.lat[self.sources] + self.lat[self.indices]) / 2
+        lng = (self.lng[self.sources] + self.lng[self.indices]) / 2
+        lat[has_shape] = self.shape_lat[middle[has_shape]]
+        lng[has_shape] = self.shape_lng[middle[has_shape]]
+
+        self.edge_profile_rows = profiles.rows(lat, lng)
+        self.profiles = profiles
+        self._weights.clear()
+        self._hour_factors.clear()
+        logger.info(f"Speed profiles cover {int((self.edge_profile_rows >= 0).sum())} of {self.edge_count} edges")
+
+    def congestion_factors(self, hour: Optional[int] = None, edges=None) -> np.ndarray:
+        """Travel time multipliers over free flow at an hour of week
+
+        Edges with enough observed fixes at that hour use them (never faster
+        than free flow, which keeps landmark bounds admissible); the rest use
+        their road class's static factor.
+        """
+        edges = slice(None) if edges is None else np.asarray(edges, dtype=np.int64)
+        static = np.asarray(self.congestion[edges], dtype=np.float64)
+        if self.profiles is None or hour is None:
+            return static
+        observed = self.profiles.speeds(self.edge_profile_rows[edges], hour)
+        free_flow = self.length[edges] / np.maximum(self.time[edges], 1e-6) * 3.6
+        with np.errstate(invalid='ignore'):
+            return np.where(np.isnan(observed), static, np.maximum(1.0, free_flow / observed))
+
+    def weights(self, metric: str = 'time', avoid_tolls: bool = False,
+                avoid_traffic: bool = False, scenic: bool = False,
+                hour: Optional[int] = None) -> np.ndarray:
+        """Per-edge costs (float32) for a metric ('time' or 'length') and preferences
+
+        hour (of week) only matters for avoid_traffic with speed profiles;
+        those costs are the cached static costs times the cached congestion
+        factors of that hour, built per request rather than cached per hour.
+        """
+        hourly = avoid_traffic and self.profiles is not None and hour is not None
+        key = (metric, avoid_tolls, avoid_traffic and not hourly, scenic)
+        weights = self._weights.get(key)
+        if weights is None:
+            weights = np.array(self.time if metric == 'time' else self.length, dtype=np.float32)
+            if avoid_tolls:
+                weights[(self.flags & TOLL) > 0] *= self.meta['toll_penalty']
+            if avoid_traffic and not hourly:
+                weights *= self.congestion_factors()
+            if scenic:
+                weights[(self.flags & SCENIC) > 0] *= self.meta['scenic_factor']
+            weights.flags.writeable = False
+            self._weights.set(key, weights)
+        if hourly:
+            return weights * self._factors_at(int(hour) % HOURS_PER_WEEK)
+        return weights
+
+    def _factors_at(self, hour: int) -> np.ndarray:
+        """Congestion factors of every edge at an hour of week, as float32"""
+        factors = self._hour_factors.get(hour)
+        if factors is None:
+            factors = self.congestion_factors(hour).astype(np.float32)
+            factors.flags.writeable = False
+            self._hour_factors.set(hour, factors)
+        return factors
+
+    def shortest_path(self, source: int, target: int, weights: np.ndarray,
+                      metric: str = 'time') -> Optional[List[int]]:
+        """Edge ids of a least-cost path, None if target is unreachable
+
+        Time costs use A* over landmark bounds when landmarks were built;
+        length costs use A* over straight-line distance. Without either bound
+        the search is bidirectional Dijkstra.
+        """
+        if source == target:
+            return []
+        if metric == 'length':
+            lat, lng = self._lat, self._lng
+            t_lat, t_lng = lat[target], lng[target]
+            return self._astar(source, target, weights,
+                               lambda v: _haversine(t_lat, t_lng, lat[v], lng[v]))
+        if len(self._landmark_from):
+            return self._astar(source, target, weights, self._landmark_bound(source, target))
+        return self._bidirectional(source, target, weights)
+
+    def _landmark_bound(self, source: int, target: int):
+        """ALT lower bound on the cost from any node to target"""
+        # from_landmark[v] is the cost landmark -> v, to_landmark[v] is v -> landmark
+        tables = [
+            (from_landmark, from_landmark[target], to_landmark, to_landmark[target])
+            for from_landmark, to_landmark in zip(self._landmark_from, self._landmark_to)
+            if math.isfinite(from_landmark[target]) and math.isfinite(to_landmark[target])
+        ]
+
+        # Only the landmarks with the tightest bounds at the source are used
+        tables.sort(key=lambda t: max(t[1] - t[0][source], t[2][source] - t[3]), reverse=True)
+        tables = tables[:ACTIVE_LANDMARKS]
+
+        def bound(v: int) -> float:
+            best = 0.0
+            for from_landmark, from_target, to_landmark, to_target in tables:
+                h = from_target - from_landmark[v]
+                if h > best:
+                    best = h
+                h = to_landmark[v] - to_target
+                if h > best:
+                    best = h
+            return best
+
+        return bound
+
+    def _astar(self, source: int, target: int, weights: np.ndarray, heuristic) -> Optional[List[int]]:
+        """A* search returning the path as edge ids"""
+        indptr, indices, w = self._indptr, self._indices, memoryview(weights)
+        dist = {source: 0.0}
+        parent = {source: -1}
+        heap = [(heuristic(source), 0.0, source)]
+
+        while heap:
+            _, g, v = heapq.heappop(heap)
+            if v == target:
+                return self._unwind(parent, target, forward=True)
+            if g > dist[v]:
+                continue
+            for e in range(indptr[v], indptr[v + 1]):
+                u = indices[e]
+                cost = g + w[e]
+                if cost < dist.get(u, math.inf):
+                    dist[u] = cost
+                    parent[u] = e
+                    heapq.heappush(heap, (cost + heuristic(u), cost, u))
+        return None
+
+    def _bidirectional(self, source: int, target: int, weights: np.ndarray) -> Optional[List[int]]:
+        """Bidirectional Dijkstra returning the path as edge ids"""
+        w = memoryview(weights)
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: -1}, {target: -1})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        best, meet = math.inf, -1
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            d, v = heapq.heappop(heaps[side])
+            if d > dist[side][v]:
+                continue
+            if side == 0:
+                neighbours = ((self._indices[e], e) for e in range(self._indptr[v], self._indptr[v + 1]))
+            else:
+                neighbours = ((self._rev_sources[k], self._rev_edges[k])
+                              for k in range(self._rev_indptr[v], self._rev_indptr[v + 1]))
+            here, there = dist[side], dist[1 - side]
+            for u, e in neighbours:
+                cost = d + w[e]
+                if cost < here.get(u, math.inf):
+                    here[u] = cost
+                    parent[side][u] = e
+                    heapq.heappush(heaps[side], (cost, u))
+                    if u in there and cost + there[u] < best:
+                        best, meet = cost + there[u], u
+
+        if meet < 0:
+            return None
+        return self._unwind(parent[0], meet, forward=True) + \
+            self._unwind(parent[1], meet, forward=False)[::-1]
+
+    def _unwind(self, parent: Dict[int, int], node: int, forward: bool) -> List[int]:
+        """Edge ids from a search root to node (forward) or node to root (backward)"""
+        edges = []
+        e = parent[node]
+        while e >= 0:
+            edges.append(e)
+            node = self._sources[e] if forward else self._indices[e]
+            e = parent[node]
+        return edges[::-1] if forward else edges
+
+    def path_summary(self, edges: List[int], hour: Optional[int] = None) -> Dict[str, Any]:
+        """Distance, duration at an hour of week and road attributes along a path"""
+        edges = np.asarray(edges, dtype=np.int64)
+        length = self.length[edges].astype(float)
+        time = self.time[edges].astype(float)
+        congested = time * self.congestion_factors(hour, edges)
+        flags = self.flags[edges]
+        names = self.names[edges]
+
+        # Longest named roads along the route, in order of first use
+        named = names >= 0
+        totals = np.bincount(names[named], weights=length[named], minlength=len(self.name_list)) \
+            if named.any() else np.zeros(0)
+        top = set(np.argsort(totals)[::-1][:2].tolist()) if totals.size else set()
+        via = []
+        for name_id in names[named].tolist():
+            if name_id in top and self.name_list[name_id] not in via:
+                via.append(self.name_list[name_id])
+
+        # Junctions joined by each edge's shape points
+        geometry = [(float(self.lat[self.sources[edges[0]]]), float(self.lng[self.sources[edges[0]]]))] \
+            if edges.size else []
+        for e in edges.tolist():
+            lo, hi = self.shape_indptr[e], self.shape_indptr[e + 1]
+            geometry.extend(zip(self.shape_lat[lo:hi].tolist(), self.shape_lng[lo:hi].tolist()))
+            head = self.indices[e]
+            geometry.append((float(self.lat[head]), float(self.lng[head])))
+        total_time = float(time.sum())
+        return {
+            'distance': float(length.sum()) / 1000,
+            'duration': float(congested.sum()) / 60,
+            'free_flow_duration': total_time / 60,
+            'delay_ratio': float(congested.sum()) / total_time if total_time else 1.0,
+            'has_tolls': bool((flags & TOLL).any()),
+            'scenic_share': float(length[(flags & SCENIC) > 0].sum() / length.sum()) if length.sum() else 0.0,
+            'via': via,
+            'geometry': [[round(lat, 6), round(lng, 6)] for lat, lng in geometry]
+        }
+
+# =====================
+# Helpers
+# =====================
+
+def _maxspeed(value: Any) -> Optional[float]:
+    """km/h from an OSM maxspeed tag such as '50' or '30 mph'"""
+    if value is None:
+        return None
+    try:
+        parts = str(value).split()
+        speed = float(parts[0])
+        return speed * 1.609 if len(parts) > 1 and parts[1] == 'mph' else speed
+    except (ValueError, IndexError):
+        return None
+
+def _haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in meters between two points"""
+    lat1, lat2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+def _contract_chains(nodes: int, src: np.ndarray, dst: np.ndarray, length: np.ndarray,
+                     time: np.ndarray, congestion: np.ndarray, flags: np.ndarray,
+                     names: np.ndarray):
+    """Merge runs of pass-through nodes into single junction-to-junction edges
+
+    A node passes through when it joins exactly two neighbours, its edges
+    continue to the other neighbour (one way or both ways) and all of them
+    share flags and names. Returns the kept junction node ids, merged edge
+    arrays in renumbered ids and the interior (shape) node ids of each edge.
+    """
+    src_list, dst_list = src.tolist(), dst.tolist()
+    attrs = list(zip(flags.tolist(), names.tolist()))
+    out_edges = [[] for _ in range(nodes)]
+    in_edges = [[] for _ in range(nodes)]
+    for e, (u, v) in enumerate(zip(src_list, dst_list)):
+        out_edges[u].append(e)
+        in_edges[v].append(e)
+
+    def passes_through(v: int) -> bool:
+        outs, ins = out_edges[v], in_edges[v]
+        if not outs or len(outs) > 2 or len(outs) != len(ins):
+            return False
+        heads = {dst_list[e] for e in outs}
+        tails = {src_list[e] for e in ins}
+        if len(outs) == 1:
+            if heads == tails:
+                return False
+        elif heads != tails or len(heads) != 2:
+            return False
+        return len({attrs[e] for e in outs + ins}) == 1
+
+    through = [passes_through(v) for v in range(nodes)]
+    time_list, length_list = time.tolist(), length.tolist()
+    congested_list = (time * congestion).tolist()
+
+    merged = {'src': [], 'dst': [], 'length': [], 'time': [], 'congested': [], 'edge': []}
+    shapes = []
+    for first in range(len(src_list)):
+        start = src_list[first]
+        if through[start]:
+            continue
+        e, shape = first, []
+        total_length = total_time = total_congested = 0.0
+        while True:
+            total_length += length_list[e]
+            total_time += time_list[e]
+            total_congested += congested_list[e]
+            v = dst_list[e]
+            if not through[v]:
+                break
+            shape.append(v)
+            previous = src_list[e]
+            e = next(f for f in out_edges[v] if dst_list[f] != previous)
+        if v == start and shape:
+            continue  # loop back to the same junction
+        merged['src'].append(start)
+        merged['dst'].append(v)
+        merged['length'].append(total_length)
+        merged['time'].append(total_time)
+        merged['congested'].append(total_congested)
+        merged['edge'].append(first)
+        shapes.append(shape)
+
+    # Renumber the junctions that still have edges
+    first_edges = np.array(merged['edge'], dtype=np.int64)
+    merged_src = np.array(merged['src'], dtype=np.int64)
+    merged_dst = np.array(merged['dst'], dtype=np.int64)
+    junctions = np.unique(np.concatenate((merged_src, merged_dst)))
+    merged_time = np.array(merged['time'])
+    congested = np.array(merged['congested'])
+
+    logger.info(f"Contracted {nodes} nodes and {src.size} edges to "
+                f"{junctions.size} junctions and {first_edges.size} edges")
+    return (
+        junctions,
+        np.searchsorted(junctions, merged_src),
+        np.searchsorted(junctions, merged_dst),
+        np.array(merged['length']),
+        merged_time,
+        np.divide(congested, merged_time, out=np.ones_like(congested), where=merged_time > 0),
+        flags[first_edges],
+        names[first_edges],
+        shapes
+    )
+
+def _cell_key(row, col):
+    return row * 100000 + col
+
+def _snap_keys(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    rows = np.floor((lat + 90) / SNAP_CELL).astype(np.int64)
+    cols = np.floor((lng + 180) / SNAP_CELL).astype(np.int64)
+    return _cell_key(rows, cols)
+
+def _landmark_tables(arrays: Dict[str, np.ndarray], count: int) -> Dict[str, np.ndarray]:
+    """Landmark distance tables on the lower bound of all time-based costs
+
+    Landmarks are picked farthest-first, so they sit on the edges of the
+    network where their bounds are tightest.
+    """
+    nodes = arrays['lat'].size
+    if not count or not nodes:
+        empty = np.empty((0, nodes), dtype=np.float32)
+        return {'landmarks': np.empty(0, dtype=np.int32), 'landmark_from': empty, 'landmark_to': empty}
+
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+
+    lower = arrays['time'].astype(np.float64)
+    lower[(arrays['flags'] & SCENIC) > 0] *= min(SCENIC_FACTOR, 1.0)
+    graph = csr_matrix((lower, arrays['indices'], arrays['indptr']), shape=(nodes, nodes))
+
+    landmarks = [int(np.argmax(arrays['lat']))]
+    nearest = np.full(nodes, np.inf)
+    while len(landmarks) < count:
+        reach = dijkstra(graph, directed=False, indices=landmarks[-1])
+        nearest = np.minimum(nearest, reach)
+        candidates = np.where(np.isfinite(nearest), nearest, -1)
+        if candidates.max() <= 0:
+            break
+        landmarks.append(int(candidates.argmax()))
+
+    logger.info(f"Computing distance tables for {len(landmarks)} landmarks")
+    return {
+        'landmarks': np.array(landmarks, dtype=np.int32),
+        'landmark_from': dijkstra(graph, indices=landmarks).astype(np.float32),
+        'landmark_to': dijkstra(graph.T.tocsr(), indices=landmarks).astype(np.float32)
+    }
+
+def load_road_graph(path: Optional[str]) -> Optional[RoadGraph]:
+    """Load a saved road graph, None when none is configured or present"""
+    if not path or not os.path.isfile(os.path.join(path, 'meta.json')):
+        return None
+    try:
+        graph = RoadGraph.load(path)
+        logger.info(f"Loaded road graph with {graph.node_count} nodes and {graph.edge_count} edges")
+        return graph
+    except Exception as e:
+        logger.error(f"Road graph load error: {str(e)}")
+        return None
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    RoadGraph.from_geojson(
+        sys.argv[1], int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    ).save(sys.argv[2])
@@ -5,16 +5,44 @@ All supporting services for the Flask API
 
 import os
 import json
+import math
+import base64
+import shutil
 import logging
+import tempfile
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Tuple
+from collections import Counter
+from typing import Dict, List, Any, Callable, Optional, Tuple, Iterable, Iterator
 import numpy as np
 from haversine import haversine, Unit
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, OperationFailure
 import pandas as pd
 
+from cache import create_cache
+from poi_index import POIIndex
+from weather import WeatherCache, create_weather_provider
+from translation import Translator
+from festivals import load_festival_calendar
+from indexes import ensure_indexes, verify_indexes
+from exports import (iter_csv, iter_ndjson, iter_json, write_excel, write_parquet, zip_directory,
+                     EPOCH_MS_THRESHOLD, EXCEL_MAX_ROWS)
+
 logger = logging.getLogger(__name__)
 
+# Mean Earth radius used by the haversine package, so vectorized and scalar
+# distances agree
+EARTH_RADIUS_M = 6371008.8
+
+def haversine_array(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Vectorized haversine distance in meters between coordinate arrays"""
+    lat1, lng1, lat2, lng2 = (
+        np.radians(np.asarray(a, dtype=float)) for a in (lat1, lng1, lat2, lng2)
+    )
+    d = (np.sin((lat2 - lat1) * 0.5) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) * 0.5) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(d))
+
 # =====================
 # GPS Service
 # =====================
@@ -23,14 +51,20 @@ class GPSService:
     """GPS and location services"""
     
     def __init__(self):
-        self.last_location = None
+        # Last fix per user, for incremental distances
+        self.last_locations = create_cache(
+            os.getenv('GPS_STATE_STORE', 'memory'),
+            max_size=int(os.getenv('GPS_STATE_MAX_USERS', 100000)),
+            ttl=float(os.getenv('GPS_STATE_TTL', 3600))
+        )
         logger.info("GPS Service initialized")
     
     def is_ready(self) -> bool:
         return True
     
-    def process_location(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Process GPS location data"""
+    def _build_location(self, data: Dict[str, Any], processed_at: str,
+                        trip_id: Optional[str] = None) -> Dict[str, Any]:
+        """Normalize raw GPS fields into a location document"""
         location = {
             'lat': data.get('latitude'),
             'lng': data.get('longitude'),
@@ -38,21 +72,97 @@ class GPSService:
             'speed': data.get('speed', 0),
             'accuracy': data.get('accuracy', 10),
             'heading': data.get('heading', 0),
-            'timestamp': data.get('timestamp', datetime.now().isoformat()),
-            'processed_at': datetime.now().isoformat()
+            'timestamp': data.get('timestamp', processed_at),
+            'processed_at': processed_at
         }
+        if trip_id:
+            location['trip_id'] = trip_id
+        return location
+    
+    def validate_fix(self, data: Dict[str, Any]) -> Optional[str]:
+        """Return an error message for an unusable GPS fix, None if valid"""
+        if not isinstance(data, dict):
+            return 'point must be an object'
+        lat = data.get('latitude')
+        lng = data.get('longitude')
+        if isinstance(lat, bool) or not isinstance(lat, (int, float)) or not -90 <= lat <= 90:
+            return 'latitude must be a number between -90 and 90'
+        if isinstance(lng, bool) or not isinstance(lng, (int, float)) or not -180 <= lng <= 180:
+            return 'longitude must be a number between -180 and 180'
+        return None
+    
+    def _remember_location(self, user_id: str, location: Dict[str, Any]):
+        """Keep the compact last fix for a user"""
+        self.last_locations.set(user_id, {
+            'lat': location['lat'],
+            'lng': location['lng'],
+            'timestamp': location['timestamp'],
+            'trip_id': location.get('trip_id')
+        })
+    
+    def _last_location(self, user_id: str, trip_id: Optional[str],
+                       load_last: Optional[Callable[[], Optional[Dict]]] = None) -> Optional[Dict[str, Any]]:
+        """Last fix for a user, if it belongs to the same trip
         
-        # Calculate distance from last location
-        if self.last_location:
+        On a cache miss (another worker took the previous fixes, or the
+        entry expired) load_last supplies the trip's last stored fix.
+        """
+        last_location = self.last_locations.get(user_id)
+        if last_location and last_location.get('trip_id') == trip_id:
+            return last_location
+        if trip_id and load_last:
+            return load_last()
+        return None
+    
+    def process_location(self, data: Dict[str, Any], user_id: str,
+                         trip_id: Optional[str] = None,
+                         load_last: Optional[Callable[[], Optional[Dict]]] = None) -> Dict[str, Any]:
+        """Process GPS location data"""
+        location = self._build_location(data, datetime.now().isoformat(), trip_id)
+        
+        # Calculate distance from the user's last location on this trip
+        last_location = self._last_location(user_id, trip_id, load_last)
+        if last_location:
             distance = self.calculate_distance(
-                self.last_location['lat'], self.last_location['lng'],
+                last_location['lat'], last_location['lng'],
                 location['lat'], location['lng']
             )
             location['distance_from_last'] = distance
         
-        self.last_location = location
+        self._remember_location(user_id, location)
         return location
     
+    def process_locations(self, points: List[Dict[str, Any]], user_id: str,
+                          trip_id: Optional[str] = None,
+                          load_last: Optional[Callable[[], Optional[Dict]]] = None) -> List[Dict[str, Any]]:
+        """Process a batch of GPS fixes in one vectorized pass"""
+        if not points:
+            return []
+        
+        processed_at = datetime.now().isoformat()
+        locations = [self._build_location(data, processed_at, trip_id) for data in points]
+        lats = np.array([l['lat'] for l in locations], dtype=float)
+        lngs = np.array([l['lng'] for l in locations], dtype=float)
+        
+        # Each fix is measured against its predecessor; the first one against
+        # the user's last location on this trip seen before this batch
+        last_location = self._last_location(user_id, trip_id, load_last)
+        if last_location:
+            prev_lats = np.concatenate(([last_location['lat']], lats[:-1]))
+            prev_lngs = np.concatenate(([last_location['lng']], lngs[:-1]))
+            measured = locations
+        else:
+            prev_lats, prev_lngs = lats[:-1], lngs[:-1]
+            lats, lngs = lats[1:], lngs[1:]
+            measured = locations[1:]
+        
+        distances = haversine_array(prev_lats, prev_lngs, lats, lngs)
+        for location, distance in zip(measured, distances):
+            location['distance_from_last'] = float(distance)
+        
+        self._remember_location(user_id, locations[-1])
+        return locations
+    
     def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """Calculate distance between two GPS points in meters"""
         return haversine((lat1, lon1), (lat2, lon2), unit=Unit.METERS)
@@ -62,43 +172,119 @@ class GPSService:
         if not gps_data:
             return {'error': 'No GPS data'}
         
-        speeds = [p.get('speed', 0) for p in gps_data]
-        distances = []
+        return self.analytics_from_aggregates(self.aggregate_trace(gps_data))
+    
+    def _aggregate(self, distances: np.ndarray, speeds: np.ndarray) -> Dict[str, Any]:
+        """Running trip aggregates for a set of fixes"""
+        moving = int(np.count_nonzero(speeds >= 2))
+        return {
+            'points': int(speeds.size),
+            'distance': float(distances.sum()),  # meters
+            'speed_sum': float(speeds.sum()),
+            'speed_min': float(speeds.min()),
+            'speed_max': float(speeds.max()),
+            'stop_count': int(speeds.size - moving),
+            'moving_points': moving
+        }
+    
+    def aggregate_trace(self, gps_data: List[Dict]) -> Dict[str, Any]:
+        """Aggregates for a full trace, used to (re)build a trip's running totals"""
+        count = len(gps_data)
+        lats = np.fromiter((p['lat'] for p in gps_data), dtype=float, count=count)
+        lngs = np.fromiter((p['lng'] for p in gps_data), dtype=float, count=count)
+        speeds = np.fromiter((p.get('speed') or 0 for p in gps_data), dtype=float, count=count)
         
-        for i in range(1, len(gps_data)):
-            dist = self.calculate_distance(
-                gps_data[i-1]['lat'], gps_data[i-1]['lng'],
-                gps_data[i]['lat'], gps_data[i]['lng']
-            )
-            distances.append(dist)
+        # Distances between consecutive fixes in one pass
+        distances = haversine_array(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+        
+        return self._aggregate(distances, speeds)
+    
+    def aggregate_increment(self, locations: List[Dict]) -> Dict[str, Any]:
+        """Aggregates for newly processed fixes, to be merged into a trip's totals"""
+        count = len(locations)
+        distances = np.fromiter(
+            (l.get('distance_from_last', 0) for l in locations), dtype=float, count=count
+        )
+        speeds = np.fromiter((l.get('speed') or 0 for l in locations), dtype=float, count=count)
         
+        return self._aggregate(distances, speeds)
+    
+    def analytics_from_aggregates(self, aggregates: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the analytics response from running trip aggregates"""
+        points = aggregates['points']
         return {
-            'total_distance': sum(distances) / 1000,  # km
-            'avg_speed': np.mean(speeds) if speeds else 0,
-            'max_speed': max(speeds) if speeds else 0,
-            'min_speed': min(speeds) if speeds else 0,
-            'points_analyzed': len(gps_data),
-            'stop_count': sum(1 for s in speeds if s < 2),
-            'moving_time': sum(1 for s in speeds if s >= 2) / 60  # minutes
+            'total_distance': aggregates['distance'] / 1000,  # km
+            'avg_speed': aggregates['speed_sum'] / points if points else 0,
+            'max_speed': aggregates['speed_max'],
+            'min_speed': aggregates['speed_min'],
+            'points_analyzed': points,
+            'stop_count': aggregates['stop_count'],
+            'moving_time': aggregates['moving_points'] / 60  # minutes
         }
     
     def check_geofence(self, location: Dict, fence: Dict) -> bool:
         """Check if location is within geofence"""
-        center_lat = fence.get('center_lat')
-        center_lng = fence.get('center_lng')
-        radius = fence.get('radius', 100)  # meters
+        return self.check_geofences(location, [fence])[0]
+    
+    def check_geofences(self, location: Dict, fences: List[Dict]) -> List[bool]:
+        """Check a location against many circular geofences at once"""
+        if not fences:
+            return []
         
-        distance = self.calculate_distance(
-            location['lat'], location['lng'],
-            center_lat, center_lng
-        )
+        center_lats = np.array([f.get('center_lat') for f in fences], dtype=float)
+        center_lngs = np.array([f.get('center_lng') for f in fences], dtype=float)
+        radii = np.array([f.get('radius', 100) for f in fences], dtype=float)  # meters
+        
+        distances = haversine_array(location['lat'], location['lng'], center_lats, center_lngs)
         
-        return distance <= radius
+        return (distances <= radii).tolist()
 
 # =====================
 # Database Service
 # =====================
 
+# Trips are listed newest first; id breaks start_time ties so order is total
+TRIP_SORT = [('start_time', -1), ('id', -1)]
+
+# Fields of the trip list view
+TRIP_LIST_FIELDS = ('id', 'start_time', 'end_time', 'status', 'mode', 'purpose',
+                    'distance', 'duration', 'start_location', 'end_location')
+
+# Export job states that hold a worker slot
+ACTIVE_EXPORT_JOB = {'$in': ['queued', 'running']}
+
+# Dashboard windows, counted back from now on trip start_time; 'all' has no window
+PERIOD_DAYS = {'week': 7, 'month': 30, 'year': 365, 'all': None}
+
+def _summable(value: Any) -> bool:
+    """Values $sum adds up; it skips everything else, including booleans"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _category(value: Any) -> str:
+    return 'unknown' if value is None else str(value)
+
+def _ranked(counts: Dict[str, int]) -> Dict[str, int]:
+    """Counts by descending count, then name, so ties resolve the same on every path"""
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+def encode_cursor(trip: Dict) -> str:
+    """Opaque cursor positioned after a trip"""
+    raw = json.dumps([trip.get('start_time'), trip.get('id')], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    """(start_time, id) of a cursor; ValueError if it was not issued by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        start_time, trip_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('invalid cursor')
+    # Both values go into the page query, so operators like {"$ne": null} must not
+    if isinstance(start_time, bool) or not isinstance(start_time, (str, int, float)) \
+            or not isinstance(trip_id, str):
+        raise ValueError('invalid cursor')
+    return start_time, trip_id
+
 class DatabaseService:
     """Database operations service"""
     
@@ -125,6 +311,61 @@ class DatabaseService:
         except:
             return False
     
+    def ensure_indexes(self) -> Dict[str, Any]:
+        """Create the declared indexes (idempotent)"""
+        return ensure_indexes(self.db)
+    
+    def verify_indexes(self) -> Dict[str, Any]:
+        """Check the declared indexes and the query plans that rely on them"""
+        return verify_indexes(self.db, self.query_shapes())
+    
+    def query_shapes(self) -> List[Dict[str, Any]]:
+        """
+        Filter/sort shapes of the queries this service sends, with the index
+        each must use; windows, cursors and exclusions come from the same
+        builders the queries use
+        """
+        now = datetime.now()
+        user = 'user'
+        cursor = encode_cursor({'start_time': now.isoformat(), 'id': 'trip'})
+        return [
+            {'collection': 'users', 'filter': {'email': ''}, 'index': 'email_unique'},
+            {'collection': 'trips', 'filter': {'id': ''}, 'index': 'id_unique'},
+            {'collection': 'trips', 'filter': {'user_id': user}, 'sort': TRIP_SORT,
+             'index': 'user_id_start_time_id'},
+            {'collection': 'trips', 'filter': self._trips_page_query(user, cursor), 'sort': TRIP_SORT,
+             'index': 'user_id_start_time_id'},
+            {'collection': 'trips', 'filter': self._window_query('start_time', now, now, None),
+             'sort': [('start_time', 1)], 'index': 'start_time'},
+            # iter_trips of one user, and the trip_totals $match
+            {'collection': 'trips', 'filter': self._window_query('start_time', now, None, user),
+             'sort': [('start_time', 1)], 'index': 'user_id_start_time_id'},
+            {'collection': 'locations', 'filter': {'trip_id': ''}, 'sort': [('timestamp', 1)],
+             'index': 'trip_id_timestamp'},
+            # get_last_trip_fix
+            {'collection': 'locations', 'filter': {'trip_id': ''}, 'sort': [('timestamp', -1)],
+             'index': 'trip_id_timestamp'},
+            {'collection': 'locations', 'filter': self._locations_between_query(now, now, user, (0, 0, 1, 1)),
+             'index': 'timestamp'},
+            {'collection': 'locations', 'filter': self._window_query('timestamp', now, now, None),
+             'sort': [('timestamp', 1)], 'index': 'timestamp'},
+            {'collection': 'locations', 'filter': self._window_query('timestamp', now, now, user),
+             'sort': [('timestamp', 1)], 'index': 'user_id_timestamp'},
+            {'collection': 'gamification', 'filter': {'user_id': user}, 'index': 'user_id'},
+            {'collection': 'gamification', 'filter': {}, 'sort': [('points', -1)], 'index': 'points'},
+            {'collection': 'geofence_sets', 'filter': {'id': ''}, 'index': 'id_unique'},
+            {'collection': 'export_jobs', 'filter': {'id': ''}, 'index': 'id_unique'},
+            {'collection': 'export_jobs', 'filter': {'id': {'$in': ['']}}, 'index': 'id_unique'},
+            {'collection': 'export_jobs', 'filter': {'key': '', 'status': ACTIVE_EXPORT_JOB},
+             'index': 'key_active_unique'},
+            {'collection': 'export_jobs', 'filter': {'user_id': user, 'status': ACTIVE_EXPORT_JOB},
+             'index': 'user_id_status'},
+            {'collection': 'export_jobs', 'filter': {'status': ACTIVE_EXPORT_JOB, 'updated_at': {'$lte': 0}},
+             'index': 'status_updated_at'},
+            {'collection': 'export_jobs', 'filter': {'status': 'done'}, 'index': 'status_updated_at'},
+            {'collection': 'export_jobs', 'filter': {'expires_at': {'$lte': 0}}, 'index': 'expires_at'}
+        ]
+    
     def user_exists(self, email: str) -> bool:
         """Check if user exists"""
         return self.db.users.find_one({'email': email}) is not None
@@ -151,12 +392,177 @@ class DatabaseService:
         """Update trip"""
         self.db.trips.update_one({'id': trip_id}, {'$set': updates})
     
-    def get_user_trips(self, user_id: str, page: int = 1, limit: int = 10) -> List[Dict]:
-        """Get user trips with pagination"""
+    @staticmethod
+    def _trip_projection(fields: Optional[Iterable[str]]) -> Dict[str, int]:
+        """Projection of the given fields plus the sort keys; None for every field"""
+        if fields is None:
+            return {'_id': 0}
+        projection = {field: 1 for field in fields}
+        projection.update({'_id': 0, 'start_time': 1, 'id': 1})
+        return projection
+    
+    def get_user_trips(self, user_id: str, page: int = 1, limit: int = 10,
+                       fields: Optional[Iterable[str]] = TRIP_LIST_FIELDS) -> List[Dict]:
+        """Get user trips by page number (deprecated: cost grows with the page; use get_user_trips_page)"""
         skip = (page - 1) * limit
-        trips = self.db.trips.find({'user_id': user_id}).skip(skip).limit(limit)
+        trips = self.db.trips.find(
+            {'user_id': user_id}, self._trip_projection(fields)
+        ).sort(TRIP_SORT).skip(skip).limit(limit)
         return list(trips)
     
+    def get_user_trips_page(self, user_id: str, limit: int = 10, cursor: Optional[str] = None,
+                            fields: Optional[Iterable[str]] = TRIP_LIST_FIELDS) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Get one page of user trips, newest first, after a cursor
+        
+        Seeks on the (user_id, start_time, id) index, so every page costs the
+        same and trips inserted meanwhile cannot shift later pages.
+        
+        Returns:
+            The trips and the cursor of the next page, None on the last page
+        """
+        query = self._trips_page_query(user_id, cursor)
+        # One extra trip tells whether another page follows
+        trips = list(self.db.trips.find(query, self._trip_projection(fields)).sort(TRIP_SORT).limit(limit + 1))
+        if len(trips) <= limit:
+            return trips, None
+        return trips[:limit], encode_cursor(trips[limit - 1])
+    
+    @staticmethod
+    def _trips_page_query(user_id: str, cursor: Optional[str]) -> Dict[str, Any]:
+        """Filter for a user's trips after a cursor, in TRIP_SORT order"""
+        query = {'user_id': user_id}
+        if cursor:
+            start_time, trip_id = decode_cursor(cursor)
+            query['$or'] = [
+                {'start_time': {'$lt': start_time}},
+                {'start_time': start_time, 'id': {'$lt': trip_id}}
+            ]
+        return query
+    
+    def iter_user_trips(self, user_id: str, fields: Optional[Iterable[str]] = None,
+                        page_size: int = 500) -> Iterator[Dict]:
+        """Stream all of a user's trips, newest first, page by page"""
+        cursor = None
+        while True:
+            trips, cursor = self.get_user_trips_page(user_id, page_size, cursor, fields)
+            yield from trips
+            if cursor is None:
+                return
+    
+    @staticmethod
+    def _time_window(field: str, start: Optional[datetime], end: Optional[datetime]) -> Dict[str, Any]:
+        """Filter on field within [start, end), stored as ISO strings or epoch seconds/milliseconds"""
+        if start is None and end is None:
+            return {}
+        iso, seconds, millis = {'$gte': start.isoformat() if start else ''}, {}, {}
+        seconds['$gte'] = start.timestamp() if start else 0
+        seconds['$lt'] = min(end.timestamp(), EPOCH_MS_THRESHOLD) if end else EPOCH_MS_THRESHOLD
+        millis['$gte'] = max(start.timestamp() * 1000, EPOCH_MS_THRESHOLD) if start else EPOCH_MS_THRESHOLD
+        if end:
+            iso['$lt'] = end.isoformat()
+            millis['$lt'] = end.timestamp() * 1000
+        return {'$or': [{field: iso}, {field: seconds}, {field: millis}]}
+    
+    def _window_query(self, field: str, start: Optional[datetime], end: Optional[datetime],
+                      user_id: Optional[str]) -> Dict[str, Any]:
+        query = self._time_window(field, start, end)
+        if user_id:
+            query['user_id'] = user_id
+        return query
+    
+    def iter_trips(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   user_id: Optional[str] = None, batch_size: int = 10000) -> Iterable[Dict]:
+        """Stream trips started within [start, end), oldest first, optionally of one user"""
+        query = self._window_query('start_time', start, end, user_id)
+        return self.db.trips.find(query, {'_id': 0}).sort('start_time', 1).batch_size(batch_size)
+    
+    def count_trips(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    user_id: Optional[str] = None) -> int:
+        """Count trips started within [start, end), optionally of one user"""
+        return self.db.trips.count_documents(self._window_query('start_time', start, end, user_id))
+    
+    def iter_location_history(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                              user_id: Optional[str] = None, batch_size: int = 10000) -> Iterable[Dict]:
+        """Stream stored fixes within [start, end), oldest first, optionally of one user"""
+        query = self._window_query('timestamp', start, end, user_id)
+        return self.db.locations.find(
+            query, {'_id': 0, 'processed_at': 0}
+        ).sort('timestamp', 1).batch_size(batch_size)
+    
+    def count_location_history(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                               user_id: Optional[str] = None) -> int:
+        """Count stored fixes within [start, end), optionally of one user"""
+        return self.db.locations.count_documents(self._window_query('timestamp', start, end, user_id))
+    
+    def trip_totals(self, user_id: str, since: Optional[datetime] = None,
+                    use_pipeline: bool = True) -> Dict[str, Any]:
+        """
+        Trip count, distance and duration sums, and mode/purpose counts of a
+        user's trips started since a time
+        
+        Computed by an aggregation pipeline, so only the totals leave the
+        server. The Python path streams the same trips and matches the
+        pipeline's semantics: non-numeric values are skipped by the sums and
+        missing modes/purposes count as 'unknown'.
+        """
+        query = self._window_query('start_time', since, None, user_id)
+        if use_pipeline:
+            try:
+                return self._trip_totals_pipeline(query)
+            except (OperationFailure, NotImplementedError) as e:
+                logger.warning(f"Trip totals pipeline unavailable, summing in Python: {str(e)}")
+        return self._trip_totals_python(query)
+    
+    def _trip_totals_pipeline(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        def counts(field):
+            return [
+                {'$group': {'_id': {'$ifNull': [f'${field}', 'unknown']}, 'count': {'$sum': 1}}}
+            ]
+        
+        result = next(self.db.trips.aggregate([
+            {'$match': query},
+            {'$facet': {
+                'totals': [{'$group': {
+                    '_id': None,
+                    'trips': {'$sum': 1},
+                    'distance': {'$sum': '$distance'},
+                    'duration': {'$sum': '$duration'}
+                }}],
+                'modes': counts('mode'),
+                'purposes': counts('purpose')
+            }}
+        ]))
+        totals = result['totals'][0] if result['totals'] else {}
+        return {
+            'trips': totals.get('trips', 0),
+            'distance': totals.get('distance', 0),
+            'duration': totals.get('duration', 0),
+            'modes': _ranked({_category(g['_id']): g['count'] for g in result['modes']}),
+            'purposes': _ranked({_category(g['_id']): g['count'] for g in result['purposes']})
+        }
+    
+    def _trip_totals_python(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        trips = self.db.trips.find(query, {'_id': 0, 'distance': 1, 'duration': 1, 'mode': 1, 'purpose': 1})
+        count, distances, durations = 0, [], []
+        modes, purposes = Counter(), Counter()
+        for trip in trips:
+            count += 1
+            if _summable(trip.get('distance')):
+                distances.append(trip['distance'])
+            if _summable(trip.get('duration')):
+                durations.append(trip['duration'])
+            modes[_category(trip.get('mode'))] += 1
+            purposes[_category(trip.get('purpose'))] += 1
+        return {
+            'trips': count,
+            # Compensated sums, like the server's $sum on doubles
+            'distance': math.fsum(distances),
+            'duration': math.fsum(durations),
+            'modes': _ranked(modes),
+            'purposes': _ranked(purposes)
+        }
+    
     def get_latest_trip_id(self, user_id: str) -> Optional[str]:
         """Get latest trip ID for user"""
         trip = self.db.trips.find_one(
@@ -170,10 +576,149 @@ class DatabaseService:
         location['user_id'] = user_id
         self.db.locations.insert_one(location)
     
-    def get_trip_gps_data(self, trip_id: str) -> List[Dict]:
-        """Get GPS data for a trip"""
+    def store_locations(self, user_id: str, locations: List[Dict]) -> List[Optional[str]]:
+        """Store a batch of GPS locations with a single unordered bulk write
+        
+        Returns one entry per location: None if stored, else the write error.
+        """
+        if not locations:
+            return []
+        
+        # Insert copies so the generated _id does not leak into API responses
+        documents = [dict(location, user_id=user_id) for location in locations]
+        errors = [None] * len(documents)
+        
+        try:
+            self.db.locations.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get('writeErrors', []):
+                errors[write_error['index']] = write_error.get('errmsg', 'write failed')
+            logger.warning(f"Bulk location insert: {len(e.details.get('writeErrors', []))} of {len(documents)} failed")
+        
+        return errors
+    
+    def update_trip_aggregates(self, trip_id: str, user_id: str, increment: Dict[str, Any]):
+        """Merge newly tracked fixes into a trip's running GPS aggregates"""
+        self.db.trips.update_one(
+            {'id': trip_id, 'user_id': user_id},
+            {
+                '$inc': {
+                    f'gps_aggregates.{field}': increment[field]
+                    for field in ('points', 'distance', 'speed_sum', 'stop_count', 'moving_points')
+                },
+                '$min': {'gps_aggregates.speed_min': increment['speed_min']},
+                '$max': {'gps_aggregates.speed_max': increment['speed_max']}
+            }
+        )
+    
+    def set_trip_aggregates(self, trip_id: str, user_id: str, aggregates: Dict[str, Any]):
+        """Replace a user's trip's running GPS aggregates (full recompute)"""
+        self.db.trips.update_one({'id': trip_id, 'user_id': user_id}, {'$set': {'gps_aggregates': aggregates}})
+    
+    def get_trip_aggregates(self, trip_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get a user's trip's running GPS aggregates"""
+        trip = self.db.trips.find_one({'id': trip_id, 'user_id': user_id}, {'gps_aggregates': 1})
+        return trip.get('gps_aggregates') if trip else None
+    
+    def get_trip_gps_data(self, trip_id: str, user_id: Optional[str] = None) -> List[Dict]:
+        """Get GPS data for a trip, optionally only the fixes one user sent"""
         # In production, would join with trips collection
-        return list(self.db.locations.find({'trip_id': trip_id}))
+        query = {'trip_id': trip_id}
+        if user_id:
+            query['user_id'] = user_id
+        return list(self.db.locations.find(query).sort('timestamp', 1))
+    
+    def get_last_trip_fix(self, trip_id: str, user_id: str) -> Optional[Dict]:
+        """The latest stored fix a user sent on a trip"""
+        return self.db.locations.find_one(
+            {'trip_id': trip_id, 'user_id': user_id},
+            {'_id': 0, 'lat': 1, 'lng': 1, 'timestamp': 1, 'trip_id': 1},
+            sort=[('timestamp', -1)]
+        )
+    
+    def iter_locations(self, batch_size: int = 10000) -> Iterable[Dict]:
+        """Stream every stored fix with the fields used for aggregation"""
+        return self.db.locations.find(
+            {}, {'_id': 0, 'lat': 1, 'lng': 1, 'speed': 1, 'timestamp': 1}
+        ).batch_size(batch_size)
+    
+    def get_locations_between(self, start: Any, end: Any,
+                              exclude_user_id: Optional[str] = None,
+                              bounds: Optional[Tuple[float, float, float, float]] = None,
+                              limit: int = 0, batch_size: int = 10000) -> Iterable[Dict]:
+        """
+        Stream fixes of all users within a timestamp window, optionally only
+        those inside a (min_lat, min_lng, max_lat, max_lng) box and at most
+        limit of them
+        """
+        return self.db.locations.find(
+            self._locations_between_query(start, end, exclude_user_id, bounds),
+            {'_id': 0, 'user_id': 1, 'lat': 1, 'lng': 1, 'timestamp': 1}
+        ).limit(limit).batch_size(batch_size)
+    
+    @staticmethod
+    def _locations_between_query(start: Any, end: Any, exclude_user_id: Optional[str],
+                                 bounds: Optional[Tuple[float, float, float, float]] = None) -> Dict[str, Any]:
+        query = {'timestamp': {'$gte': start, '$lte': end}}
+        if exclude_user_id:
+            query['user_id'] = {'$ne': exclude_user_id}
+        if bounds:
+            min_lat, min_lng, max_lat, max_lng = bounds
+            query['lat'] = {'$gte': min_lat, '$lte': max_lat}
+            query['lng'] = {'$gte': min_lng, '$lte': max_lng}
+        return query
+    
+    def store_fence_set(self, fence_set: Dict):
+        """Store a geofence set"""
+        self.db.geofence_sets.insert_one(dict(fence_set))
+    
+    def get_fence_set(self, set_id: str, user_id: str) -> Optional[Dict]:
+        """Get a user's geofence set by ID"""
+        fence_set = self.db.geofence_sets.find_one({'id': set_id}, {'_id': 0})
+        return fence_set if fence_set and fence_set.get('user_id') == user_id else None
+    
+    def create_export_job(self, job: Dict):
+        """Store a new export job"""
+        self.db.export_jobs.insert_one(dict(job))
+    
+    def update_export_job(self, job_id: str, fields: Dict[str, Any]):
+        """Set fields of an export job"""
+        self.db.export_jobs.update_one({'id': job_id}, {'$set': fields})
+    
+    def touch_export_jobs(self, job_ids: List[str], now: float):
+        """Mark export jobs as still owned by a live worker"""
+        if job_ids:
+            self.db.export_jobs.update_many({'id': {'$in': job_ids}}, {'$set': {'updated_at': now}})
+    
+    def get_export_job(self, job_id: str) -> Optional[Dict]:
+        """Get export job by ID"""
+        return self.db.export_jobs.find_one({'id': job_id}, {'_id': 0})
+    
+    def find_active_export_job(self, key: str) -> Optional[Dict]:
+        """A queued or running export job with the same user, format and parameters"""
+        return self.db.export_jobs.find_one({'key': key, 'status': ACTIVE_EXPORT_JOB}, {'_id': 0})
+    
+    def count_active_export_jobs(self, user_id: str) -> int:
+        """Queued and running export jobs of a user"""
+        return self.db.export_jobs.count_documents({'user_id': user_id, 'status': ACTIVE_EXPORT_JOB})
+    
+    def count_export_jobs(self, status: str) -> int:
+        """Export jobs in a state"""
+        return self.db.export_jobs.count_documents({'status': status})
+    
+    def fail_stale_export_jobs(self, before: float, fields: Dict[str, Any]) -> int:
+        """Fail queued or running export jobs no worker has touched since a time"""
+        return self.db.export_jobs.update_many(
+            {'status': ACTIVE_EXPORT_JOB, 'updated_at': {'$lte': before}}, {'$set': fields}
+        ).modified_count
+    
+    def expired_export_jobs(self, now: float) -> List[Dict]:
+        """Export jobs past their expiry"""
+        return list(self.db.export_jobs.find({'expires_at': {'$lte': now}}, {'_id': 0, 'id': 1, 'path': 1}))
+    
+    def delete_export_job(self, job_id: str) -> bool:
+        """Delete an export job; False if another worker already did"""
+        return self.db.export_jobs.delete_one({'id': job_id}).deleted_count > 0
     
     def log_trip_event(self, user_id: str, event: Dict):
         """Log trip event"""
@@ -185,6 +730,12 @@ class DatabaseService:
         classification['user_id'] = user_id
         self.db.mode_classifications.insert_one(classification)
     
+    def store_mode_classifications(self, user_id: str, classifications: List[Dict]):
+        """Store many mode classifications with a single unordered bulk write"""
+        if classifications:
+            documents = [dict(c, user_id=user_id) for c in classifications]
+            self.db.mode_classifications.insert_many(documents, ordered=False)
+    
     def get_user_gamification(self, user_id: str) -> Dict:
         """Get user gamification data"""
         data = self.db.gamification.find_one({'user_id': user_id})
@@ -225,21 +776,39 @@ class KeralaService:
             'Malappuram', 'Kozhikode', 'Wayanad', 'Kannur', 'Kasaragod'
         ]
         
-        self.festivals = [
-            {'name': 'Onam', 'month': 8, 'type': 'harvest'},
-            {'name': 'Vishu', 'month': 4, 'type': 'new_year'},
-            {'name': 'Thrissur Pooram', 'month': 4, 'type': 'temple'},
-            {'name': 'Theyyam', 'month': 12, 'type': 'ritual'},
-            {'name': 'Nehru Trophy Boat Race', 'month': 8, 'type': 'sport'}
-        ]
+        # Dated festivals, including lunar-calendar ones, from a data file
+        self.festival_calendar = load_festival_calendar()
         
-        self.tourism_spots = [
-            {'name': 'Munnar', 'type': 'hill_station', 'lat': 10.0889, 'lng': 77.0595},
-            {'name': 'Alleppey', 'type': 'backwaters', 'lat': 9.4981, 'lng': 76.3388},
-            {'name': 'Kovalam', 'type': 'beach', 'lat': 8.4004, 'lng': 76.9787},
-            {'name': 'Thekkady', 'type': 'wildlife', 'lat': 9.6050, 'lng': 77.1640},
-            {'name': 'Wayanad', 'type': 'nature', 'lat': 11.6854, 'lng': 76.1320}
-        ]
+        # Tourism POIs from a data file, indexed once for spatial queries
+        spots_file = os.getenv(
+            'TOURISM_SPOTS_FILE',
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'tourism_spots.json')
+        )
+        try:
+            self.spot_index = POIIndex.from_file(spots_file)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Tourism spots load error: {str(e)}")
+            self.spot_index = POIIndex([])
+        self.tourism_spots = self.spot_index.records
+        
+        # Weather per district from a pluggable provider, cached and coalesced
+        self.weather = WeatherCache(
+            create_weather_provider(os.getenv('WEATHER_PROVIDER', 'simulated')),
+            ttl=float(os.getenv('WEATHER_TTL', 600)),
+            stale_ttl=float(os.getenv('WEATHER_STALE_TTL', 3600))
+        )
+        
+        # Phrase glossary, loaded once into per-language tries
+        glossary_file = os.getenv(
+            'GLOSSARY_FILE',
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'glossary.json')
+        )
+        cache_size = int(os.getenv('TRANSLATION_CACHE_SIZE', 10000))
+        try:
+            self.translator = Translator.from_file(glossary_file, cache_size)
+        except (OSError, ValueError, AttributeError) as e:
+            logger.error(f"Glossary load error: {str(e)}")
+            self.translator = Translator({}, cache_size)
         
         logger.info("Kerala Service initialized")
     
@@ -250,29 +819,23 @@ class KeralaService:
         """Get list of Kerala districts"""
         return self.districts
     
-    def get_tourism_spots(self, lat: float, lng: float, radius: int = 10) -> List[Dict]:
-        """Get nearby tourism spots"""
-        nearby_spots = []
-        gps_service = GPSService()
-        
-        for spot in self.tourism_spots:
-            distance = gps_service.calculate_distance(lat, lng, spot['lat'], spot['lng'])
-            if distance <= radius * 1000:  # Convert km to meters
-                spot['distance'] = round(distance / 1000, 2)
-                nearby_spots.append(spot)
-        
-        return sorted(nearby_spots, key=lambda x: x['distance'])
+    def get_tourism_spots(self, lat: float, lng: float, radius: float = 10,
+                          spot_type: Optional[str] = None,
+                          limit: Optional[int] = None) -> List[Dict]:
+        """Get tourism spots within radius km, nearest first"""
+        return self.spot_index.within(lat, lng, radius * 1000, spot_type, limit)
+    
+    def get_nearest_tourism_spots(self, lat: float, lng: float, k: int = 5,
+                                  radius: Optional[float] = None,
+                                  spot_type: Optional[str] = None) -> List[Dict]:
+        """Get the k nearest tourism spots, optionally within radius km"""
+        return self.spot_index.nearest(
+            lat, lng, k, radius * 1000 if radius is not None else None, spot_type
+        )
     
     def get_weather(self, district: str) -> Dict[str, Any]:
-        """Get weather for district (simulated)"""
-        # In production, integrate with weather API
-        return {
-            'district': district,
-            'temperature': 28 + np.random.randint(-5, 5),
-            'humidity': 75 + np.random.randint(-10, 10),
-            'conditions': np.random.choice(['sunny', 'cloudy', 'rainy']),
-            'monsoon_active': datetime.now().month in [6, 7, 8, 9]
-        }
+        """Get weather for district from the configured provider, cached per district"""
+        return self.weather.get(district)
     
     def get_monsoon_status(self) -> Dict[str, Any]:
         """Get monsoon status"""
@@ -297,40 +860,17 @@ class KeralaService:
                 'advisory': 'Normal weather conditions'
             }
     
-    def get_upcoming_festivals(self) -> List[Dict]:
-        """Get upcoming Kerala festivals"""
-        current_month = datetime.now().month
-        upcoming = []
-        
-        for festival in self.festivals:
-            if festival['month'] >= current_month:
-                festival['days_until'] = (festival['month'] - current_month) * 30
-                upcoming.append(festival)
-        
-        return upcoming
+    def get_upcoming_festivals(self, days: int = 365) -> List[Dict]:
+        """Get Kerala festivals ongoing today or starting within days"""
+        return self.festival_calendar.upcoming(days=days)
     
     def translate(self, text: str, target_lang: str) -> str:
-        """Translate text (simulated)"""
-        # In production, use actual translation API
-        translations = {
-            'ml': {
-                'hello': 'നമസ്കാരം',
-                'thank you': 'നന്ദി',
-                'trip': 'യാത്ര',
-                'bus': 'ബസ്',
-                'train': 'ട്രെയിൻ'
-            },
-            'en': {
-                'നമസ്കാരം': 'hello',
-                'നന്ദി': 'thank you',
-                'യാത്ര': 'trip'
-            }
-        }
-        
-        if target_lang in translations and text.lower() in translations[target_lang]:
-            return translations[target_lang][text.lower()]
-        
-        return f"[{target_lang}] {text}"  # Placeholder translation
+        """Translate text with longest-match glossary phrase substitution"""
+        return self.translator.translate(text, target_lang)
+    
+    def translate_many(self, texts: List[str], target_lang: str) -> List[str]:
+        """Translate many strings in one call"""
+        return self.translator.translate_many(texts, target_lang)
 
 # =====================
 # Analytics Service
@@ -341,13 +881,31 @@ class AnalyticsService:
     
     def __init__(self):
         self.db_service = DatabaseService()
+        self.export_batch_size = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+        self.parquet_batch_size = int(os.getenv('PARQUET_BATCH_SIZE', 10000))
+        self.use_pipeline = os.getenv('ANALYTICS_PIPELINE', 'true').lower() == 'true'
+        
+        # District headquarters, for partitioning exports by nearest district
+        districts_file = os.getenv(
+            'DISTRICTS_FILE',
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'districts.json')
+        )
+        try:
+            self.district_index = POIIndex.from_file(districts_file)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Districts load error: {str(e)}")
+            self.district_index = POIIndex([])
         logger.info("Analytics Service initialized")
     
     def get_user_analytics(self, user_id: str, period: str = 'week') -> Dict[str, Any]:
-        """Get user analytics for dashboard"""
-        trips = self.db_service.get_user_trips(user_id, page=1, limit=100)
+        """Get user analytics for dashboard over the trips of the last week, month or year, or all trips"""
+        if period not in PERIOD_DAYS:
+            raise ValueError(f"period must be one of: {', '.join(PERIOD_DAYS)}")
+        days = PERIOD_DAYS[period]
+        since = datetime.now() - timedelta(days=days) if days else None
+        totals = self.db_service.trip_totals(user_id, since, self.use_pipeline)
         
-        if not trips:
+        if not totals['trips']:
             return {
                 'total_trips': 0,
                 'total_distance': 0,
@@ -356,80 +914,84 @@ class AnalyticsService:
                 'favorite_purpose': 'none'
             }
         
-        # Calculate analytics
-        total_distance = sum(t.get('distance', 0) for t in trips)
-        total_duration = sum(t.get('duration', 0) for t in trips)
-        modes = [t.get('mode', 'unknown') for t in trips]
-        purposes = [t.get('purpose', 'unknown') for t in trips]
-        
-        from collections import Counter
-        mode_counts = Counter(modes)
-        purpose_counts = Counter(purposes)
-        
+        trips = totals['trips']
         return {
-            'total_trips': len(trips),
-            'total_distance': round(total_distance, 2),
-            'total_duration': round(total_duration, 2),
-            'avg_distance': round(total_distance / len(trips), 2),
-            'avg_duration': round(total_duration / len(trips), 2),
-            'favorite_mode': mode_counts.most_common(1)[0][0] if mode_counts else 'none',
-            'favorite_purpose': purpose_counts.most_common(1)[0][0] if purpose_counts else 'none',
-            'mode_distribution': dict(mode_counts),
-            'purpose_distribution': dict(purpose_counts),
+            'total_trips': trips,
+            'total_distance': round(totals['distance'], 2),
+            'total_duration': round(totals['duration'], 2),
+            'avg_distance': round(totals['distance'] / trips, 2),
+            'avg_duration': round(totals['duration'] / trips, 2),
+            'favorite_mode': next(iter(totals['modes']), 'none'),
+            'favorite_purpose': next(iter(totals['purposes']), 'none'),
+            'mode_distribution': totals['modes'],
+            'purpose_distribution': totals['purposes'],
             'period': period,
+            'since': since.isoformat() if since else None,
             'generated_at': datetime.now().isoformat()
         }
     
-    def export_user_data(self, user_id: str) -> Dict[str, Any]:
-        """Export user data as JSON"""
-        trips = self.db_service.get_user_trips(user_id, page=1, limit=1000)
-        analytics = self.get_user_analytics(user_id)
-        
-        return {
+    def _export_trips(self, user_id: str) -> Iterator[Dict]:
+        """Every trip of a user, fetched one page at a time"""
+        return self.db_service.iter_user_trips(user_id, page_size=self.export_batch_size)
+    
+    def export_user_data(self, user_id: str) -> Iterator[str]:
+        """Export user data as a JSON document, streamed"""
+        return iter_json({
             'user_id': user_id,
             'export_date': datetime.now().isoformat(),
-            'analytics': analytics,
-            'trips': trips,
-            'total_trips': len(trips)
-        }
+            'analytics': self.get_user_analytics(user_id, 'all')
+        }, self._export_trips(user_id), self.export_batch_size)
     
-    def export_to_csv(self, user_id: str) -> str:
-        """Export user data to CSV"""
-        trips = self.db_service.get_user_trips(user_id, page=1, limit=1000)
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(trips)
-        
-        # Save to CSV
-        filename = f"exports/user_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        os.makedirs('exports', exist_ok=True)
-        df.to_csv(filename, index=False)
-        
-        return filename
+    def export_to_csv(self, user_id: str) -> Iterator[str]:
+        """Export user trips as CSV, streamed"""
+        return iter_csv(self._export_trips(user_id), chunk_size=self.export_batch_size)
     
-    def export_to_excel(self, user_id: str) -> str:
-        """Export user data to Excel"""
-        trips = self.db_service.get_user_trips(user_id, page=1, limit=1000)
-        analytics = self.get_user_analytics(user_id)
-        
-        # Create Excel file with multiple sheets
-        filename = f"exports/user_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        os.makedirs('exports', exist_ok=True)
-        
-        with pd.ExcelWriter(filename, engine='xlsxwriter') as writer:
-            # Trips sheet
-            df_trips = pd.DataFrame(trips)
-            df_trips.to_excel(writer, sheet_name='Trips', index=False)
-            
-            # Analytics sheet
-            df_analytics = pd.DataFrame([analytics])
-            df_analytics.to_excel(writer, sheet_name='Analytics', index=False)
-        
-        return filename
+    def export_to_ndjson(self, user_id: str) -> Iterator[str]:
+        """Export user trips as newline-delimited JSON, streamed"""
+        return iter_ndjson(self._export_trips(user_id), self.export_batch_size)
+    
+    def export_to_excel(self, user_id: str, path: str,
+                        progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Export user data to an Excel file at path, reporting (rows written, total rows) to progress"""
+        report = None
+        if progress:
+            total = min(self.db_service.count_trips(user_id=user_id), EXCEL_MAX_ROWS)
+            report = lambda rows: progress(rows, total)
+        return write_excel(path, self._export_trips(user_id), self.get_user_analytics(user_id, 'all'),
+                           progress=report)
+    
+    def export_to_parquet(self, path: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                          districts: Optional[List[str]] = None, user_id: Optional[str] = None,
+                          progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Export trips and location fixes as Parquet datasets partitioned by district and date"""
+        report = None
+        if progress:
+            total = self.db_service.count_trips(start, end, user_id) + \
+                self.db_service.count_location_history(start, end, user_id)
+            report = lambda rows: progress(rows, total)
+        batch_size = self.parquet_batch_size
+        return write_parquet(
+            path,
+            self.db_service.iter_trips(start, end, user_id, batch_size),
+            self.db_service.iter_location_history(start, end, user_id, batch_size),
+            self.district_index, districts, batch_size, progress=report
+        )
+    
+    def export_parquet_archive(self, user_id: str, zip_path: str, start: Optional[datetime] = None,
+                               end: Optional[datetime] = None, districts: Optional[List[str]] = None,
+                               progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Export a user's Parquet datasets as a zip archive at zip_path"""
+        export_dir = tempfile.mkdtemp()
+        try:
+            result = self.export_to_parquet(export_dir, start, end, districts, user_id, progress)
+            zip_directory(export_dir, zip_path)
+        finally:
+            shutil.rmtree(export_dir, ignore_errors=True)
+        return result
     
     def generate_insights(self, user_id: str) -> List[Dict[str, str]]:
         """Generate AI-powered insights"""
-        analytics = self.get_user_analytics(user_id)
+        analytics = self.get_user_analytics(user_id, 'all')
         insights = []
         
         # Trip frequency insight
@@ -0,0 +1,224 @@
+"""
+Speed Profile Module
+Hour-of-week travel speeds per grid cell, aggregated from stored GPS traces
+
+Rebuild the profiles from the locations collection:
+    python speed_profiles.py speed_profiles [cell_size] [chunk_size]
+"""
+
+import os
+import sys
+import json
+import logging
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Any, Iterable, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_WEEK = 168
+MIN_SPEED = 2.0     # km/h; slower fixes are stops, not travel
+MAX_SPEED = 200.0   # km/h; faster fixes are GPS noise
+PROFILE_ARRAYS = ('keys', 'speed', 'samples')
+
+def cell_keys(lats: np.ndarray, lngs: np.ndarray, cell_size: float) -> np.ndarray:
+    """Grid cell key of each point"""
+    rows = np.floor((np.asarray(lats) + 90) / cell_size).astype(np.int64)
+    cols = np.floor((np.asarray(lngs) + 180) / cell_size).astype(np.int64)
+    return rows * (int(360 / cell_size) + 1) + cols
+
+def hour_of_week(timestamp: Any) -> int:
+    """Hour of week (0 = Monday 00:00) of an ISO string or epoch timestamp, in local time"""
+    if isinstance(timestamp, str):
+        moment = datetime.fromisoformat(timestamp)
+    elif isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+        moment = datetime.fromtimestamp(timestamp / 1000 if timestamp > 1e11 else timestamp)
+    elif isinstance(timestamp, datetime):
+        moment = timestamp
+    else:
+        raise ValueError('timestamp must be an ISO string or epoch number')
+    return moment.weekday() * 24 + moment.hour
+
+# =====================
+# Speed Profiles
+# =====================
+
+class SpeedProfiles:
+    """Per-cell hour-of-week speeds, one row per cell sorted by cell key
+
+    speed[row, hour] is the harmonic mean speed (km/h) of moving fixes, which
+    averages travel time rather than speed; samples[row, hour] counts them.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.keys = arrays['keys']
+        self.speed = arrays['speed']
+        self.samples = arrays['samples']
+        self.meta = meta
+        self.cell_size = meta['cell_size']
+        self.min_samples = meta.get('min_samples', 5)
+
+    def __len__(self) -> int:
+        return self.keys.size
+
+    def save(self, path: str):
+        """Write uncompressed .npy arrays plus meta.json"""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'keys.npy'), self.keys)
+        np.save(os.path.join(path, 'speed.npy'), self.speed)
+        np.save(os.path.join(path, 'samples.npy'), self.samples)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, path: str) -> 'SpeedProfiles':
+        """Memory-map saved profiles, so forked workers share their pages"""
+        arrays = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+            for name in PROFILE_ARRAYS
+        }
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        return cls(arrays, meta)
+
+    def rows(self, lats, lngs) -> np.ndarray:
+        """Profile row of each point's cell, -1 where no trace passed"""
+        keys = cell_keys(lats, lngs, self.cell_size)
+        if not self.keys.size:
+            return np.full(keys.size, -1)
+        rows = np.minimum(np.searchsorted(self.keys, keys), self.keys.size - 1)
+        return np.where(self.keys[rows] == keys, rows, -1)
+
+    def speeds(self, rows: np.ndarray, hour: int) -> np.ndarray:
+        """Observed speed per row at an hour of week, NaN without enough samples"""
+        rows = np.asarray(rows)
+        result = np.full(rows.size, np.nan)
+        known = rows >= 0
+        hour_speed = self.speed[rows[known], hour].astype(float)
+        enough = self.samples[rows[known], hour] >= self.min_samples
+        result[np.flatnonzero(known)[enough]] = hour_speed[enough]
+        return result
+
+    def speed_at(self, lat: float, lng: float, hour: int) -> Optional[float]:
+        """Observed speed at a point and hour of week, None without enough samples"""
+        speed = self.speeds(self.rows([lat], [lng]), hour)[0]
+        return None if np.isnan(speed) else float(speed)
+
+# =====================
+# Aggregation Job
+# =====================
+
+class SpeedProfileBuilder:
+    """Streaming aggregation of fixes into per-cell hour-of-week sums
+
+    Memory grows with the number of distinct cells, not with the number of
+    fixes: each chunk is reduced to per-cell sums before it is merged.
+    """
+
+    def __init__(self, cell_size: float = 0.005, min_samples: int = 5):
+        self.cell_size = cell_size  # degrees
+        self.min_samples = min_samples
+        self.keys = np.empty(0, dtype=np.int64)
+        self.pace = np.zeros((0, HOURS_PER_WEEK))  # sum of hours per km
+        self.samples = np.zeros((0, HOURS_PER_WEEK), dtype=np.uint32)
+        self.fixes = 0
+
+    def add(self, lats, lngs, speeds, hours):
+        """Merge one chunk of fixes (speeds in km/h, hours of week)"""
+        lats, lngs = np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float)
+        speeds, hours = np.asarray(speeds, dtype=float), np.asarray(hours, dtype=np.int64)
+        moving = (speeds >= MIN_SPEED) & (speeds <= MAX_SPEED) & np.isfinite(lats) & np.isfinite(lngs)
+        if not moving.any():
+            return
+        lats, lngs, speeds, hours = lats[moving], lngs[moving], speeds[moving], hours[moving]
+        self.fixes += speeds.size
+
+        # Reduce the chunk to per-cell sums
+        chunk_keys, inverse = np.unique(cell_keys(lats, lngs, self.cell_size), return_inverse=True)
+        slots = inverse.ravel() * HOURS_PER_WEEK + hours
+        size = chunk_keys.size * HOURS_PER_WEEK
+        chunk_pace = np.bincount(slots, weights=1 / speeds, minlength=size).reshape(-1, HOURS_PER_WEEK)
+        chunk_samples = np.bincount(slots, minlength=size).reshape(-1, HOURS_PER_WEEK)
+
+        # Grow the accumulators only when the chunk brings new cells
+        new_keys = np.setdiff1d(chunk_keys, self.keys, assume_unique=True)
+        if new_keys.size:
+            keys = np.union1d(self.keys, new_keys)
+            old_rows = np.searchsorted(keys, self.keys)
+            pace = np.zeros((keys.size, HOURS_PER_WEEK))
+            samples = np.zeros((keys.size, HOURS_PER_WEEK), dtype=np.uint32)
+            pace[old_rows] = self.pace
+            samples[old_rows] = self.samples
+            self.keys, self.pace, self.samples = keys, pace, samples
+
+        rows = np.searchsorted(self.keys, chunk_keys)
+        self.pace[rows] += chunk_pace
+        self.samples[rows] += chunk_samples.astype(np.uint32)
+
+    def add_fixes(self, fixes: Iterable[Dict]):
+        """Merge one chunk of location documents, skipping unusable ones"""
+        lats, lngs, speeds, hours = [], [], [], []
+        for fix in fixes:
+            try:
+                hour = hour_of_week(fix['timestamp'])
+                lat, lng, speed = float(fix['lat']), float(fix['lng']), float(fix.get('speed') or 0)
+            except (KeyError, TypeError, ValueError):
+                continue
+            lats.append(lat)
+            lngs.append(lng)
+            speeds.append(speed)
+            hours.append(hour)
+        if lats:
+            self.add(lats, lngs, speeds, hours)
+
+    def build(self) -> SpeedProfiles:
+        """Harmonic mean speeds as compact float16/uint16 arrays"""
+        speed = np.divide(self.samples, self.pace, out=np.zeros_like(self.pace), where=self.pace > 0)
+        return SpeedProfiles({
+            'keys': self.keys,
+            'speed': speed.astype(np.float16),
+            'samples': np.minimum(self.samples, np.iinfo(np.uint16).max).astype(np.uint16)
+        }, {
+            'cell_size': self.cell_size,
+            'min_samples': self.min_samples,
+            'fixes': int(self.fixes),
+            'built_at': datetime.now().isoformat()
+        })
+
+def build_from_fixes(fixes: Iterable[Dict], cell_size: float = 0.005,
+                     chunk_size: int = 100000, min_samples: int = 5) -> SpeedProfiles:
+    """Aggregate a stream of location documents chunk by chunk"""
+    builder = SpeedProfileBuilder(cell_size, min_samples)
+    fixes = iter(fixes)
+    while True:
+        chunk = list(islice(fixes, chunk_size))
+        if not chunk:
+            break
+        builder.add_fixes(chunk)
+        logger.info(f"Aggregated {builder.fixes} moving fixes into {builder.keys.size} cells")
+    return builder.build()
+
+def load_speed_profiles(path: Optional[str]) -> Optional[SpeedProfiles]:
+    """Load saved speed profiles, None when none are configured or present"""
+    if not path or not os.path.isfile(os.path.join(path, 'meta.json')):
+        return None
+    try:
+        profiles = SpeedProfiles.load(path)
+        logger.info(f"Loaded speed profiles for {len(profiles)} cells")
+        return profiles
+    except Exception as e:
+        logger.error(f"Speed profile load error: {str(e)}")
+        return None
+
+
+if __name__ == '__main__':
+    from services import DatabaseService
+
+    logging.basicConfig(level=logging.INFO)
+    output = sys.argv[1] if len(sys.argv) > 1 else 'speed_profiles'
+    cell_size = float(sys.argv[2]) if len(sys.argv) > 2 else 0.005
+    chunk_size = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+
+    db_service = DatabaseService()
+    build_from_fixes(db_service.iter_locations(chunk_size), cell_size, chunk_size).save(output)
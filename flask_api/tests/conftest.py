@@ -0,0 +1,51 @@
+"""
+Shared test fixtures: the API modules on the path and an in-memory MongoDB
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('MONGO_ENSURE_INDEXES', 'false')
+os.environ.setdefault('EXPORT_JOB_SWEEP_INTERVAL', '0')
+
+import pytest
+import mongomock
+
+@pytest.fixture
+def mongo_db():
+    return mongomock.MongoClient().natpac
+
+@pytest.fixture
+def db_service(mongo_db):
+    from services import DatabaseService
+    service = DatabaseService()
+    service.db = mongo_db
+    return service
+
+@pytest.fixture
+def api(mongo_db):
+    """The Flask app module with every service on the in-memory database"""
+    import app as api_module
+    for name in dir(api_module):
+        service = getattr(api_module, name)
+        if name.endswith('_service') and hasattr(service, 'mongo_uri'):
+            service.db = mongo_db
+        elif name.endswith('_service') and hasattr(service, 'db_service'):
+            service.db_service.db = mongo_db
+    api_module.app.config['TESTING'] = True
+    api_module.limiter.enabled = False
+    return api_module
+
+@pytest.fixture
+def client(api):
+    return api.app.test_client()
+
+@pytest.fixture
+def auth_headers(api):
+    from flask_jwt_extended import create_access_token
+
+    def headers(user_id='user-1'):
+        with api.app.app_context():
+            return {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+    return headers
@@ -0,0 +1,105 @@
+"""Dashboard totals: the aggregation pipeline against the Python path"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from services import AnalyticsService, PERIOD_DAYS
+
+def _stored(moment, i):
+    # Start times arrive as ISO strings, epoch seconds or epoch milliseconds
+    return [moment.isoformat(), moment.timestamp(), int(moment.timestamp() * 1000)][i % 3]
+
+def _trips(now):
+    modes = ['car', 'bus', 'walk', None, 'bus', 'metro']
+    purposes = ['work', None, 'shopping', 'work', 'education']
+    trips = []
+    for i in range(60):
+        trip = {
+            'id': f'trip-{i:03d}',
+            'user_id': 'user-1' if i % 7 else 'user-2',
+            'start_time': _stored(now - timedelta(days=i * 3, hours=i), i),
+            'distance': [12.5, 3, 0.1, '7 km', None][i % 5],
+            'duration': [30, 15.25, 2.5, 45][i % 4]
+        }
+        if modes[i % len(modes)]:
+            trip['mode'] = modes[i % len(modes)]
+        if purposes[i % len(purposes)]:
+            trip['purpose'] = purposes[i % len(purposes)]
+        if i % 11 == 0:
+            del trip['duration']
+        trips.append(trip)
+    return trips
+
+@pytest.fixture
+def analytics(db_service):
+    db_service.db.trips.insert_many(_trips(datetime.now()))
+    service = AnalyticsService()
+    service.db_service = db_service
+    return service
+
+@pytest.mark.parametrize('period', list(PERIOD_DAYS))
+def test_pipeline_matches_python(analytics, period):
+    days = PERIOD_DAYS[period]
+    since = datetime.now() - timedelta(days=days) if days else None
+    db = analytics.db_service
+    pipeline = db.trip_totals('user-1', since, use_pipeline=True)
+    python = db.trip_totals('user-1', since, use_pipeline=False)
+    assert pipeline['trips'] == python['trips'] > 0
+    assert pipeline['distance'] == pytest.approx(python['distance'])
+    assert pipeline['duration'] == pytest.approx(python['duration'])
+    assert pipeline['modes'] == python['modes']
+    assert list(pipeline['modes']) == list(python['modes'])
+    assert pipeline['purposes'] == python['purposes']
+
+@pytest.mark.parametrize('period', list(PERIOD_DAYS))
+def test_dashboard_is_the_same_on_both_paths(analytics, period):
+    analytics.use_pipeline = True
+    pipeline = analytics.get_user_analytics('user-1', period)
+    analytics.use_pipeline = False
+    python = analytics.get_user_analytics('user-1', period)
+    for result in (pipeline, python):
+        result.pop('generated_at')
+        result.pop('since')
+    assert pipeline == python
+
+def test_periods_widen(analytics):
+    counts = [analytics.get_user_analytics('user-1', period)['total_trips'] for period in PERIOD_DAYS]
+    assert counts == sorted(counts)
+    assert counts[-1] == analytics.db_service.db.trips.count_documents({'user_id': 'user-1'})
+
+def test_all_has_no_window(analytics):
+    result = analytics.get_user_analytics('user-1', 'all')
+    assert result['period'] == 'all'
+    assert result['since'] is None
+
+def test_insights_cover_all_trips(analytics):
+    # Only the most recent user-1 trip falls in the last week
+    assert analytics.get_user_analytics('user-1')['total_trips'] < 20
+    titles = [insight['title'] for insight in analytics.generate_insights('user-1')]
+    assert 'Frequent Traveler' in titles
+
+def test_python_sum_skips_booleans(db_service):
+    now = datetime.now().isoformat()
+    db_service.db.trips.insert_many([
+        {'id': 'a', 'user_id': 'u', 'start_time': now, 'distance': True, 'duration': 4},
+        {'id': 'b', 'user_id': 'u', 'start_time': now, 'distance': 2.5, 'duration': False}
+    ])
+    totals = db_service.trip_totals('u', use_pipeline=False)
+    assert totals['distance'] == 2.5
+    assert totals['duration'] == 4
+
+def test_no_trips(db_service):
+    service = AnalyticsService()
+    service.db_service = db_service
+    assert service.get_user_analytics('nobody', 'all')['total_trips'] == 0
+
+def test_dashboard_rejects_unknown_period(client, auth_headers):
+    response = client.get('/api/analytics/dashboard?period=decade', headers=auth_headers())
+    assert response.status_code == 400
+    assert 'period' in response.get_json()['error']
+
+def test_dashboard_all_period(client, auth_headers):
+    response = client.get('/api/analytics/dashboard?period=all', headers=auth_headers())
+    assert response.status_code == 200
+    assert response.get_json()['total_trips'] == 0
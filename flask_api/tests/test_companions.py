@@ -0,0 +1,52 @@
+"""Companion detection over stored fixes"""
+
+import pytest
+
+from companions import CompanionService
+
+def fixes(user_id, trip_id=None, lat0=10.0, lng0=76.0, minutes=10):
+    # One fix every 20 s moving north
+    return [{'user_id': user_id, 'trip_id': trip_id, 'lat': lat0 + i * 1e-4, 'lng': lng0,
+             'timestamp': f'2025-01-01T08:{i // 3:02d}:{(i % 3) * 20:02d}'} for i in range(minutes * 3)]
+
+@pytest.fixture
+def service(db_service):
+    db_service.db.locations.insert_many(
+        fixes('owner', 'trip-1') +
+        fixes('friend', lng0=76.0002) +              # about 20 m east the whole way
+        fixes('stranger', lat0=10.5) +               # same time, far away
+        fixes('intruder', 'trip-1', lng0=77.0)       # tagged with the owner's trip
+    )
+    return CompanionService(db_service)
+
+def test_companion_found(service):
+    companions = service.detect_for_trip('trip-1', 'owner')
+    assert [c['user_id'] for c in companions] == ['friend']
+    assert companions[0]['confidence'] == 1.0
+
+def test_trace_only_holds_the_owners_fixes(service, db_service):
+    assert {f['user_id'] for f in db_service.get_trip_gps_data('trip-1', 'owner')} == {'owner'}
+    # The intruder's fixes, 100 km away, would otherwise stretch the trip's
+    # extent and its buckets
+    calls = []
+    original = db_service.get_locations_between
+    def spy(*args, **kwargs):
+        calls.append(kwargs['bounds'])
+        return original(*args, **kwargs)
+    db_service.get_locations_between = spy
+    service.detect_for_trip('trip-1', 'owner')
+    min_lat, min_lng, max_lat, max_lng = calls[0]
+    assert max_lng < 76.01 and max_lat < 10.01
+
+def test_window_query_is_bounded(db_service, service):
+    bounds = (9.99, 75.99, 10.01, 76.01)
+    near = list(db_service.get_locations_between('2025-01-01T08:00:00', '2025-01-01T09:00:00',
+                                                 'owner', bounds))
+    assert {f['user_id'] for f in near} == {'friend'}
+    capped = list(db_service.get_locations_between('2025-01-01T08:00:00', '2025-01-01T09:00:00',
+                                                   'owner', bounds, limit=5))
+    assert len(capped) == 5
+
+def test_cap_limits_fixes_read(service):
+    service.max_fixes = 3  # too few fixes to share enough buckets
+    assert service.detect_for_trip('trip-1', 'owner') == []
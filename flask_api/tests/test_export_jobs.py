@@ -0,0 +1,154 @@
+"""Background export jobs shared by workers through MongoDB"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from export_jobs import ExportJobManager, ExportJobLimit
+from indexes import ensure_indexes
+
+def wait_for(manager, job_id, user_id='user-1', status=('done', 'failed')):
+    for _ in range(200):
+        job = manager.get(job_id, user_id)
+        if job and job.status in status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} never reached {status}')
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    event.set()
+
+@pytest.fixture
+def workers(db_service, tmp_path, release):
+    """Two managers on one database and directory, like two gunicorn workers"""
+    def build(path, user_id, params, progress):
+        if params.get('block'):
+            release.wait(5)
+        if params.get('fail'):
+            raise ValueError('bad export')
+        progress(3, 3)
+        with open(path, 'w') as f:
+            f.write(f'{user_id}:{params}')
+
+    def manager(**options):
+        return ExportJobManager({'text': (build, 'txt')}, db_service, directory=str(tmp_path),
+                                sweep_interval=0, **options)
+    return manager(), manager()
+
+def test_job_submitted_on_one_worker_is_served_by_another(workers):
+    first, second = workers
+    job, created = first.submit('user-1', 'text', {'n': 1})
+    assert created
+    done = wait_for(second, job.id)
+    assert done.status == 'done'
+    assert done.to_dict()['progress'] == {'rows': 3, 'total': 3, 'percent': 100.0}
+    with open(done.path) as f:
+        assert f.read().startswith('user-1:')
+    assert second.get(job.id, 'user-2') is None
+
+def test_identical_export_is_joined_across_workers(workers, release):
+    first, second = workers
+    job, _ = first.submit('user-1', 'text', {'block': True})
+    joined, created = second.submit('user-1', 'text', {'block': True})
+    assert not created
+    assert joined.id == job.id
+    release.set()
+    wait_for(first, job.id)
+    # Finished jobs are not joined
+    again, created = second.submit('user-1', 'text', {'block': True})
+    assert created and again.id != job.id
+
+def test_racing_submits_are_settled_by_the_unique_index(workers, db_service, monkeypatch, release):
+    ensure_indexes(db_service.db)
+    first, second = workers
+    job, _ = first.submit('user-1', 'text', {'block': True})
+    # The second worker looked before the first job was stored
+    find = db_service.find_active_export_job
+    missed = []
+    def lookup(key):
+        if not missed:
+            missed.append(key)
+            return None
+        return find(key)
+    monkeypatch.setattr(db_service, 'find_active_export_job', lookup)
+    joined, created = second.submit('user-1', 'text', {'block': True})
+    assert not created
+    assert joined.id == job.id
+    assert db_service.db.export_jobs.count_documents({}) == 1
+    release.set()
+    wait_for(first, job.id)
+
+def test_active_jobs_per_user_are_capped(db_service, tmp_path, release):
+    manager = ExportJobManager({'text': (lambda path, user_id, params, progress: release.wait(5), 'txt')},
+                               db_service, directory=str(tmp_path), max_active=2, sweep_interval=0)
+    manager.submit('user-1', 'text', {'n': 1})
+    manager.submit('user-1', 'text', {'n': 2})
+    with pytest.raises(ExportJobLimit):
+        manager.submit('user-1', 'text', {'n': 3})
+    manager.submit('user-2', 'text', {'n': 1})
+    assert db_service.count_active_export_jobs('user-1') == 2
+
+def test_failed_job_reports_its_error(workers):
+    first, _ = workers
+    job, _ = first.submit('user-1', 'text', {'fail': True})
+    failed = wait_for(first, job.id)
+    assert failed.status == 'failed'
+    assert failed.error == 'bad export'
+    assert not os.path.exists(failed.path)
+
+def test_sweep_deletes_expired_jobs_and_files(workers, db_service):
+    first, second = workers
+    job, _ = first.submit('user-1', 'text', {'n': 1})
+    done = wait_for(first, job.id)
+    db_service.update_export_job(job.id, {'expires_at': time.time() - 1})
+    assert first.get(job.id, 'user-1') is None
+    assert second.sweep()['expired'] == 1
+    assert not os.path.exists(done.path)
+    assert db_service.get_export_job(job.id) is None
+    assert first.sweep()['expired'] == 0
+
+def test_sweep_fails_jobs_of_stopped_workers(db_service, tmp_path, release):
+    build = (lambda path, user_id, params, progress: release.wait(5), 'txt')
+    live = ExportJobManager({'text': build}, db_service, directory=str(tmp_path), sweep_interval=10)
+    job, _ = live.submit('user-1', 'text', {'n': 1})
+    orphan, _ = live.submit('user-1', 'text', {'n': 2})
+    # The orphan's worker is gone: nothing touches it any more
+    with live._lock:
+        live._local.pop(orphan.id)
+    db_service.db.export_jobs.update_many({}, {'$set': {'updated_at': time.time() - 60}})
+    assert live.sweep()['failed'] == 1
+    assert db_service.get_export_job(orphan.id)['status'] == 'failed'
+    assert db_service.get_export_job(job.id)['status'] in ('queued', 'running')
+
+def test_stats_count_shared_jobs(workers):
+    first, second = workers
+    job, _ = first.submit('user-1', 'text', {'n': 1})
+    wait_for(first, job.id)
+    assert second.stats()['done'] == 1
+    assert second.stats()['local'] == 0
+
+def test_export_job_endpoints(api, client, auth_headers, tmp_path):
+    headers = auth_headers()
+    response = client.post('/api/analytics/export/jobs', headers=headers, json={'format': 'excel'})
+    assert response.status_code == 202
+    status_url = response.get_json()['status_url']
+    for _ in range(200):
+        job = client.get(status_url, headers=headers).get_json()
+        if job['status'] in ('done', 'failed'):
+            break
+        time.sleep(0.01)
+    assert job['status'] == 'done'
+    assert client.get(status_url, headers=auth_headers('user-2')).status_code == 404
+    download = client.get(job['download_url'], headers=headers)
+    assert download.status_code == 200
+    assert download.data[:2] == b'PK'  # xlsx is a zip
+
+def test_export_job_limit_is_429(api, client, auth_headers, monkeypatch):
+    monkeypatch.setattr(api.export_jobs, 'max_active', 0)
+    response = client.post('/api/analytics/export/jobs', headers=auth_headers(), json={'format': 'excel'})
+    assert response.status_code == 429
@@ -0,0 +1,110 @@
+"""Streaming trip exports"""
+
+import csv
+import io
+import os
+import json
+import tempfile
+
+import pytest
+
+from exports import TRIP_EXPORT_COLUMNS, iter_csv, iter_json, iter_ndjson
+
+def trips(count, user_id='user-1'):
+    return [{'id': f'trip-{i:04d}', 'user_id': user_id, 'start_time': f'2025-01-01T08:{i % 60:02d}:{i // 60:02d}',
+             'mode': 'bus', 'purpose': 'work', 'distance': i / 10,
+             'start_location': {'lat': 10.0, 'lng': 76.0, 'name': 'Kochi, "Jetty"'}} for i in range(count)]
+
+class Counted:
+    """Iterator that records how many items were taken"""
+
+    def __init__(self, items):
+        self.items, self.taken = iter(items), 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self.items)
+        self.taken += 1
+        return item
+
+def test_csv_streams_chunk_by_chunk():
+    source = Counted(trips(25))
+    stream = iter_csv(source, chunk_size=10)
+    first = next(stream)
+    assert source.taken == 10
+    rows = list(csv.reader(io.StringIO(first + ''.join(stream))))
+    assert rows[0] == list(TRIP_EXPORT_COLUMNS)
+    assert len(rows) == 26
+    assert json.loads(rows[1][TRIP_EXPORT_COLUMNS.index('start_location')])['name'] == 'Kochi, "Jetty"'
+
+def test_csv_without_trips_is_a_header():
+    assert list(csv.reader(io.StringIO(''.join(iter_csv([]))))) == [list(TRIP_EXPORT_COLUMNS)]
+
+def test_ndjson_streams_chunk_by_chunk():
+    source = Counted(trips(25))
+    stream = iter_ndjson(source, chunk_size=10)
+    next(stream)
+    assert source.taken == 10
+    lines = (''.join(iter_ndjson(trips(25), chunk_size=10))).splitlines()
+    assert [json.loads(line) for line in lines] == trips(25)
+
+@pytest.mark.parametrize('count', [0, 1, 10, 25])
+def test_json_document_is_valid(count):
+    document = json.loads(''.join(iter_json({'user_id': 'user-1'}, trips(count), chunk_size=10)))
+    assert document['user_id'] == 'user-1'
+    assert document['trips'] == trips(count)
+    assert document['total_trips'] == count
+
+def test_json_without_fields():
+    assert json.loads(''.join(iter_json({}, trips(3)))) == {'trips': trips(3), 'total_trips': 3}
+
+@pytest.fixture
+def stored(api, mongo_db, monkeypatch):
+    mongo_db.trips.insert_many(trips(120) + trips(5, 'user-2'))
+    # Several pages and chunks per export
+    monkeypatch.setattr(api.analytics_service, 'export_batch_size', 25)
+    return mongo_db
+
+def test_csv_endpoint_streams_every_trip(client, auth_headers, stored):
+    response = client.get('/api/analytics/export?format=csv', headers=auth_headers())
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert 'attachment' in response.headers['Content-Disposition']
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert len(rows) == 120
+    assert {row['user_id'] for row in rows} == {'user-1'}
+
+def test_ndjson_endpoint_streams_newest_first(client, auth_headers, stored):
+    response = client.get('/api/analytics/export?format=ndjson', headers=auth_headers())
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(lines) == 120
+    assert [t['start_time'] for t in lines] == sorted((t['start_time'] for t in lines), reverse=True)
+
+def test_json_endpoint(client, auth_headers, stored):
+    response = client.get('/api/analytics/export?format=json', headers=auth_headers())
+    document = json.loads(response.get_data(as_text=True))
+    assert document['total_trips'] == len(document['trips']) == 120
+    assert document['analytics']['total_trips'] == 120
+    assert document['analytics']['period'] == 'all'
+
+def test_excel_endpoint(client, auth_headers, stored, monkeypatch):
+    paths = []
+    mkstemp = tempfile.mkstemp
+    def recording_mkstemp(*args, **kwargs):
+        fd, path = mkstemp(*args, **kwargs)
+        paths.append(path)
+        return fd, path
+    monkeypatch.setattr(tempfile, 'mkstemp', recording_mkstemp)
+
+    response = client.get('/api/analytics/export?format=excel', headers=auth_headers())
+    assert response.status_code == 200
+    assert response.data[:2] == b'PK'
+    response.close()
+    # The export file, and xlsxwriter's own scratch files
+    assert [path for path in paths if path.endswith('.xlsx')]
+    assert not [path for path in paths if os.path.exists(path)]
+
+def test_unknown_format(client, auth_headers, stored):
+    assert client.get('/api/analytics/export?format=pdf', headers=auth_headers()).status_code == 400
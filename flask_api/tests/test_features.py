@@ -0,0 +1,48 @@
+"""Segment feature extraction from raw GPS points"""
+
+import numpy as np
+import pytest
+
+from features import extract_segment_features, MIN_SEGMENT_SECONDS
+
+def trace(timestamps, step=1e-4):
+    return [{'timestamp': float(t), 'lat': 10 + i * step, 'lng': 76.0} for i, t in enumerate(timestamps)]
+
+def test_segments_split_on_time():
+    features = extract_segment_features(trace(range(0, 900, 10)), 300)
+    assert len(features['distance']) == 3
+    whole = extract_segment_features(trace(range(0, 900, 10)))
+    assert sum(features['distance']) == pytest.approx(whole['distance'][0])
+
+def test_gaps_do_not_allocate_empty_segments():
+    # Two bursts a year apart: only the two occupied segments are computed
+    points = trace(list(range(0, 100, 10)) + list(range(365 * 86400, 365 * 86400 + 100, 10)))
+    features = extract_segment_features(points, MIN_SEGMENT_SECONDS)
+    assert len(features['segment_start']) == len(features['distance'])
+    assert features['segment_start'][0] == 0
+    assert all(np.diff(features['segment_start']) > 0)
+
+@pytest.mark.parametrize('segment_seconds', [0, -5, 1e-4, float('nan'), float('inf')])
+def test_rejects_bad_segment_seconds(segment_seconds):
+    with pytest.raises(ValueError):
+        extract_segment_features(trace(range(0, 100, 10)), segment_seconds)
+
+def test_batch_endpoint_caps_points(api, client, auth_headers):
+    points = [{'timestamp': i, 'latitude': 10.0, 'longitude': 76.0}
+              for i in range(api.app.config['ML_BATCH_MAX_POINTS'] + 1)]
+    response = client.post('/api/ml/classify-mode/batch', headers=auth_headers(), json={'gps_points': points})
+    assert response.status_code == 400
+
+def test_batch_endpoint_rejects_tiny_segments(client, auth_headers):
+    points = [{'timestamp': i, 'latitude': 10 + i * 1e-4, 'longitude': 76.0} for i in range(60)]
+    response = client.post('/api/ml/classify-mode/batch', headers=auth_headers(),
+                           json={'gps_points': points, 'segment_seconds': 0})
+    assert response.status_code == 400
+
+@pytest.mark.parametrize('endpoint', ['/api/ml/classify-mode', '/api/ml/predict-purpose'])
+def test_single_endpoints_cap_points(api, client, auth_headers, monkeypatch, endpoint):
+    monkeypatch.setitem(api.app.config, 'ML_BATCH_MAX_POINTS', 10)
+    points = [{'timestamp': i, 'latitude': 10 + i * 1e-4, 'longitude': 76.0} for i in range(11)]
+    response = client.post(endpoint, headers=auth_headers(), json={'gps_points': points, 'time': 8})
+    assert response.status_code == 400
+    assert 'gps_points' in response.get_json()['error']
@@ -0,0 +1,154 @@
+"""Geofence set build and query"""
+
+import time
+import numpy as np
+import pytest
+
+from geofence import FenceSet, GridIndex, validate_fences, validate_cell_size
+from services import haversine_array
+
+def in_polygon(lat, lng, polygon):
+    inside = False
+    for (y0, x0), (y1, x1) in zip(polygon, polygon[1:] + polygon[:1]):
+        if (y0 > lat) != (y1 > lat) and lng < x0 + (lat - y0) * (x1 - x0) / (y1 - y0):
+            inside = not inside
+    return inside
+
+def brute_force(fences, lats, lngs):
+    pairs = set()
+    for i, fence in enumerate(fences):
+        if fence.get('type') == 'polygon':
+            pairs |= {(p, i) for p in range(len(lats)) if in_polygon(lats[p], lngs[p], fence['polygon'])}
+        else:
+            distances = haversine_array(lats, lngs, np.full(len(lats), fence['center_lat']),
+                                        np.full(len(lats), fence['center_lng']))
+            pairs |= {(p, i) for p in np.flatnonzero(distances <= fence['radius']).tolist()}
+    return pairs
+
+@pytest.fixture
+def mixed_fences():
+    rng = np.random.default_rng(7)
+    fences = [
+        {'id': f'depot-{i}', 'center_lat': float(lat), 'center_lng': float(lng), 'radius': float(radius)}
+        for i, (lat, lng, radius) in enumerate(zip(
+            rng.uniform(9, 11, 200), rng.uniform(76, 77, 200), rng.uniform(50, 3000, 200)
+        ))
+    ]
+    fences.append({'id': 'district', 'type': 'polygon',
+                   'polygon': [[9.5, 76.0], [11.0, 76.1], [10.8, 77.2], [9.6, 77.5], [9.9, 76.6]]})
+    angles = np.linspace(0, 2 * np.pi, 400, endpoint=False)
+    radii = np.where(np.arange(400) % 2, 0.3, 0.02)
+    fences.append({'id': 'star', 'type': 'polygon',
+                   'polygon': [[10 + r * np.sin(a), 76.5 + r * np.cos(a)] for a, r in zip(angles, radii)]})
+    return fences
+
+def test_query_many_matches_brute_force(mixed_fences):
+    fence_set = FenceSet('set', mixed_fences)
+    rng = np.random.default_rng(1)
+    lats, lngs = rng.uniform(8.9, 11.1, 5000), rng.uniform(75.9, 77.6, 5000)
+
+    points, fences = fence_set.query_many(lats, lngs)
+
+    assert set(zip(points.tolist(), fences.tolist())) == brute_force(mixed_fences, lats, lngs)
+
+def test_single_point_query_matches_batch(mixed_fences):
+    fence_set = FenceSet('set', mixed_fences)
+    points, fences = fence_set.query_many([10.0, 9.7], [76.5, 76.3])
+    for point, (lat, lng) in enumerate([(10.0, 76.5), (9.7, 76.3)]):
+        assert fence_set.query(lat, lng) == sorted(fences[points == point].tolist())
+
+def test_large_polygon_does_not_expand_the_grid(mixed_fences):
+    start = time.perf_counter()
+    fence_set = FenceSet('set', mixed_fences)
+    assert time.perf_counter() - start < 0.5
+    assert fence_set.index.cell_count <= len(mixed_fences) * GridIndex.MAX_ITEM_CELLS
+
+def test_tiny_cell_size_is_bounded():
+    fence_set = FenceSet('set', [{'center_lat': 10.0, 'center_lng': 76.0, 'radius': 1000}], cell_size=1e-5)
+    assert fence_set.index.cell_count <= GridIndex.MAX_ITEM_CELLS
+    assert fence_set.query(10.0, 76.0) == [0]
+
+@pytest.mark.parametrize('cell_size', ['0.01', -1, 0, 1e-5, 5, True])
+def test_rejects_bad_cell_size(cell_size):
+    assert validate_cell_size(cell_size)
+
+def test_accepts_cell_size_in_range():
+    assert validate_cell_size(None) is None
+    assert validate_cell_size(0.01) is None
+
+@pytest.mark.parametrize('fence', [
+    {'center_lat': 91, 'center_lng': 76},
+    {'center_lat': 10, 'center_lng': -181},
+    {'center_lat': 10, 'center_lng': 76, 'radius': 10 ** 9},
+    {'center_lat': 10, 'center_lng': 76, 'radius': 0},
+    {'type': 'polygon', 'polygon': [[0, 0], [1, 200], [1, 1]]},
+    {'type': 'polygon', 'polygon': [[0, 0], [1, 1]]},
+    {'type': 'square'}
+])
+def test_rejects_bad_fences(fence):
+    assert validate_fences([fence])
+
+def test_create_fence_set_rejects_bad_cell_size(client, auth_headers):
+    response = client.post('/api/gps/geofence-sets', headers=auth_headers(), json={
+        'fences': [{'center_lat': 10.0, 'center_lng': 76.0, 'radius': 500}], 'cell_size': '0.01'
+    })
+    assert response.status_code == 400
+
+def test_create_and_classify_fence_set(client, auth_headers):
+    response = client.post('/api/gps/geofence-sets', headers=auth_headers(), json={
+        'fences': [{'id': 'depot', 'center_lat': 10.0, 'center_lng': 76.0, 'radius': 500}]
+    })
+    assert response.status_code == 201
+    set_id = response.get_json()['fence_set_id']
+
+    response = client.post('/api/gps/geofence/classify', headers=auth_headers(), json={
+        'fence_set_id': set_id,
+        'points': [{'latitude': 10.001, 'longitude': 76.0}, {'latitude': 10.1, 'longitude': 76.0}]
+    })
+    assert response.status_code == 200
+    assert response.get_json()['memberships'] == [['depot'], []]
+
+def test_classify_trip_uses_only_the_owners_fixes(client, auth_headers, mongo_db):
+    mongo_db.trips.insert_one({'id': 'trip-1', 'user_id': 'user-1', 'start_time': '2025-01-01T08:00:00'})
+    mongo_db.locations.insert_many([
+        {'user_id': 'user-1', 'trip_id': 'trip-1', 'lat': 10.001, 'lng': 76.0, 'timestamp': '2025-01-01T08:00:00'},
+        {'user_id': 'user-1', 'trip_id': 'trip-1', 'lat': 10.1, 'lng': 76.0, 'timestamp': '2025-01-01T08:01:00'},
+        {'user_id': 'user-2', 'trip_id': 'trip-1', 'lat': 10.0, 'lng': 76.0, 'timestamp': '2025-01-01T08:00:30'}
+    ])
+    set_id = client.post('/api/gps/geofence-sets', headers=auth_headers(), json={
+        'fences': [{'id': 'depot', 'center_lat': 10.0, 'center_lng': 76.0, 'radius': 500}]
+    }).get_json()['fence_set_id']
+    response = client.post('/api/gps/geofence/classify', headers=auth_headers(),
+                           json={'fence_set_id': set_id, 'trip_id': 'trip-1'})
+    assert response.status_code == 200
+    assert response.get_json()['points'] == 2
+    assert response.get_json()['memberships'] == [['depot'], []]
+
+@pytest.fixture
+def depot_set(client, auth_headers):
+    return client.post('/api/gps/geofence-sets', headers=auth_headers(), json={
+        'fences': [{'id': 'depot', 'center_lat': 10.0, 'center_lng': 76.0, 'radius': 500}]
+    }).get_json()['fence_set_id']
+
+def test_check_against_own_fence_set(client, auth_headers, depot_set):
+    response = client.post('/api/gps/geofence', headers=auth_headers(),
+                           json={'fence_set_id': depot_set, 'latitude': 10.001, 'longitude': 76.0})
+    assert response.status_code == 200
+    assert [hit['fence_id'] for hit in response.get_json()['results']] == ['depot']
+
+@pytest.mark.parametrize('fix', [{}, {'latitude': 91, 'longitude': 76.0}, {'latitude': '10', 'longitude': 76.0}])
+def test_check_against_fence_set_validates_the_fix(client, auth_headers, depot_set, fix):
+    response = client.post('/api/gps/geofence', headers=auth_headers(), json=dict(fix, fence_set_id=depot_set))
+    assert response.status_code == 400
+
+@pytest.mark.parametrize('cached', [True, False])
+def test_fence_sets_are_private_to_their_owner(api, client, auth_headers, depot_set, cached):
+    if not cached:
+        api.geofence_service.fence_sets.clear()  # a worker that has not built the set
+    response = client.post('/api/gps/geofence', headers=auth_headers('user-2'),
+                           json={'fence_set_id': depot_set, 'latitude': 10.0, 'longitude': 76.0})
+    assert response.status_code == 404
+    response = client.post('/api/gps/geofence/classify', headers=auth_headers('user-2'),
+                           json={'fence_set_id': depot_set, 'points': [{'latitude': 10.0, 'longitude': 76.0}]})
+    assert response.status_code == 404
+    assert api.geofence_service.get_fence_set(depot_set, 'user-1') is not None
@@ -0,0 +1,86 @@
+"""GPS ingestion against trips of the caller and of other users"""
+
+import pytest
+
+def point(i):
+    return {'latitude': 10.0 + i * 1e-4, 'longitude': 76.0, 'speed': 20,
+            'timestamp': f'2025-01-01T08:00:{i:02d}'}
+
+@pytest.fixture
+def trips(api, mongo_db):
+    mongo_db.trips.insert_many([
+        {'id': 'mine', 'user_id': 'user-1', 'start_time': '2025-01-01T08:00:00', 'mode': 'car', 'purpose': 'work'},
+        {'id': 'theirs', 'user_id': 'user-2', 'start_time': '2025-01-01T08:00:00', 'mode': 'bus', 'purpose': 'work'}
+    ])
+    return mongo_db
+
+def test_batch_into_own_trip(client, auth_headers, trips):
+    response = client.post('/api/gps/track/batch', headers=auth_headers(),
+                           json={'trip_id': 'mine', 'points': [point(i) for i in range(5)]})
+    assert response.status_code == 200
+    assert trips.locations.count_documents({'trip_id': 'mine'}) == 5
+    assert trips.trips.find_one({'id': 'mine'})['gps_aggregates']['points'] == 5
+
+@pytest.mark.parametrize('trip_id', ['theirs', 'missing'])
+def test_batch_into_foreign_trip_is_rejected(client, auth_headers, trips, trip_id):
+    response = client.post('/api/gps/track/batch', headers=auth_headers(),
+                           json={'trip_id': trip_id, 'points': [point(i) for i in range(5)]})
+    assert response.status_code == 404
+    assert trips.locations.count_documents({}) == 0
+    assert 'gps_aggregates' not in trips.trips.find_one({'id': 'theirs'})
+
+def test_batch_without_trip(client, auth_headers, trips):
+    response = client.post('/api/gps/track/batch', headers=auth_headers(),
+                           json={'points': [point(0), {'latitude': 91, 'longitude': 0}]})
+    assert response.status_code == 207
+    body = response.get_json()
+    assert (body['stored'], body['rejected']) == (1, 1)
+
+def test_aggregate_writes_are_scoped_to_the_owner(db_service, trips):
+    increment = {'points': 1, 'distance': 5.0, 'speed_sum': 20, 'stop_count': 0, 'moving_points': 1,
+                 'speed_min': 20, 'speed_max': 20}
+    db_service.update_trip_aggregates('theirs', 'user-1', increment)
+    db_service.set_trip_aggregates('theirs', 'user-1', {'points': 99})
+    assert 'gps_aggregates' not in trips.trips.find_one({'id': 'theirs'})
+    assert db_service.get_trip_aggregates('theirs', 'user-1') is None
+    db_service.update_trip_aggregates('theirs', 'user-2', increment)
+    assert db_service.get_trip_aggregates('theirs', 'user-2')['points'] == 1
+
+def test_analytics_of_own_trip(client, auth_headers, trips):
+    client.post('/api/gps/track/batch', headers=auth_headers(),
+                json={'trip_id': 'mine', 'points': [point(i) for i in range(5)]})
+    running = client.get('/api/gps/analytics?trip_id=mine', headers=auth_headers())
+    recomputed = client.get('/api/gps/analytics?trip_id=mine&recompute=true', headers=auth_headers())
+    assert running.status_code == recomputed.status_code == 200
+    assert running.get_json()['points_analyzed'] == recomputed.get_json()['points_analyzed'] == 5
+    assert running.get_json()['total_distance'] == pytest.approx(recomputed.get_json()['total_distance'])
+
+def test_analytics_of_foreign_trip_is_rejected(client, auth_headers, trips):
+    response = client.get('/api/gps/analytics?trip_id=theirs&recompute=true', headers=auth_headers())
+    assert response.status_code == 404
+    assert 'gps_aggregates' not in trips.trips.find_one({'id': 'theirs'})
+
+def test_first_batch_seeds_totals_from_the_full_trace(client, auth_headers, trips):
+    # Fixes stored before the trip had running totals
+    trips.locations.insert_many([
+        {'trip_id': 'mine', 'user_id': 'user-1', 'lat': 10.0 - i * 1e-4, 'lng': 76.0, 'speed': 10,
+         'timestamp': f'2025-01-01T07:59:{50 + i:02d}'} for i in range(5)
+    ])
+    client.post('/api/gps/track/batch', headers=auth_headers(),
+                json={'trip_id': 'mine', 'points': [point(i) for i in range(5)]})
+    running = client.get('/api/gps/analytics?trip_id=mine', headers=auth_headers()).get_json()
+    recomputed = client.get('/api/gps/analytics?trip_id=mine&recompute=true', headers=auth_headers()).get_json()
+    assert running['points_analyzed'] == 10
+    assert running == pytest.approx(recomputed)
+
+def test_cache_miss_measures_from_the_last_stored_fix(api, client, auth_headers, trips):
+    client.post('/api/gps/track/batch', headers=auth_headers(),
+                json={'trip_id': 'mine', 'points': [point(i) for i in range(5)]})
+    # The next batch reaches a worker that never saw the previous fixes
+    api.gps_service.last_locations.delete('user-1')
+    client.post('/api/gps/track/batch', headers=auth_headers(),
+                json={'trip_id': 'mine', 'points': [point(i) for i in range(5, 10)]})
+    running = client.get('/api/gps/analytics?trip_id=mine', headers=auth_headers()).get_json()
+    recomputed = client.get('/api/gps/analytics?trip_id=mine&recompute=true', headers=auth_headers()).get_json()
+    assert running['points_analyzed'] == 10
+    assert running['total_distance'] == pytest.approx(recomputed['total_distance'])
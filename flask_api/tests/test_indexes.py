@@ -0,0 +1,64 @@
+"""Declared indexes against the query shapes DatabaseService sends"""
+
+import pytest
+
+import indexes
+from indexes import check_shape, ensure_indexes, verify_indexes
+
+def test_every_query_shape_fits_its_index(db_service):
+    for shape in db_service.query_shapes():
+        assert check_shape(shape) == [], shape
+
+def test_shapes_come_from_the_query_builders(db_service):
+    filters = [shape['filter'] for shape in db_service.query_shapes()]
+    # Keyset page and time windows are $or queries, as sent
+    assert any('$or' in f and 'user_id' in f and len(f['$or']) == 2 for f in filters)
+    assert any('$or' in f and len(f['$or']) == 3 for f in filters)
+
+@pytest.mark.parametrize('shape', [
+    # Sort against the index order on one key but not the other
+    {'collection': 'trips', 'filter': {'user_id': 'u'}, 'sort': [('start_time', -1), ('id', 1)],
+     'index': 'user_id_start_time_id'},
+    # Equality field that is not an index key
+    {'collection': 'trips', 'filter': {'user_id': 'u', 'status': 'active'}, 'index': 'user_id_start_time_id'},
+    # Leading key unconstrained
+    {'collection': 'trips', 'filter': {'id': {'$lt': 'x'}}, 'index': 'user_id_start_time_id'},
+    # One $or branch does not fit
+    {'collection': 'locations', 'filter': {'$or': [{'timestamp': {'$gt': 1}}, {'speed': 0}]}, 'index': 'timestamp'}
+])
+def test_check_shape_reports_misfits(shape):
+    assert check_shape(shape)
+
+def test_unexplainable_backend_is_not_verified(db_service):
+    ensure_indexes(db_service.db)
+    result = db_service.verify_indexes()
+    assert result['missing'] == []
+    assert result['verified'] is False
+    assert result['ok'] is False
+
+def test_missing_indexes_are_reported(db_service):
+    result = db_service.verify_indexes()
+    assert 'trips.user_id_start_time_id' in result['missing']
+
+def fake_explain(stage_for):
+    def explain(db, query):
+        stage = stage_for(query)
+        return {'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': stage}}}
+    return explain
+
+def test_index_scans_verify(db_service, monkeypatch):
+    ensure_indexes(db_service.db)
+    monkeypatch.setattr(indexes, '_explain', fake_explain(
+        lambda query: {'stage': 'IXSCAN', 'indexName': query['index']}
+    ))
+    result = verify_indexes(db_service.db, db_service.query_shapes())
+    assert result['ok'] and result['verified']
+
+def test_collection_scan_or_memory_sort_fails(db_service, monkeypatch):
+    ensure_indexes(db_service.db)
+    monkeypatch.setattr(indexes, '_explain', fake_explain(
+        lambda query: {'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'}}
+    ))
+    result = verify_indexes(db_service.db, db_service.query_shapes())
+    assert not result['ok']
+    assert all(plan['planned'] is False for plan in result['plans'])
@@ -0,0 +1,129 @@
+"""Mode and purpose lookup tables against the rules they were built from"""
+
+import math
+
+import numpy as np
+import pytest
+
+from ml_service import MLService
+
+def rule_mode(speed, stop_frequency):
+    """The per-request mode rules the classifier table replaced"""
+    if speed < 5:
+        probabilities = {'walk': 0.8, 'bicycle': 0.1, 'car': 0.1}
+    elif speed < 15:
+        probabilities = {'bicycle': 0.6, 'walk': 0.2, 'auto': 0.2}
+    elif speed < 40:
+        probabilities = {'auto': 0.4, 'car': 0.3, 'bus': 0.3}
+    elif speed < 80:
+        probabilities = {'car': 0.5, 'bus': 0.3, 'train': 0.2}
+    else:
+        probabilities = {'train': 0.6, 'car': 0.3, 'airplane': 0.1}
+    if stop_frequency > 5:
+        probabilities['bus'] = probabilities.get('bus', 0) + 0.2
+        probabilities['auto'] = probabilities.get('auto', 0) + 0.1
+    total = sum(probabilities.values())
+    probabilities = {k: v / total for k, v in probabilities.items()}
+    mode = max(probabilities, key=probabilities.get)
+    if 'boat' not in probabilities:
+        probabilities['boat'] = 0.0
+    return mode, probabilities
+
+def rule_purpose(time, day_of_week):
+    """The per-request purpose rules the predictor table replaced"""
+    if 6 <= time <= 10:
+        probabilities = {'work': 0.4, 'education': 0.3, 'business': 0.2, 'other': 0.1}
+    elif 10 <= time <= 12:
+        probabilities = {'shopping': 0.3, 'business': 0.3, 'healthcare': 0.2, 'other': 0.2}
+    elif 12 <= time <= 14:
+        probabilities = {'home': 0.3, 'leisure': 0.3, 'social': 0.2, 'other': 0.2}
+    elif 14 <= time <= 17:
+        probabilities = {'business': 0.3, 'shopping': 0.2, 'education': 0.2, 'other': 0.3}
+    elif 17 <= time <= 20:
+        probabilities = {'home': 0.5, 'leisure': 0.2, 'shopping': 0.2, 'other': 0.1}
+    else:
+        probabilities = {'home': 0.4, 'leisure': 0.3, 'social': 0.2, 'other': 0.1}
+    if day_of_week >= 5:
+        probabilities['leisure'] = probabilities.get('leisure', 0) + 0.2
+        probabilities['tourism'] = probabilities.get('tourism', 0) + 0.15
+        probabilities['religious'] = probabilities.get('religious', 0) + 0.1
+        probabilities['work'] = probabilities.get('work', 0) * 0.3
+        probabilities['education'] = probabilities.get('education', 0) * 0.1
+    if day_of_week == 4:
+        probabilities['religious'] = probabilities.get('religious', 0) + 0.1
+    total = sum(probabilities.values())
+    probabilities = {k: v / total for k, v in probabilities.items()}
+    return max(probabilities, key=probabilities.get), probabilities
+
+SPEEDS = [0, 4.99, 5, 10, 14.9, 15, 39.9, 40, 60, 79.99, 80, 150]
+TIMES = [h / 4 for h in range(-4, 26 * 4)] + [9.5, 10.5, 12.25, 20.01, 5.999]
+DAYS = [-1, 0, 1, 3, 4, 4.5, 5, 6, 7, 9]
+
+@pytest.fixture(scope='module')
+def ml():
+    return MLService()
+
+def assert_same_map(actual, expected):
+    assert list(actual) == list(expected)
+    assert list(actual.values()) == pytest.approx(list(expected.values()))
+
+@pytest.mark.parametrize('stop_frequency', [0, 5, 6])
+def test_mode_table_matches_rules(ml, stop_frequency):
+    for speed in SPEEDS:
+        result = ml.classify_transport_mode({'speed': speed, 'stop_frequency': stop_frequency})
+        mode, probabilities = rule_mode(speed, stop_frequency)
+        assert result['mode'] == mode, speed
+        assert result['confidence'] == pytest.approx(probabilities[mode])
+        assert_same_map(result['probabilities'], probabilities)
+
+@pytest.mark.parametrize('day', DAYS)
+def test_purpose_table_matches_rules(ml, day):
+    for time in TIMES:
+        result = ml.predict_trip_purpose({'time': time, 'day_of_week': day})
+        purpose, probabilities = rule_purpose(time, day)
+        assert result['purpose'] == purpose, (time, day)
+        assert result['confidence'] == pytest.approx(probabilities[purpose])
+        assert_same_map(result['probabilities'], probabilities)
+
+def test_fractional_hours_keep_rule_boundaries(ml):
+    # 10:30 is past the inclusive 6-10 window
+    assert ml.predict_trip_purpose({'time': 10.5, 'day_of_week': 0})['purpose'] == 'shopping'
+    assert ml.predict_trip_purpose({'time': 10, 'day_of_week': 0})['purpose'] == 'work'
+    assert ml.predict_trip_purpose({'time': 5.5, 'day_of_week': 0})['purpose'] == 'home'
+
+def test_weekend_keeps_zero_weight_purposes(ml):
+    result = ml.predict_trip_purpose({'time': 21, 'day_of_week': 6})
+    assert result['probabilities']['work'] == 0
+    assert result['probabilities']['education'] == 0
+
+def test_batch_matches_single(ml):
+    times, days = np.meshgrid(TIMES, DAYS)
+    times, days = times.ravel(), days.ravel()
+    batch = ml.predict_trip_purpose_batch(times, days)
+    purposes = batch['purposes']
+    for i, (time, day) in enumerate(zip(times.tolist(), days.tolist())):
+        purpose, probabilities = rule_purpose(time, day)
+        assert purposes[batch['best'][i]] == purpose, (time, day)
+        expected = [probabilities.get(p, 0) for p in purposes]
+        assert batch['probabilities'][i].tolist() == pytest.approx(expected)
+
+def test_batch_rejects_missing_dates(ml):
+    with pytest.raises(ValueError):
+        ml.predict_trip_purpose_batch([8, 9], dates=['2024-01-15', None])
+    with pytest.raises(ValueError):
+        ml.predict_trip_purpose_batch([8, 9], [0, 1], dates=[None, None])
+
+def test_batch_days_from_dates(ml):
+    # 2024-01-19 was a Friday, 2024-01-20 a Saturday
+    from_dates = ml.predict_trip_purpose_batch([8, 8], dates=['2024-01-19', '2024-01-20'])
+    from_days = ml.predict_trip_purpose_batch([8, 8], [4, 5])
+    assert from_dates['best'].tolist() == from_days['best'].tolist()
+
+def test_batch_endpoint_rejects_missing_dates(api, client, auth_headers):
+    response = client.post('/api/ml/predict-purpose/batch', headers=auth_headers(),
+                           json={'time': [8, 9], 'date': ['2024-01-15', None]})
+    assert response.status_code == 400
+
+def test_nan_time_uses_the_fallback_bucket(ml):
+    batch = ml.predict_trip_purpose_batch([math.nan], [0])
+    assert batch['purposes'][batch['best'][0]] == 'home'
@@ -0,0 +1,144 @@
+"""Parquet datasets partitioned by district and date, read back with pyarrow"""
+
+import io
+import os
+import time
+import zipfile
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
+
+from exports import LOCATION_PARQUET_COLUMNS, PARTITION_COLUMNS, TRIP_PARQUET_COLUMNS, write_parquet
+from poi_index import POIIndex
+
+DISTRICTS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              'data', 'districts.json')
+ERNAKULAM = {'lat': 9.98, 'lng': 76.30}
+THRISSUR = {'lat': 10.52, 'lng': 76.21}
+PARTITIONING = ds.partitioning(pa.schema([pa.field(name, pa.string()) for name in PARTITION_COLUMNS]),
+                               flavor='hive')
+
+def trips(user_id='user-1'):
+    result = []
+    for i in range(12):
+        start = ERNAKULAM if i % 2 else THRISSUR
+        result.append({'id': f'{user_id}-trip-{i:02d}', 'user_id': user_id,
+                       'start_time': f'2025-01-0{1 + i % 3}T08:{i:02d}:00', 'end_time': f'2025-01-0{1 + i % 3}T09:00:00',
+                       'status': 'completed', 'mode': ('bus', 'car', 'walk')[i % 3], 'purpose': ('work', 'shopping')[i % 2],
+                       'distance': float(i), 'duration': 30, 'start_location': start, 'end_location': start,
+                       'companions': ['friend'] if i == 0 else None})
+    # Far from every district HQ, and without coordinates
+    result.append({'id': f'{user_id}-trip-far', 'user_id': user_id, 'start_time': '2025-01-01T10:00:00',
+                   'mode': 'car', 'purpose': 'leisure', 'start_location': {'lat': 20.0, 'lng': 80.0}})
+    result.append({'id': f'{user_id}-trip-none', 'user_id': user_id, 'start_time': '2025-01-01T11:00:00',
+                   'mode': 'car', 'purpose': 'leisure'})
+    return result
+
+def fixes(count, user_id='user-1'):
+    return [{'user_id': user_id, 'trip_id': f'{user_id}-trip-00', 'timestamp': 1735718400 + i * 60,  # 2025-01-01
+             'lat': ERNAKULAM['lat'] + i * 1e-5, 'lng': ERNAKULAM['lng'], 'altitude': 5, 'speed': 10,
+             'accuracy': 5, 'heading': 90} for i in range(count)]
+
+def read(path):
+    return ds.dataset(str(path), format='parquet', partitioning=PARTITIONING)
+
+@pytest.fixture(scope='module')
+def district_index():
+    return POIIndex.from_file(DISTRICTS_FILE)
+
+def test_round_trip(tmp_path, district_index):
+    result = write_parquet(str(tmp_path), trips(), fixes(500), district_index, chunk_size=64, row_group_size=100)
+    assert result['rows'] == {'trips': 14, 'locations': 500}
+
+    trip_data = read(tmp_path / 'trips')
+    assert trip_data.schema.names == [name for name, _ in TRIP_PARQUET_COLUMNS] + list(PARTITION_COLUMNS)
+    for name in ('status', 'mode', 'purpose'):
+        assert trip_data.schema.field(name).type == pa.dictionary(pa.int32(), pa.string())
+    assert trip_data.schema.field('start_time').type == pa.timestamp('ms')
+    assert trip_data.schema.field('companions').type == pa.list_(pa.string())
+
+    table = trip_data.to_table()
+    assert table.num_rows == 14
+    assert sorted(table.column('id').to_pylist()) == sorted(t['id'] for t in trips())
+    by_id = {row['id']: row for row in table.to_pylist()}
+    assert by_id['user-1-trip-01']['district'] == 'Ernakulam'
+    assert by_id['user-1-trip-00']['district'] == 'Thrissur'
+    assert by_id['user-1-trip-00']['companions'] == ['friend']
+    assert by_id['user-1-trip-far']['district'] == 'other'
+    assert by_id['user-1-trip-none']['district'] == 'unknown'
+    assert by_id['user-1-trip-04']['date'] == '2025-01-02'
+    assert set(table.column('mode').unique().to_pylist()) == {'bus', 'car', 'walk'}
+
+    # Hive directories match the partition values of their rows
+    for fragment in trip_data.get_fragments():
+        district, date = (part.split('=', 1)[1] for part in fragment.path.split(os.sep)[-3:-1])
+        rows = fragment.to_table(schema=trip_data.schema)
+        assert set(rows.column('district').to_pylist()) == {district}
+        assert set(rows.column('date').to_pylist()) == {date}
+
+    location_data = read(tmp_path / 'locations')
+    assert location_data.schema.names == [name for name, _ in LOCATION_PARQUET_COLUMNS] + list(PARTITION_COLUMNS)
+    assert location_data.count_rows() == 500
+    assert location_data.count_rows(filter=ds.field('district') == 'Ernakulam') == 500
+    row_groups = [group.num_rows for fragment in location_data.get_fragments()
+                  for group in fragment.row_groups]
+    assert sum(row_groups) == 500
+    assert len(row_groups) > 1 and max(row_groups) <= 100
+
+def test_district_filter(tmp_path, district_index):
+    result = write_parquet(str(tmp_path), trips(), fixes(10), district_index, ['Ernakulam'])
+    assert result['rows'] == {'trips': 6, 'locations': 10}
+    assert set(read(tmp_path / 'trips').to_table().column('district').to_pylist()) == {'Ernakulam'}
+
+def test_unknown_districts_are_rejected(tmp_path, district_index):
+    with pytest.raises(ValueError, match='Atlantis'):
+        write_parquet(str(tmp_path), trips(), fixes(10), district_index, ['Ernakulam', 'Atlantis'])
+    assert not os.listdir(tmp_path)
+
+@pytest.fixture
+def stored(api, mongo_db, district_index, monkeypatch):
+    monkeypatch.setattr(api.analytics_service, 'district_index', district_index)
+    mongo_db.trips.insert_many(trips() + trips('user-2'))
+    mongo_db.locations.insert_many(fixes(50) + fixes(20, 'user-2'))
+    return mongo_db
+
+def unzip(data, path):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        archive.extractall(path)
+    return read(path / 'trips'), read(path / 'locations')
+
+def test_export_endpoint_zips_the_users_datasets(client, auth_headers, stored, tmp_path):
+    response = client.get('/api/analytics/export?format=parquet', headers=auth_headers())
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    trip_data, location_data = unzip(response.data, tmp_path)
+    assert trip_data.count_rows() == 14
+    assert location_data.count_rows() == 50
+    assert set(trip_data.to_table().column('user_id').to_pylist()) == {'user-1'}
+    assert set(location_data.to_table().column('user_id').to_pylist()) == {'user-1'}
+
+@pytest.mark.parametrize('query', ['districts=Atlantis', 'start=yesterday'])
+def test_export_endpoint_rejects_bad_parameters(client, auth_headers, stored, query):
+    response = client.get(f'/api/analytics/export?format=parquet&{query}', headers=auth_headers())
+    assert response.status_code == 400
+
+def test_parquet_job(client, auth_headers, stored, tmp_path):
+    headers = auth_headers()
+    response = client.post('/api/analytics/export/jobs', headers=headers,
+                           json={'format': 'parquet', 'districts': ['Thrissur']})
+    assert response.status_code == 202
+    status_url = response.get_json()['status_url']
+    for _ in range(500):
+        job = client.get(status_url, headers=headers).get_json()
+        if job['status'] in ('done', 'failed'):
+            break
+        time.sleep(0.01)
+    assert job['status'] == 'done'
+    with zipfile.ZipFile(io.BytesIO(client.get(job['download_url'], headers=headers).data)) as archive:
+        # Every fix is in Ernakulam, so only trips have files
+        assert all(name.startswith('trips/district=Thrissur/') for name in archive.namelist())
+        archive.extractall(tmp_path)
+    trip_data = read(tmp_path / 'trips')
+    assert trip_data.count_rows() == 6
+    assert set(trip_data.to_table().column('user_id').to_pylist()) == {'user-1'}
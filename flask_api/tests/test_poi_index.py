@@ -0,0 +1,70 @@
+"""KD-tree POI search against brute-force haversine"""
+
+import numpy as np
+import pytest
+
+from poi_index import POIIndex
+from services import haversine_array
+
+@pytest.fixture(scope='module')
+def spots():
+    rng = np.random.default_rng(7)
+    lats = rng.uniform(8.0, 12.8, 5000)
+    lngs = rng.uniform(74.8, 77.4, 5000)
+    return [{'name': f'spot-{i}', 'type': ('beach', 'temple', 'park')[i % 3], 'lat': lat, 'lng': lng}
+            for i, (lat, lng) in enumerate(zip(lats.tolist(), lngs.tolist()))]
+
+@pytest.fixture(scope='module')
+def index(spots):
+    return POIIndex(spots)
+
+def queries(count=50):
+    rng = np.random.default_rng(11)
+    return list(zip(rng.uniform(8.0, 12.8, count).tolist(), rng.uniform(74.8, 77.4, count).tolist()))
+
+def distances(spots, lat, lng):
+    return haversine_array(lat, lng, [s['lat'] for s in spots], [s['lng'] for s in spots])
+
+@pytest.mark.parametrize('radius', [2000, 15000, 60000])
+def test_within_matches_brute_force(spots, index, radius):
+    for lat, lng in queries():
+        d = distances(spots, lat, lng)
+        expected = {spots[i]['name'] for i in np.flatnonzero(d <= radius * (1 - 1e-9))}
+        found = index.within(lat, lng, radius)
+        names = {s['name'] for s in found}
+        # Only spots within rounding of the boundary may differ
+        assert expected <= names
+        assert all(d[int(name.split('-')[1])] <= radius * (1 + 1e-9) for name in names)
+        assert [s['distance'] for s in found] == sorted(s['distance'] for s in found)
+
+def test_within_filters_type_and_limits(spots, index):
+    for lat, lng in queries(10):
+        d = distances(spots, lat, lng)
+        beaches = [i for i in np.argsort(d, kind='stable') if d[i] <= 30000 and spots[i]['type'] == 'beach']
+        found = index.within(lat, lng, 30000, 'beach', limit=5)
+        assert [s['name'] for s in found] == [spots[i]['name'] for i in beaches[:5]]
+
+@pytest.mark.parametrize('k,spot_type', [(1, None), (10, None), (10, 'temple')])
+def test_nearest_matches_brute_force(spots, index, k, spot_type):
+    for lat, lng in queries():
+        d = distances(spots, lat, lng)
+        candidates = [i for i in np.argsort(d, kind='stable') if spot_type in (None, spots[i]['type'])]
+        found = index.nearest(lat, lng, k, spot_type=spot_type)
+        assert [s['name'] for s in found] == [spots[i]['name'] for i in candidates[:k]]
+        assert [s['distance'] for s in found] == pytest.approx([round(d[i] / 1000, 2) for i in candidates[:k]])
+
+def test_nearest_within_max_distance(spots, index):
+    for lat, lng in queries(10):
+        d = distances(spots, lat, lng)
+        expected = [spots[i]['name'] for i in np.argsort(d, kind='stable')[:20] if d[i] <= 5000]
+        assert [s['name'] for s in index.nearest(lat, lng, 20, max_distance=5000)] == expected
+
+@pytest.mark.parametrize('query', ['limit=0', 'limit=101', 'k=0', 'k=1000'])
+def test_tourism_endpoint_rejects_bad_counts(client, query):
+    response = client.get(f'/api/kerala/tourism?lat=10.0&lng=76.3&{query}')
+    assert response.status_code == 400
+
+def test_tourism_endpoint_accepts_counts_in_range(client):
+    response = client.get('/api/kerala/tourism?lat=10.0&lng=76.3&radius=500&limit=3')
+    assert response.status_code == 200
+    assert len(response.get_json()['spots']) <= 3
@@ -0,0 +1,85 @@
+"""Road graph edge costs with and without hour-of-week speed profiles"""
+
+import numpy as np
+import pytest
+
+from routing import RoadGraph, SCENIC, TOLL, TRAFFIC_HOURS_CACHED
+from speed_profiles import HOURS_PER_WEEK, SpeedProfileBuilder
+
+def grid_graph(size=6):
+    """Two-way grid of junctions 0.01 degrees apart, every third edge tolled or scenic"""
+    rows, cols = np.divmod(np.arange(size * size), size)
+    lat, lng = 10.0 + rows * 0.01, 76.0 + cols * 0.01
+    src, dst = [], []
+    for v in range(size * size):
+        r, c = divmod(v, size)
+        for u in ([v + 1] if c + 1 < size else []) + ([v + size] if r + 1 < size else []):
+            src += [v, u]
+            dst += [u, v]
+    edges = len(src)
+    flags = np.where(np.arange(edges) % 3 == 0, TOLL, np.where(np.arange(edges) % 3 == 1, SCENIC, 0))
+    return RoadGraph.from_edges(lat, lng, src, dst, np.full(edges, 40.0), flags=flags,
+                                congestion=np.linspace(1.0, 1.5, edges), landmarks=2, contract=False)
+
+@pytest.fixture
+def graph():
+    graph = grid_graph()
+    # Slow traffic at 8:00 and 9:00 on Monday over the west half of the grid
+    rng = np.random.default_rng(1)
+    lats, lngs = 10.0 + rng.random(4000) * 0.05, 76.0 + rng.random(4000) * 0.025
+    builder = SpeedProfileBuilder(cell_size=0.005, min_samples=3)
+    builder.add(lats, lngs, np.full(4000, 10.0), np.where(np.arange(4000) % 2, 8, 9))
+    graph.attach_profiles(builder.build())
+    return graph
+
+def reference_weights(graph, metric, avoid_tolls, avoid_traffic, scenic, hour):
+    """The float64 costs as computed before caching by preference and hour"""
+    weights = np.array(graph.time if metric == 'time' else graph.length, dtype=np.float64)
+    if avoid_tolls:
+        weights[(graph.flags & TOLL) > 0] *= graph.meta['toll_penalty']
+    if avoid_traffic:
+        weights *= graph.congestion_factors(hour)
+    if scenic:
+        weights[(graph.flags & SCENIC) > 0] *= graph.meta['scenic_factor']
+    return weights
+
+@pytest.mark.parametrize('hour', [None, 8, 9, 20])
+@pytest.mark.parametrize('avoid_traffic', [False, True])
+def test_weights_match_float64_costs(graph, avoid_traffic, hour):
+    for metric in ('time', 'length'):
+        for avoid_tolls in (False, True):
+            for scenic in (False, True):
+                weights = graph.weights(metric, avoid_tolls, avoid_traffic, scenic, hour)
+                assert weights.dtype == np.float32
+                expected = reference_weights(graph, metric, avoid_tolls, avoid_traffic, scenic,
+                                             hour if avoid_traffic else None)
+                np.testing.assert_allclose(weights, expected, rtol=1e-6)
+
+def test_profiles_slow_the_observed_hours(graph):
+    assert (graph.weights(avoid_traffic=True, hour=8) > graph.weights(avoid_traffic=True, hour=20)).any()
+
+def test_caches_stay_bounded(graph):
+    for hour in range(HOURS_PER_WEEK + 5):
+        graph.weights(avoid_traffic=True, hour=hour)
+    assert len(graph._hour_factors) == TRAFFIC_HOURS_CACHED
+    assert len(graph._weights) == 1
+    # Hours wrap at the profile resolution
+    np.testing.assert_array_equal(graph.weights(avoid_traffic=True, hour=8 + HOURS_PER_WEEK),
+                                  graph.weights(avoid_traffic=True, hour=8))
+
+def test_cached_costs_are_read_only(graph):
+    weights = graph.weights('time', avoid_tolls=True)
+    with pytest.raises(ValueError):
+        weights[0] = 0
+    hourly = graph.weights(avoid_traffic=True, hour=8)
+    hourly[0] = 0  # per-request array
+    assert graph.weights(avoid_traffic=True, hour=8)[0] != 0
+
+def test_paths_match_float64_costs(graph):
+    source, target = 0, graph.node_count - 1
+    for hour in (8, 20):
+        weights = graph.weights('time', True, True, True, hour)
+        expected = reference_weights(graph, 'time', True, True, True, hour)
+        path = graph.shortest_path(source, target, weights)
+        best = graph.shortest_path(source, target, expected)
+        assert expected[path].sum() == pytest.approx(expected[best].sum())
@@ -0,0 +1,36 @@
+"""Glossary translation and the translate endpoints"""
+
+from translation import Translator
+
+GLOSSARY = {'ml': {'bus stop': 'ബസ് സ്റ്റോപ്പ്', 'bus': 'ബസ്', 'thank you': 'നന്ദി'}}
+
+def test_longest_phrase_wins():
+    translator = Translator(GLOSSARY)
+    assert translator.translate('Bus stop, thank you', 'ml') == 'ബസ് സ്റ്റോപ്പ്, നന്ദി'
+    assert translator.translate('bus, stop', 'ml') == 'ബസ്, stop'
+
+def test_unmatched_text_is_tagged_and_not_cached():
+    translator = Translator(GLOSSARY, cache_size=2)
+    assert translator.translate('bus', 'ml') == 'ബസ്'
+    for i in range(10):
+        assert translator.translate(f'random {i}', 'ml') == f'[ml] random {i}'
+    assert translator.stats()['cached'] == 1
+    translator.translate('bus', 'ml')
+    assert translator.hits == 1
+
+def test_translate_rejects_long_text(api, client):
+    text = 'x' * (api.app.config['TRANSLATE_MAX_TEXT_LENGTH'] + 1)
+    assert client.post('/api/kerala/translate', json={'text': text}).status_code == 400
+    response = client.post('/api/kerala/translate/batch', json={'texts': ['bus', text]})
+    assert response.status_code == 400
+
+def test_translate_does_not_touch_response_cache(api, client):
+    before = api.kerala_cache.stats()['entries']
+    response = client.post('/api/kerala/translate', json={'text': 'some new sentence', 'target': 'ml'})
+    assert response.status_code == 200
+    assert api.kerala_cache.stats()['entries'] == before
+
+def test_translate_batch_keeps_ids(client):
+    response = client.post('/api/kerala/translate/batch', json={'texts': {'a': 'hello', 'b': 'hello'}})
+    assert response.status_code == 200
+    assert set(response.get_json()['translations']) == {'a', 'b'}
@@ -0,0 +1,32 @@
+"""Per-user trip detection state"""
+
+import threading
+
+from trip_detection import TripDetectionEngine
+
+def test_trip_starts_and_ends_after_dwell():
+    engine = TripDetectionEngine(window_size=5, start_dwell=30, stop_dwell=60)
+    events = [engine.update('user-1', t, 30, 5)['event_type'] for t in range(0, 50, 10)]
+    assert events == ['idle', 'idle', 'idle', 'trip_start', 'trip_continue']
+    events = [engine.update('user-1', t, 0, 5)['event_type'] for t in range(50, 200, 10)]
+    assert 'trip_end' in events
+    assert not engine.update('user-1', 200, 0, 5)['trip_detected']
+
+def test_concurrent_fixes_of_one_user_are_all_applied():
+    threads, fixes = 8, 200
+    engine = TripDetectionEngine(window_size=threads * fixes)
+    start = threading.Barrier(threads)
+
+    def feed(offset):
+        start.wait()
+        for i in range(fixes):
+            engine.update('user-1', offset * fixes + i, 10, 5)
+
+    workers = [threading.Thread(target=feed, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    state = engine.states.get('user-1')
+    assert state.speeds.size == threads * fixes
+    assert len(engine) == 1
@@ -0,0 +1,93 @@
+"""Keyset pagination of a user's trips"""
+
+import json
+import base64
+
+import pytest
+
+from services import TRIP_LIST_FIELDS, decode_cursor, encode_cursor
+
+def trip(i, user_id='user-1', minute=None):
+    # Several trips share each start time, so the id breaks ties
+    minute = i // 3 if minute is None else minute
+    return {'id': f'trip-{i:03d}', 'user_id': user_id, 'start_time': f'2025-01-01T08:{minute:02d}:00',
+            'status': 'completed', 'mode': 'car', 'purpose': 'work', 'distance': float(i)}
+
+@pytest.fixture
+def trips(mongo_db):
+    mongo_db.trips.insert_many([trip(i) for i in range(40)] + [trip(i, 'user-2') for i in range(40, 50)])
+    return mongo_db
+
+def newest_first(docs):
+    return sorted(docs, key=lambda t: (t['start_time'], t['id']), reverse=True)
+
+def walk(db_service, limit, **options):
+    pages, cursor = [], None
+    while True:
+        page, cursor = db_service.get_user_trips_page('user-1', limit, cursor, **options)
+        pages.append(page)
+        if cursor is None:
+            return pages
+
+def test_cursor_round_trip():
+    cursor = encode_cursor({'start_time': '2025-01-01T08:00:00', 'id': 'trip-007'})
+    assert decode_cursor(cursor) == ('2025-01-01T08:00:00', 'trip-007')
+    assert '=' not in cursor
+
+@pytest.mark.parametrize('cursor', ['not-a-cursor', '', 'e30', encode_cursor({})[:-2] + '!!'])
+def test_foreign_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+@pytest.mark.parametrize('limit', [1, 3, 7, 40, 100])
+def test_pages_cover_every_trip_once_in_order(db_service, trips, limit):
+    pages = walk(db_service, limit)
+    ids = [t['id'] for page in pages for t in page]
+    assert ids == [t['id'] for t in newest_first(trips.trips.find({'user_id': 'user-1'}))]
+    assert all(len(page) == limit for page in pages[:-1])
+    assert 0 < len(pages[-1]) <= limit
+
+def test_inserts_do_not_shift_later_pages(db_service, trips):
+    first, cursor = db_service.get_user_trips_page('user-1', 10)
+    # A newer trip and one tied with the last trip served, before the cursor
+    trips.trips.insert_many([trip(100, minute=59), dict(trip(200, minute=10), id='trip-999')])
+    rest, _ = db_service.get_user_trips_page('user-1', 100, cursor)
+    expected = newest_first(trips.trips.find({'user_id': 'user-1'}))
+    after = [t['id'] for t in expected][[t['id'] for t in expected].index(first[-1]['id']) + 1:]
+    assert [t['id'] for t in rest] == after
+
+def test_pages_project_list_fields(db_service, trips):
+    page, _ = db_service.get_user_trips_page('user-1', 5)
+    assert all(set(t) <= set(TRIP_LIST_FIELDS) for t in page)
+
+def test_trips_endpoint_follows_cursors(client, auth_headers, trips):
+    ids, cursor = [], None
+    while True:
+        query = f'?limit=15&cursor={cursor}' if cursor else '?limit=15'
+        body = client.get(f'/api/trips{query}', headers=auth_headers()).get_json()
+        ids += [t['id'] for t in body['trips']]
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    assert len(ids) == len(set(ids)) == 40
+
+def raw_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+TAMPERED = [raw_cursor([{'$ne': None}, 'x']), raw_cursor(['2025-01-01T08:00:00', {'$gt': ''}]),
+            raw_cursor([True, 'x']), raw_cursor([None, 'x']), raw_cursor(['2025-01-01T08:00:00', 7])]
+
+@pytest.mark.parametrize('cursor', TAMPERED)
+def test_tampered_cursors_are_rejected(client, auth_headers, trips, cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+    assert client.get(f'/api/trips?cursor={cursor}', headers=auth_headers()).status_code == 400
+
+@pytest.mark.parametrize('query', ['?cursor=garbage', '?limit=0', '?limit=1000'])
+def test_trips_endpoint_rejects_bad_input(client, auth_headers, trips, query):
+    assert client.get(f'/api/trips{query}', headers=auth_headers()).status_code == 400
+
+def test_legacy_pages_still_work(client, auth_headers, trips):
+    body = client.get('/api/trips?page=2&limit=10', headers=auth_headers()).get_json()
+    assert len(body['trips']) == 10
+    assert body['page'] == 2
@@ -0,0 +1,138 @@
+"""
+Translation Module
+Glossary-based phrase translation with longest-match substitution
+"""
+
+import re
+import json
+import logging
+import unicodedata
+from typing import Dict, List, Any, Optional, Tuple
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Words are runs of anything but whitespace and sentence punctuation; matching
+# on \w would split Malayalam words at their vowel signs
+WORD = re.compile(r'[^\s.,!?;:()"\[\]{}]+')
+SPACE = re.compile(r'\s+')
+END = ''  # trie key marking the end of a phrase
+
+def _normalize(word: str) -> str:
+    return unicodedata.normalize('NFC', word).casefold()
+
+class PhraseTrie:
+    """Word-level trie of glossary phrases"""
+
+    def __init__(self, phrases: Dict[str, str]):
+        self.root: Dict[str, Any] = {}
+        self.size = 0
+        for phrase, translation in phrases.items():
+            words = [_normalize(w) for w in WORD.findall(phrase)]
+            if not words:
+                continue
+            node = self.root
+            for word in words:
+                node = node.setdefault(word, {})
+            if END not in node:
+                self.size += 1
+            node[END] = translation
+
+    def __len__(self) -> int:
+        return self.size
+
+    def longest_match(self, words: List[str], start: int, stop: int) -> Tuple[int, Optional[str]]:
+        """End index and translation of the longest phrase in words[start:stop]"""
+        node = self.root
+        end, translation = start, None
+        for i in range(start, stop):
+            node = node.get(words[i])
+            if node is None:
+                break
+            if END in node:
+                end, translation = i + 1, node[END]
+        return end, translation
+
+class Translator:
+    """Phrase glossaries per target language, loaded once
+
+    Sentences are translated by replacing the longest glossary phrase at each
+    word, left to right; phrases never span punctuation. Unmatched words are
+    kept as written. Results that use the glossary are memoized in an LRU;
+    text without any glossary phrase is not, so arbitrary client strings
+    cannot evict the useful entries.
+    """
+
+    def __init__(self, glossaries: Dict[str, Dict[str, str]], cache_size: int = 10000):
+        self.tries = {lang: PhraseTrie(phrases) for lang, phrases in glossaries.items()}
+        self._cache = TTLCache(max_size=cache_size, ttl=float('inf'))
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_file(cls, path: str, cache_size: int = 10000) -> 'Translator':
+        """Load a JSON object of {target_lang: {phrase: translation}}"""
+        with open(path, encoding='utf-8') as f:
+            glossaries = json.load(f)
+        translator = cls(glossaries, cache_size)
+        logger.info("Loaded glossary phrases: " + ', '.join(
+            f"{lang}={len(trie)}" for lang, trie in translator.tries.items()
+        ))
+        return translator
+
+    def languages(self) -> List[str]:
+        return list(self.tries)
+
+    def translate(self, text: str, target_lang: str) -> str:
+        """Translate text, falling back to a tagged copy when no phrase matches"""
+        key = (target_lang, text)
+        translated = self._cache.get(key)
+        if translated is not None:
+            self.hits += 1
+            return translated
+        self.misses += 1
+        translated, matched = self._translate(text, target_lang)
+        if matched:
+            self._cache.set(key, translated)
+        return translated
+
+    def translate_many(self, texts: List[str], target_lang: str) -> List[str]:
+        """Translate many strings; repeats are served from the LRU"""
+        return [self.translate(text, target_lang) for text in texts]
+
+    def _translate(self, text: str, target_lang: str) -> Tuple[str, bool]:
+        """Translated text and whether any glossary phrase matched"""
+        placeholder = f"[{target_lang}] {text}"
+        trie = self.tries.get(target_lang)
+        spans = [m.span() for m in WORD.finditer(text)] if trie else []
+        if not spans:
+            return placeholder, False
+
+        words = [_normalize(text[a:b]) for a, b in spans]
+        # Phrases may only continue across plain whitespace
+        breaks = [i + 1 for i in range(len(spans) - 1)
+                  if not SPACE.fullmatch(text[spans[i][1]:spans[i + 1][0]])]
+        breaks.append(len(spans))
+
+        parts, pos, matched, i = [], 0, False, 0
+        for stop in breaks:
+            while i < stop:
+                end, translation = trie.longest_match(words, i, stop)
+                if translation is None:
+                    i += 1
+                    continue
+                parts.append(text[pos:spans[i][0]])
+                parts.append(translation)
+                pos, matched, i = spans[end - 1][1], True, end
+        parts.append(text[pos:])
+
+        return (''.join(parts), True) if matched else (placeholder, False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'phrases': {lang: len(trie) for lang, trie in self.tries.items()},
+            'cached': len(self._cache),
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
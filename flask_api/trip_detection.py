@@ -0,0 +1,160 @@
+"""
+Trip Detection Module
+Per-user trip state machine over sliding windows of recent fixes
+"""
+
+import logging
+import threading
+from array import array
+from typing import Dict, Any, Optional
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Locks shared by hash of user ID, so lock memory does not grow with users
+LOCK_STRIPES = 64
+
+# =====================
+# Ring Buffer
+# =====================
+
+class RingBuffer:
+    """Fixed-capacity float ring buffer with a running sum"""
+
+    __slots__ = ('values', 'capacity', 'position', 'size', 'total')
+
+    def __init__(self, capacity: int):
+        self.values = array('d', bytes(8 * capacity))
+        self.capacity = capacity
+        self.position = 0
+        self.size = 0
+        self.total = 0.0
+
+    def push(self, value: float):
+        """Append a value, overwriting the oldest once full"""
+        if self.size == self.capacity:
+            self.total -= self.values[self.position]
+        else:
+            self.size += 1
+        self.values[self.position] = value
+        self.total += value
+        self.position = (self.position + 1) % self.capacity
+
+    def mean(self) -> float:
+        return self.total / self.size if self.size else 0.0
+
+# =====================
+# Trip Detection Engine
+# =====================
+
+class UserTripState:
+    """Sliding windows and trip state for one user"""
+
+    __slots__ = ('speeds', 'moving', 'accelerations', 'in_trip', 'pending_since')
+
+    def __init__(self, window_size: int):
+        self.speeds = RingBuffer(window_size)
+        self.moving = RingBuffer(window_size)  # 1.0 for fixes above the stop speed
+        self.accelerations = RingBuffer(window_size)
+        self.in_trip = False
+        self.pending_since: Optional[float] = None  # start of a pending state change
+
+class TripDetectionEngine:
+    """Trip start/continue/end detection keyed by user
+
+    A trip starts once the windowed mean speed stays at or above start_speed
+    for start_dwell seconds, and ends once it stays below stop_speed (with low
+    accelerometer activity, when reported) for stop_dwell seconds. The gap
+    between the two speeds is the hysteresis band. Users idle for longer than
+    idle_timeout are evicted and start again from the idle state.
+
+    State lives in this worker's memory, so each gunicorn worker tracks the
+    users whose fixes it receives; route a user's fixes to one worker (or run
+    one) for continuous detection. Within a worker, a user's fixes are
+    applied one at a time under a per-user lock.
+    """
+
+    def __init__(self, window_size: int = 30, start_speed: float = 6.0, stop_speed: float = 2.0,
+                 start_dwell: float = 30.0, stop_dwell: float = 120.0,
+                 min_accuracy: float = 20.0, accel_threshold: float = 0.5,
+                 idle_timeout: float = 1800.0, max_users: int = 100000):
+        self.window_size = window_size
+        self.start_speed = start_speed        # km/h
+        self.stop_speed = stop_speed          # km/h
+        self.start_dwell = start_dwell        # seconds
+        self.stop_dwell = stop_dwell          # seconds
+        self.min_accuracy = min_accuracy      # meters
+        self.accel_threshold = accel_threshold
+        self.states = TTLCache(max_size=max_users, ttl=idle_timeout)
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def update(self, user_id: str, t: float, speed: float, accuracy: float,
+               acceleration: Optional[float] = None) -> Dict[str, Any]:
+        """Feed one fix for a user and return the resulting event
+
+        Args:
+            t: Fix time in seconds
+            speed: km/h
+            accuracy: meters
+            acceleration: Accelerometer magnitude, if reported
+        """
+        with self._locks[hash(user_id) % LOCK_STRIPES]:
+            return self._update(user_id, t, speed, accuracy, acceleration)
+
+    def _update(self, user_id: str, t: float, speed: float, accuracy: float,
+                acceleration: Optional[float]) -> Dict[str, Any]:
+        """Read, advance and store a user's state; callers hold the user's lock"""
+        state = self.states.get(user_id)
+        if state is None:
+            state = UserTripState(self.window_size)
+
+        # Inaccurate fixes do not move the speed window
+        if accuracy < self.min_accuracy:
+            state.speeds.push(speed)
+            state.moving.push(1.0 if speed >= self.stop_speed else 0.0)
+        if acceleration is not None:
+            state.accelerations.push(acceleration)
+
+        mean_speed = state.speeds.mean()
+        if not state.in_trip:
+            event_type = self._advance(state, t, mean_speed >= self.start_speed,
+                                       self.start_dwell, 'trip_start', 'idle')
+        else:
+            stationary = mean_speed < self.stop_speed and (
+                not state.accelerations.size or state.accelerations.mean() < self.accel_threshold
+            )
+            event_type = self._advance(state, t, stationary,
+                                       self.stop_dwell, 'trip_end', 'trip_continue')
+
+        # Re-store to refresh the idle timeout
+        self.states.set(user_id, state)
+
+        moving_share = state.moving.mean()
+        return {
+            'trip_detected': state.in_trip,
+            'event_type': event_type,
+            'confidence': round(moving_share if state.in_trip else 1 - moving_share, 3),
+            'window_mean_speed': round(mean_speed, 2)
+        }
+
+    def _advance(self, state: UserTripState, t: float, condition: bool,
+                 dwell: float, change_event: str, steady_event: str) -> str:
+        """Flip the trip state once condition has held for dwell seconds"""
+        if not condition:
+            state.pending_since = None
+            return steady_event
+        if state.pending_since is None:
+            state.pending_since = t
+        if t - state.pending_since < dwell:
+            return steady_event
+        state.in_trip = not state.in_trip
+        state.pending_since = None
+        return change_event
+
+    def evict_idle(self) -> int:
+        """Drop users idle past the timeout, returning how many were evicted"""
+        return len(self.states.evict_expired())
+
+    def __len__(self) -> int:
+        return len(self.states)
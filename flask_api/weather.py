@@ -0,0 +1,197 @@
+"""
+Weather Module
+Pluggable weather providers behind a per-district cache with request
+coalescing and stale-while-revalidate
+"""
+
+import os
+import json
+import time
+import threading
+import importlib
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+import numpy as np
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# =====================
+# Providers
+# =====================
+
+class WeatherProvider:
+    """Source of current weather for a district
+
+    Subclasses implement fetch(); it may block on I/O and raise on failure.
+    """
+
+    name = 'base'
+
+    def fetch(self, district: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+class SimulatedWeatherProvider(WeatherProvider):
+    """Random plausible readings, for development without a feed"""
+
+    name = 'simulated'
+
+    def fetch(self, district: str) -> Dict[str, Any]:
+        return {
+            'district': district,
+            'temperature': 28 + int(np.random.randint(-5, 5)),
+            'humidity': 75 + int(np.random.randint(-10, 10)),
+            'conditions': str(np.random.choice(['sunny', 'cloudy', 'rainy'])),
+            'monsoon_active': datetime.now().month in [6, 7, 8, 9]
+        }
+
+class FileWeatherProvider(WeatherProvider):
+    """Readings from a JSON file of {district: {...}}, reloaded when it changes
+
+    Stand-in for a real feed in tests and offline deployments.
+    """
+
+    name = 'file'
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mtime = None
+        self._readings: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        mtime = os.path.getmtime(self.path)
+        if mtime != self._mtime:
+            with open(self.path) as f:
+                readings = json.load(f)
+            self._readings = {name.lower(): reading for name, reading in readings.items()}
+            self._mtime = mtime
+
+    def fetch(self, district: str) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+            reading = self._readings.get(district.lower())
+        if reading is None:
+            raise KeyError(f'no weather for district {district}')
+        return dict(reading, district=district)
+
+def create_weather_provider(spec: Optional[str] = None) -> WeatherProvider:
+    """Create a provider from a setting: 'simulated', 'file:///path/to/weather.json'
+    or 'package.module:ClassName' for a custom provider"""
+    if not spec or spec == 'simulated':
+        return SimulatedWeatherProvider()
+    if spec.startswith('file:///'):
+        path = spec[len('file:///'):]
+        logger.info(f"Using file weather provider at {path}")
+        return FileWeatherProvider(path)
+    module, _, cls = spec.partition(':')
+    logger.info(f"Using weather provider {spec}")
+    return getattr(importlib.import_module(module), cls)()
+
+# =====================
+# Weather Cache
+# =====================
+
+class _Flight:
+    """One in-progress upstream fetch, awaited by every coalesced caller"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class WeatherCache:
+    """Per-district weather cache in front of a provider
+
+    Readings are fresh for ttl seconds, then served stale for up to
+    stale_ttl more while a single background fetch refreshes them.
+    Concurrent misses for the same district share one upstream fetch, so a
+    burst of users in one district costs one provider call.
+    """
+
+    def __init__(self, provider: WeatherProvider, ttl: float = 600,
+                 stale_ttl: float = 3600, max_size: int = 256, timeout: float = 30):
+        self.provider = provider
+        self.ttl = ttl
+        self.timeout = timeout
+        self.readings = TTLCache(max_size=max_size, ttl=ttl + stale_ttl)  # key -> (fetched_at, reading)
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._counts = {'hits': 0, 'stale_hits': 0, 'misses': 0,
+                        'coalesced': 0, 'refreshes': 0, 'errors': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+    def get(self, district: str) -> Dict[str, Any]:
+        """Current weather for a district"""
+        key = district.strip().lower()
+        entry = self.readings.get(key)
+        if entry is not None:
+            fetched_at, reading = entry
+            if time.monotonic() - fetched_at < self.ttl:
+                self._count('hits')
+            else:
+                self._count('stale_hits')
+                self._refresh(key, district)
+            return dict(reading, district=district)
+
+        self._count('misses')
+        return dict(self._fetch(key, district), district=district)
+
+    def _fetch(self, key: str, district: str) -> Dict[str, Any]:
+        """Fetch on a miss, joining a fetch already in flight for the district"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._counts['coalesced'] += 1
+
+        if leader:
+            self._run(key, district, flight)
+        elif not flight.done.wait(self.timeout):
+            raise TimeoutError(f'weather fetch for {district} timed out')
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _refresh(self, key: str, district: str):
+        """Start a background fetch unless one is already in flight"""
+        with self._lock:
+            if key in self._flights:
+                return
+            flight = self._flights[key] = _Flight()
+            self._counts['refreshes'] += 1
+        threading.Thread(target=self._run, args=(key, district, flight), daemon=True).start()
+
+    def _run(self, key: str, district: str, flight: _Flight):
+        try:
+            flight.value = self.provider.fetch(district)
+            self.readings.set(key, (time.monotonic(), flight.value))
+        except Exception as e:
+            # A failed refresh keeps serving the stale reading until it expires
+            logger.error(f"Weather fetch error for {district}: {str(e)}")
+            flight.error = e
+            self._count('errors')
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Lookup counters and hit rate (fresh and stale hits over lookups)"""
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts['hits'] + counts['stale_hits'] + counts['misses']
+        return dict(
+            counts,
+            provider=self.provider.name,
+            entries=len(self.readings),
+            hit_rate=round((counts['hits'] + counts['stale_hits']) / lookups, 3) if lookups else 0.0
+        )